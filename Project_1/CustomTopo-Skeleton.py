@@ -47,17 +47,17 @@ def perfTest():
     topo = CustomTopo(linkopts1,linkopts2,linkopts3,fanout=3)
     net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink)
     net.start()
-    print "Dumping host connections"
+    print("Dumping host connections")
     dumpNodeConnections(net.hosts)
-    print "Testing network connectivity"
+    print("Testing network connectivity")
     net.pingAll()
-    print "Testing bandwidth between h1 and h2"
+    print("Testing bandwidth between h1 and h2")
     h1, h2 = net.get('h1', 'h2')
     net.iperf((h1, h2))
-    print "Testing bandwidth between h1 and h2"
+    print("Testing bandwidth between h1 and h2")
     h1, h4 = net.get('h1', 'h4')
     net.iperf((h1, h4))
-    print "Testing bandwidth between h1 and h6"
+    print("Testing bandwidth between h1 and h6")
     h1, h6 = net.get('h1', 'h6')
     net.iperf((h1, h6))
     net.stop()
@@ -0,0 +1,326 @@
+'''
+Concurrent performance test runner for CustomTopo.
+
+Instead of pingAll and a few sequential iperfs, the runner measures every pair of a traffic pattern:
+    all-pairs     every host to every other host
+    permutation   every host sends to exactly one other host and receives from exactly one, chosen at random
+    incast        every other host sends to one receiver at the same time
+
+The pairs are packed into rounds that run at the same time, with every host sending and receiving at most
+--max-per-host flows in a round, so the CPU limited hosts are not oversubscribed. Each pair runs an iperf
+(throughput) and a ping (RTT and loss, measured under the load of the round).
+
+The results are written as JSON (every pair plus the throughput, RTT and loss matrices) and, per metric, as a
+CSV matrix with the source hosts as rows and the destination hosts as columns. A saved JSON can be used as the
+baseline of a later run, which then fails if a pair got slower:
+    sudo python perf_runner.py --fanout 3 --pattern permutation -o run1
+    sudo python perf_runner.py --fanout 3 --pattern permutation -o run2 --baseline run1.json
+    python perf_runner.py --compare run2.json --baseline run1.json
+'''
+
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import sys
+import time
+
+try:
+    from mininet.net import Mininet
+    from mininet.node import CPULimitedHost
+    from mininet.link import TCLink
+    from mininet.log import setLogLevel
+except ImportError:
+    Mininet = None
+
+# Link options of perfTest in CustomTopo-Skeleton.py
+LINKOPTS = [
+    {'bw': 10, 'delay': '50ms', 'loss': 0.1, 'max_queue_size': 1000, 'use_htb': True},
+    {'bw': 100, 'delay': '10ms', 'loss': 0.1, 'max_queue_size': 1000, 'use_htb': True},
+    {'bw': 1000, 'delay': '1ms', 'loss': 0.1, 'max_queue_size': 1000, 'use_htb': True},
+]
+
+METRICS = ['throughput', 'rtt', 'loss']
+# First iperf port, the pairs of a round get consecutive ports
+IPERF_PORT = 5201
+
+PING_LOSS = re.compile(r'(\d+) packets transmitted, (\d+) (?:packets )?received')
+PING_RTT = re.compile(r'= [\d.]+/([\d.]+)/')
+
+
+def host_order(name):
+    """
+    Sort key of host names, h2 before h10.
+    """
+    return int(name[1:]) if name[1:].isdigit() else name
+
+
+def all_pairs(hosts):
+    """
+    Every ordered pair of hosts, ordered by the offset between source and destination so that the first
+    len(hosts) - 1 groups of len(hosts) pairs each use every host once as source and once as destination.
+    """
+    return [(hosts[i], hosts[(i + shift) % len(hosts)]) for shift in range(1, len(hosts)) for i in range(len(hosts))]
+
+
+def permutation(hosts, seed=None):
+    """
+    A random cyclic permutation: every host sends to one other host and receives from one other host.
+    """
+    order = list(hosts)
+    random.Random(seed).shuffle(order)
+    return [(order[i], order[(i + 1) % len(order)]) for i in range(len(order))] if len(order) > 1 else []
+
+
+def incast(hosts, receiver):
+    """
+    Every other host sends to the receiver.
+    """
+    if receiver not in hosts:
+        raise ValueError("Unknown incast receiver %s" % receiver)
+    return [(host, receiver) for host in hosts if host != receiver]
+
+
+def schedule(pairs, max_per_host=1):
+    """
+    Packs pairs into rounds, first fit, with every host the source and the destination of at most max_per_host
+    pairs of a round.
+    :return: list of rounds, a round being a list of pairs
+    """
+    rounds = [] # (pairs, sends per host, receives per host)
+    for src, dst in pairs:
+        for round_pairs, sends, receives in rounds:
+            if sends.get(src, 0) < max_per_host and receives.get(dst, 0) < max_per_host:
+                break
+        else:
+            round_pairs, sends, receives = [], {}, {}
+            rounds.append((round_pairs, sends, receives))
+        round_pairs.append((src, dst))
+        sends[src] = sends.get(src, 0) + 1
+        receives[dst] = receives.get(dst, 0) + 1
+    return [round_pairs for round_pairs, sends, receives in rounds]
+
+
+def parse_iperf(output):
+    """
+    Parses the CSV report (-y C) of an iperf client.
+    :return: throughput in Mbit/s, None if iperf failed
+    """
+    lines = [line for line in output.splitlines() if line.count(',') >= 8]
+    if not lines:
+        return None
+    return int(lines[-1].split(',')[8]) / 1e6
+
+
+def parse_ping(output):
+    """
+    Parses the summary of ping.
+    :return: (average RTT in ms or None if no reply came back, loss as a fraction)
+    """
+    match = PING_LOSS.search(output)
+    if match is None:
+        return None, 1.0
+    transmitted, received = int(match.group(1)), int(match.group(2))
+    rtt = PING_RTT.search(output)
+    return (float(rtt.group(1)) if rtt else None), (1 - float(received) / transmitted if transmitted else 1.0)
+
+
+def load_custom_topo():
+    """
+    Imports CustomTopo from CustomTopo-Skeleton.py, whose name is not a valid module name.
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'CustomTopo-Skeleton.py')
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source('custom_topo', path).CustomTopo
+    spec = importlib.util.spec_from_file_location('custom_topo', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.CustomTopo
+
+
+def run_round(net, pairs, duration, ping_count):
+    """
+    Runs the iperf and ping of every pair of a round at the same time.
+    :return: dict (src, dst) -> dict metric -> value
+    """
+    servers = []
+    for i, (src, dst) in enumerate(pairs):
+        servers.append(net.get(dst).popen(['iperf', '-s', '-p', str(IPERF_PORT + i)]))
+    # give the servers time to listen
+    time.sleep(0.5)
+    clients = []
+    for i, (src, dst) in enumerate(pairs):
+        source, destination = net.get(src), net.get(dst)
+        iperf = source.popen(['iperf', '-c', destination.IP(), '-p', str(IPERF_PORT + i), '-t', str(duration),
+                              '-y', 'C'])
+        ping = source.popen(['ping', '-c', str(ping_count), '-i', str(float(duration) / ping_count),
+                             destination.IP()])
+        clients.append(((src, dst), iperf, ping))
+
+    results = {}
+    for pair, iperf, ping in clients:
+        iperf_output = iperf.communicate()[0]
+        ping_output = ping.communicate()[0]
+        if not isinstance(iperf_output, str):
+            iperf_output, ping_output = iperf_output.decode(), ping_output.decode()
+        rtt, loss = parse_ping(ping_output)
+        results[pair] = {'throughput': parse_iperf(iperf_output), 'rtt': rtt, 'loss': loss}
+    for server in servers:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def run_tests(fanout, pattern, duration=5, ping_count=5, max_per_host=1, seed=None, receiver='h1'):
+    """
+    Starts CustomTopo and measures every pair of a traffic pattern.
+    :return: results, see make_results
+    """
+    if Mininet is None:
+        raise RuntimeError("Mininet is needed to run the tests, only --compare works without it")
+    CustomTopo = load_custom_topo()
+    topo = CustomTopo(LINKOPTS[0], LINKOPTS[1], LINKOPTS[2], fanout=fanout)
+    net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink)
+    net.start()
+    try:
+        hosts = sorted((host.name for host in net.hosts), key=host_order)
+        if pattern == 'all-pairs':
+            pairs = all_pairs(hosts)
+        elif pattern == 'permutation':
+            pairs = permutation(hosts, seed)
+        else:
+            pairs = incast(hosts, receiver)
+            # the senders of an incast share the receiver on purpose
+            max_per_host = max(max_per_host, len(pairs))
+        rounds = schedule(pairs, max_per_host)
+        print("%d pairs in %d rounds of %d s" % (len(pairs), len(rounds), duration))
+        measured = {}
+        for number, round_pairs in enumerate(rounds):
+            print("Round %d/%d: %d pairs" % (number + 1, len(rounds), len(round_pairs)))
+            for pair, metrics in run_round(net, round_pairs, duration, ping_count).items():
+                metrics['round'] = number
+                measured[pair] = metrics
+    finally:
+        net.stop()
+    return make_results(hosts, measured, {'fanout': fanout, 'linkopts': LINKOPTS, 'pattern': pattern,
+                                          'duration': duration, 'max_per_host': max_per_host, 'seed': seed,
+                                          'rounds': len(rounds)})
+
+
+def make_results(hosts, measured, settings):
+    """
+    Structures measurements as {"settings": ..., "hosts": [...], "pairs": [{"src", "dst", "round", metrics}],
+    "matrices": {metric: rows of src, columns of dst, None for pairs that were not measured}}.
+    """
+    pairs = [dict(src=src, dst=dst, **measured[(src, dst)]) for src, dst in sorted(
+        measured, key=lambda pair: (host_order(pair[0]), host_order(pair[1])))]
+    matrices = {}
+    for metric in METRICS:
+        matrices[metric] = [[measured.get((src, dst), {}).get(metric) for dst in hosts] for src in hosts]
+    return {'settings': settings, 'hosts': hosts, 'pairs': pairs, 'matrices': matrices}
+
+
+def save_results(results, prefix):
+    """
+    Writes prefix.json and a prefix-<metric>.csv matrix per metric.
+    """
+    with open(prefix + '.json', 'w') as f:
+        json.dump(results, f, indent=1)
+    for metric in METRICS:
+        with open('%s-%s.csv' % (prefix, metric), 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(['src\\dst'] + results['hosts'])
+            for src, row in zip(results['hosts'], results['matrices'][metric]):
+                writer.writerow([src] + ['' if value is None else value for value in row])
+
+
+def compare(results, baseline, tolerance=0.1, loss_tolerance=0.01):
+    """
+    Compares the pairs measured in both runs.
+    A pair regressed if its throughput dropped or its RTT grew by more than tolerance (a fraction of the
+    baseline), if its loss grew by more than loss_tolerance, or if it stopped delivering.
+    :return: list of regression descriptions
+    """
+    before = dict(((pair['src'], pair['dst']), pair) for pair in baseline['pairs'])
+    regressions = []
+    for pair in results['pairs']:
+        old = before.get((pair['src'], pair['dst']))
+        if old is None:
+            continue
+        name = "%s -> %s" % (pair['src'], pair['dst'])
+        if old['throughput'] and not pair['throughput']:
+            regressions.append("%s: no throughput, was %.2f Mbit/s" % (name, old['throughput']))
+        elif old['throughput'] and pair['throughput'] < old['throughput'] * (1 - tolerance):
+            regressions.append("%s: throughput %.2f Mbit/s, was %.2f Mbit/s" % (
+                name, pair['throughput'], old['throughput']))
+        if old['rtt'] is not None and pair['rtt'] is None:
+            regressions.append("%s: no ping reply, RTT was %.2f ms" % (name, old['rtt']))
+        elif old['rtt'] is not None and pair['rtt'] > old['rtt'] * (1 + tolerance):
+            regressions.append("%s: RTT %.2f ms, was %.2f ms" % (name, pair['rtt'], old['rtt']))
+        if pair['loss'] > old['loss'] + loss_tolerance:
+            regressions.append("%s: loss %.1f%%, was %.1f%%" % (name, 100 * pair['loss'], 100 * old['loss']))
+    return regressions
+
+
+def summary(results):
+    lines = []
+    for metric, unit in zip(METRICS, ['Mbit/s', 'ms', '']):
+        values = [pair[metric] for pair in results['pairs'] if pair[metric] is not None]
+        if values:
+            if metric == 'loss':
+                lines.append("loss: mean %.2f%%, max %.2f%%" % (100 * sum(values) / len(values), 100 * max(values)))
+            else:
+                lines.append("%s: mean %.2f %s, min %.2f, max %.2f" % (
+                    metric, sum(values) / len(values), unit, min(values), max(values)))
+    missing = sum(1 for pair in results['pairs'] if pair['throughput'] is None)
+    lines.append("%d pairs, %d without throughput" % (len(results['pairs']), missing))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent performance tests of CustomTopo")
+    parser.add_argument('--fanout', type=int, default=3)
+    parser.add_argument('--pattern', choices=['all-pairs', 'permutation', 'incast'], default='permutation')
+    parser.add_argument('--duration', type=int, default=5, help="seconds of every iperf and ping")
+    parser.add_argument('--pings', type=int, default=5, help="pings per pair")
+    parser.add_argument('--max-per-host', type=int, default=1,
+                        help="flows a host may send, and receive, at the same time")
+    parser.add_argument('--seed', type=int, default=None, help="seed of the permutation pattern")
+    parser.add_argument('--receiver', default='h1', help="receiver of the incast pattern")
+    parser.add_argument('-o', '--output', default='perf', help="prefix of the JSON and CSV files")
+    parser.add_argument('--baseline', help="JSON of an earlier run to compare with")
+    parser.add_argument('--compare', help="compare this JSON with the baseline instead of running the tests")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="relative throughput drop or RTT increase that counts as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        if not args.baseline:
+            parser.error("--compare needs --baseline")
+        with open(args.compare, 'r') as f:
+            results = json.load(f)
+    else:
+        setLogLevel('info')
+        results = run_tests(args.fanout, args.pattern, args.duration, args.pings, args.max_per_host, args.seed,
+                            args.receiver)
+        save_results(results, args.output)
+        print("Results written to %s.json and %s-{%s}.csv" % (args.output, args.output, ",".join(METRICS)))
+    print(summary(results))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print("Regression: %s" % regression)
+        print("%d regressions against %s" % (len(regressions), args.baseline))
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,9 @@
 
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
-from pox.lib.revent import *
+from pox.lib.revent import EventMixin
 from pox.lib.util import dpidToStr
 from pox.lib.addresses import EthAddr
-from collections import namedtuple
 import os
 
 import csv
@@ -1,21 +1,207 @@
 from pox.core import core
 from collections import defaultdict
+from array import array
+import bisect
+import heapq
+import zlib
 
 import pox.openflow.libopenflow_01 as of
-import pox.openflow.discovery
-import pox.openflow.spanning_tree
 
-from pox.lib.revent import *
+from pox.lib.revent import EventMixin
 from pox.lib.util import dpid_to_str
 from pox.lib.util import dpidToStr
+from pox.lib.util import str_to_dpid
+from pox.lib.util import str_to_bool
+from pox.lib.recoco import Timer
 
-from pox.lib.addresses import IPAddr, EthAddr
-from collections import namedtuple
-import os
+from pox.lib.addresses import EthAddr
+import time
 
 
 log = core.getLogger()
 
+# Base priority of the rules pushed by the proactive mode, above the reactive (default priority) ones, see
+# service_priority
+# Priority of the temporary flood rules of suppress_flood, below the forwarding and slice rules
+FLOOD_PRIORITY = of.OFP_DEFAULT_PRIORITY - 100
+PROACTIVE_PRIORITY = of.OFP_DEFAULT_PRIORITY + 100
+
+IPV4_TYPE = 0x0800
+TCP_PROTO = 6
+UDP_PROTO = 17
+
+# Match granularity of the rules installed by _handle_PacketIn:
+# 'exact' matches the full 12-tuple of the packet (one rule per transport connection),
+# 'service' matches (in_port, dl_src, dl_dst, service port) and 'slice' matches (dl_src, dl_dst, service port)
+RULE_GRANULARITIES = ('exact', 'service', 'slice')
+
+# Service dispatch of the PacketIn classifier, in order of precedence: ((IP protocol, transport port), service port
+# of the slice). A transport port matches the destination or the source port, as replies come from the server, and
+# the first service wins: TCP from port 80 to port 200 is HTTP. A None transport port matches every port of the
+# protocol: all UDP traffic is sent over the video slice.
+SERVICE_DISPATCH = (
+	((TCP_PROTO, 80), 80),
+	((TCP_PROTO, 200), 200),
+	((UDP_PROTO, None), 200),
+)
+
+# Switch queue of each service slice and the share of the link bandwidth guaranteed to the queue, as configured on
+# every switch port by configure_queues in Topo.py (SLICE_QUEUES). Traffic of no slice stays in default queue 0.
+SERVICE_QUEUES = {
+	200: 1,
+	80: 2,
+}
+QUEUE_MIN_SHARE = {1: 0.6, 2: 0.3}
+
+# Bandwidth (Mbps) of the switch-to-switch links of the P32 topology in Topo.py, keyed by sorted dpid pair
+P32_LINK_BANDWIDTH = {
+	('00-00-00-00-00-01', '00-00-00-00-00-02'): 100,
+	('00-00-00-00-00-01', '00-00-00-00-00-04'): 100,
+	('00-00-00-00-00-02', '00-00-00-00-00-03'): 100,
+	('00-00-00-00-00-02', '00-00-00-00-00-05'): 10,
+	('00-00-00-00-00-03', '00-00-00-00-00-06'): 10,
+	('00-00-00-00-00-04', '00-00-00-00-00-05'): 100,
+	('00-00-00-00-00-04', '00-00-00-00-00-07'): 100,
+	('00-00-00-00-00-05', '00-00-00-00-00-06'): 10,
+	('00-00-00-00-00-05', '00-00-00-00-00-07'): 10,
+	('00-00-00-00-00-06', '00-00-00-00-00-07'): 10,
+}
+DEFAULT_LINK_BANDWIDTH = 10
+
+# Link cost per service port, computed from the link bandwidth in Mbps.
+# The video slice (200) prefers the high-bandwidth links, the HTTP slice (80) keeps off them.
+SERVICE_LINK_COST = {
+	200: lambda bw: 100.0 / bw,
+	80: lambda bw: float(bw),
+}
+
+class TokenBucket(object):
+	"""
+	Token bucket that allows `rate` events per second on average and bursts of up to `burst` events.
+	"""
+
+	def __init__(self, rate, burst):
+		self.rate = float(rate)
+		self.burst = float(burst)
+		self.tokens = float(burst)
+		self.last = time.time()
+
+	def consume(self):
+		"""
+		Takes a token from the bucket.
+		:return: False if the bucket is empty and the event should be dropped
+		"""
+		now = time.time()
+		self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+		self.last = now
+		if self.tokens < 1:
+			return False
+		self.tokens -= 1
+		return True
+
+class HostTable(object):
+	"""
+	Host location table learned from PacketIn source addresses: MAC -> (integer dpid, port), with aging.
+	The entries live in parallel arrays, indexed through a single dict keyed by the raw 6-byte MAC, so a lookup
+	is one dict access and an entry takes a few dozen bytes, also with thousands of hosts.
+	"""
+	__slots__ = ('max_age', 'moves', '_slots', '_macs', '_dpids', '_ports', '_seen', '_free')
+
+	def __init__(self, max_age=300):
+		self.max_age = max_age
+		self.moves = 0 # number of detected host moves
+		self._slots = {} # raw MAC -> slot
+		self._macs = [] # slot -> raw MAC, None if the slot is free
+		self._dpids = array('Q') # slot -> dpid (the 64-bit OpenFlow datapath id)
+		self._ports = array('i') # slot -> port
+		self._seen = array('d') # slot -> time the host was last seen
+		self._free = []
+
+	def __len__(self):
+		return len(self._slots)
+
+	def learn(self, mac, dpid, port, now=None):
+		"""
+		Records that a host was seen behind a switch port.
+		:return: 'new' for an unknown host, 'moved' if it changed switch or port, None if nothing changed
+		"""
+		now = time.time() if now is None else now
+		key = mac.toRaw()
+		slot = self._slots.get(key)
+		if slot is None:
+			if self._free:
+				slot = self._free.pop()
+				self._macs[slot] = key
+				self._dpids[slot] = dpid
+				self._ports[slot] = port
+				self._seen[slot] = now
+			else:
+				slot = len(self._macs)
+				self._macs.append(key)
+				self._dpids.append(dpid)
+				self._ports.append(port)
+				self._seen.append(now)
+			self._slots[key] = slot
+			return 'new'
+		self._seen[slot] = now
+		if self._dpids[slot] != dpid or self._ports[slot] != port:
+			self._dpids[slot] = dpid
+			self._ports[slot] = port
+			self.moves += 1
+			return 'moved'
+		return None
+
+	def lookup(self, mac):
+		"""
+		:return: (integer dpid, port) of a host, or None if unknown
+		"""
+		slot = self._slots.get(mac.toRaw())
+		if slot is None:
+			return None
+		return self._dpids[slot], self._ports[slot]
+
+	def _remove_slot(self, slot):
+		del self._slots[self._macs[slot]]
+		self._macs[slot] = None
+		self._free.append(slot)
+
+	def expire(self, now=None):
+		"""
+		Removes the hosts not seen for max_age seconds.
+		:return: list of the removed MAC addresses
+		"""
+		now = time.time() if now is None else now
+		expired = [slot for slot in self._slots.values() if now - self._seen[slot] > self.max_age]
+		macs = [EthAddr(self._macs[slot]) for slot in expired]
+		for slot in expired:
+			self._remove_slot(slot)
+		return macs
+
+	def remove_port(self, dpid, port):
+		"""
+		Removes the hosts learned behind a switch port, e.g. when it turns out to be an inter-switch port.
+		:return: list of the removed MAC addresses
+		"""
+		removed = [slot for slot in self._slots.values() if self._dpids[slot] == dpid and self._ports[slot] == port]
+		macs = [EthAddr(self._macs[slot]) for slot in removed]
+		for slot in removed:
+			self._remove_slot(slot)
+		return macs
+
+def service_priority(port):
+	"""
+	Returns the priority of the proactive rules of a service port, higher for the services SERVICE_DISPATCH checks
+	first, so traffic matching the rules of two services takes the slice classify gives it.
+	"""
+	services = [service for key, service in SERVICE_DISPATCH]
+	return PROACTIVE_PRIORITY + len(services) - services.index(port)
+
+def link_key(sw1, sw2):
+	"""
+	Returns the direction-independent key of the link between two switch dpid strings.
+	"""
+	return (sw1, sw2) if sw1 < sw2 else (sw2, sw1)
+
 class CustomSlice (EventMixin):
 
 	def add_portmap_entry(self, src_dpid, src_mac, dst_mac, port, dst_dpid, bidirectional=True):
@@ -41,14 +227,109 @@ class CustomSlice (EventMixin):
 		:param path: list of switch dpid strings
 		:param bidirectional: if True, the path will be added in both directions
 		"""
+		self.slice_paths.append((src_mac, dst_mac, port, path, bidirectional))
 		for i in range(len(path) - 1):
 			self.add_portmap_entry(src_dpid=path[i], src_mac=src_mac, dst_mac=dst_mac, port=port, dst_dpid=path[i + 1],
 							  bidirectional=bidirectional)
 
-	def __init__(self):
+	def remove_portmap_path(self, src_mac, dst_mac, port, path, bidirectional=True):
+		"""
+		Removes a path added with add_portmap_path from the portmap, together with its proactive rules.
+		:param src_mac: source MAC address
+		:param dst_mac: destination MAC address
+		:param port: port number
+		:param path: list of switch dpid strings
+		:param bidirectional: if True, the path will be removed in both directions
+		"""
+		self.slice_paths.remove((src_mac, dst_mac, port, path, bidirectional))
+		for i in range(len(path) - 1):
+			self.portmap.pop((path[i], src_mac, dst_mac, port), None)
+			if bidirectional:
+				self.portmap.pop((path[i + 1], dst_mac, src_mac, port), None)
+		self.remove_path(src_mac, dst_mac, port, path)
+		if bidirectional:
+			self.remove_path(dst_mac, src_mac, port, list(reversed(path)))
+
+	def __init__(self, proactive=False, link_bandwidth=None, granularity='service', idle_timeout=10, hard_timeout=30,
+				 stats_interval=0, packet_in_rate=0, packet_in_burst=100, flood_threshold=3, flood_window=1,
+				 suppress_timeout=5, drop_timeout=0, max_paths=1, multipath_slack=0, rebalance_interval=0,
+				 host_timeout=300, queues=False, queue_stats_interval=0):
 		self.listenTo(core.openflow)
 		core.openflow_discovery.addListeners(self)
 
+		# if True, the rules of a whole slice path are pushed as soon as all its links are discovered
+		self.proactive = proactive
+
+		if granularity not in RULE_GRANULARITIES:
+			raise ValueError("granularity must be one of %s" % (RULE_GRANULARITIES,))
+		self.granularity = granularity
+		self.idle_timeout = idle_timeout
+		self.hard_timeout = hard_timeout
+		# counters to measure the PacketIn rate and the flow-table occupancy of the reactive rules, per integer dpid
+		self.packet_in_count = defaultdict(int)
+		self.rule_count = defaultdict(int)
+		self.last_packet_in_total = 0
+		self.stats_interval = stats_interval
+		if stats_interval:
+			Timer(stats_interval, self.log_rule_stats, recurring=True)
+
+		# per-switch PacketIn limiter, disabled if packet_in_rate is 0
+		self.packet_in_rate = packet_in_rate
+		self.packet_in_burst = packet_in_burst
+		self.packet_in_buckets = {}
+		self.packet_in_dropped = defaultdict(int)
+		# once a (dpid, in port, src MAC, dst MAC) is flooded flood_threshold times within flood_window seconds,
+		# a flood rule with a suppress_timeout hard timeout takes over, disabled if flood_threshold is 0.
+		self.flood_threshold = flood_threshold
+		self.flood_window = flood_window
+		self.suppress_timeout = suppress_timeout
+		# if set, packets without a route get a drop rule with this hard timeout instead of being dropped one by one,
+		# off by default as it also drops the traffic to hosts that have not been learned yet
+		self.drop_timeout = drop_timeout
+		# (dpid, in port, src MAC, dst MAC) -> (time of the first flood in the window, number of floods)
+		self.flood_counts = {}
+		# list of (src MAC, dst MAC, port, path, bidirectional) as given to add_portmap_path
+		self.slice_paths = []
+		# (src MAC, dst MAC, port, path) -> list of (dpid string, out port, src MAC, dst MAC, port) hops currently installed
+		self.installed_paths = {}
+
+		# sorted (dpid string, dpid string) -> bandwidth of the link in Mbps
+		self.link_bandwidth = link_bandwidth if link_bandwidth is not None else P32_LINK_BANDWIDTH
+		# (src MAC, dst MAC, port) -> (path, cost) computed from the adjacency map, path is None if unreachable
+		self.routes = {}
+		# link key -> set of self.routes keys whose path uses that link
+		self.link_routes = defaultdict(set)
+		# (src MAC, dst MAC, port) -> (path, cost) of a backup route that shares no link with the route
+		self.backups = {}
+		# (integer dpid, barrier xid) -> failover waiting for that barrier reply, and the measured failover times
+		self.pending_barriers = {}
+		self.failover_times = []
+
+		# Multipath: every slice demand may use up to max_paths paths whose cost is within multipath_slack
+		# (fraction) of the cheapest one. Each transport flow is pinned to one path by hashing its 5-tuple,
+		# with the bottleneck bandwidth of the path as weight.
+		self.max_paths = max_paths
+		self.multipath_slack = multipath_slack
+		# (src MAC, dst MAC, port) -> list of [path, weight], cheapest path first
+		self.multipaths = {}
+		# (src MAC, dst MAC, port, path index) -> number of reactive rules installed for flows pinned to that path
+		self.multipath_rules = defaultdict(int)
+		# (integer dpid, out port) -> (time, tx_bytes) of the last port stats, and the load in Mbps derived from them
+		self.port_tx_bytes = {}
+		self.port_load = {}
+		if rebalance_interval and max_paths > 1:
+			Timer(rebalance_interval, self.rebalance, recurring=True)
+
+		# QoS: with queues, the slice traffic is enqueued on the queue of its service (the switches need the queues
+		# of Topo.py) instead of plainly output, so a slice keeps its guaranteed rate on links shared with others.
+		# service port -> queue id, empty if disabled
+		self.service_queues = SERVICE_QUEUES if queues else {}
+		# (integer dpid, port, queue id) -> (time, tx_bytes) of the last queue stats, and the rate in Mbps derived from them
+		self.queue_tx_bytes = {}
+		self.queue_load = {}
+		if queue_stats_interval:
+			Timer(queue_stats_interval, self.request_queue_stats, recurring=True)
+
 		# Adjacency map.  [sw1][sw2] -> port from sw1 to sw2
 		self.adjacency = defaultdict(lambda:defaultdict(lambda:None))
 
@@ -61,131 +342,834 @@ class CustomSlice (EventMixin):
 		'''
 
 		self.portmap = {}
-		self.add_portmap_path(EthAddr('00:00:00:00:00:01'), EthAddr('00:00:00:00:00:05'), 200, ['00-00-00-00-00-01', '00-00-00-00-00-04', '00-00-00-00-00-07'])
-		self.add_portmap_path(EthAddr('00:00:00:00:00:04'), EthAddr('00:00:00:00:00:05'), 200, ['00-00-00-00-00-03', '00-00-00-00-00-02', '00-00-00-00-00-01', '00-00-00-00-00-04', '00-00-00-00-00-07'])
-		self.add_portmap_path(EthAddr('00:00:00:00:00:01'), EthAddr('00:00:00:00:00:06'), 80, ['00-00-00-00-00-01', '00-00-00-00-00-02', '00-00-00-00-00-05', '00-00-00-00-00-07'])
-		self.add_portmap_path(EthAddr('00:00:00:00:00:02'), EthAddr('00:00:00:00:00:06'), 80, ['00-00-00-00-00-02', '00-00-00-00-00-05', '00-00-00-00-00-07'])
-		self.add_portmap_path(EthAddr('00:00:00:00:00:03'), EthAddr('00:00:00:00:00:06'), 80, ['00-00-00-00-00-03', '00-00-00-00-00-06', '00-00-00-00-00-07'])
 
-		print(len(self.portmap), self.portmap) # to check the portmap
+		'''
+		self.slice_demands lists the host pairs that may talk over the slice of a service port:
+		(src MAC addr, dst MAC addr, port (int)). Their paths are computed from the discovered adjacency map
+		and added to the portmap in both directions.
+		'''
+		self.slice_demands = [
+			(EthAddr('00:00:00:00:00:01'), EthAddr('00:00:00:00:00:05'), 200),
+			(EthAddr('00:00:00:00:00:04'), EthAddr('00:00:00:00:00:05'), 200),
+			(EthAddr('00:00:00:00:00:01'), EthAddr('00:00:00:00:00:06'), 80),
+			(EthAddr('00:00:00:00:00:02'), EthAddr('00:00:00:00:00:06'), 80),
+			(EthAddr('00:00:00:00:00:03'), EthAddr('00:00:00:00:00:06'), 80),
+		]
+		for demand in self.slice_demands:
+			self.routes[demand] = (None, None)
+
+
+		'''
+		self.hosts is the host location table, learned from the source address of the PacketIns that enter on
+		an edge port: MAC addr -> (dpid (int), port (int)). Hosts not seen for host_timeout seconds are aged out,
+		the slice routes of an aged out host stay in place until it shows up again.
+		self.switch_ports holds the inter-switch ports known from discovery, where no host is learned:
+		dpid (int) -> set of ports (int)
+		'''
+		self.hosts = HostTable(max_age=host_timeout)
+		self.switch_ports = defaultdict(set)
+		if host_timeout:
+			Timer(max(1, host_timeout / 4.0), self.expire_hosts, recurring=True)
 
 		'''
-		self.switch_to_hosts_ports is a dictionary that relates switch dpid and host MAC address to port:
-		(dpid string, dst MAC addr) -> port (int)
+		Lookup table of _handle_PacketIn, keyed by integer dpid and rebuilt whenever the adjacency map changes:
+		self.forwarding_table: (dpid, src MAC addr, dst MAC addr, port (int)) -> out port (int)
 		'''
-		self.switch_to_hosts_ports = {
-			('00-00-00-00-00-01', EthAddr('00:00:00:00:00:01')): 1,
-			('00-00-00-00-00-02', EthAddr('00:00:00:00:00:02')): 2,
-			('00-00-00-00-00-03', EthAddr('00:00:00:00:00:03')): 2,
-			('00-00-00-00-00-03', EthAddr('00:00:00:00:00:04')): 3,
-			('00-00-00-00-00-07', EthAddr('00:00:00:00:00:05')): 4,
-			('00-00-00-00-00-07', EthAddr('00:00:00:00:00:06')): 5,
-		}
+		self.rebuild_forwarding_table()
 
 	def _handle_ConnectionUp(self, event):
 		dpid = dpidToStr(event.dpid)
 		log.debug("Switch %s has connected.", dpid)
+		if self.proactive:
+			# a (re)connected switch has an empty table, push the hops of the installed paths again
+			for hops in self.installed_paths.values():
+				for hop in hops:
+					if hop[0] == dpid:
+						self.send_hop_rules(hop)
 
 	def _handle_LinkEvent (self, event):
 		l = event.link
 		sw1 = dpid_to_str(l.dpid1)
 		sw2 = dpid_to_str(l.dpid2)
-		log.debug ("link %s[%d] <-> %s[%d]",
+		log.debug ("link %s[%d] <-> %s[%d] %s",
 			sw1, l.port1,
-			sw2, l.port2)
-		self.adjacency[sw1][sw2] = l.port1
-		self.adjacency[sw2][sw1] = l.port2
+			sw2, l.port2, "removed" if event.removed else "added")
+		if event.removed:
+			self.adjacency[sw1].pop(sw2, None)
+			self.adjacency[sw2].pop(sw1, None)
+			self.switch_ports[l.dpid1].discard(l.port1)
+			self.switch_ports[l.dpid2].discard(l.port2)
+			self.fail_over(l)
+		else:
+			self.adjacency[sw1][sw2] = l.port1
+			self.adjacency[sw2][sw1] = l.port2
+			self.switch_ports[l.dpid1].add(l.port1)
+			self.switch_ports[l.dpid2].add(l.port2)
+			# hosts learned from flooded packets before the link was discovered are not behind these ports
+			for mac in self.hosts.remove_port(l.dpid1, l.port1) + self.hosts.remove_port(l.dpid2, l.port2):
+				log.debug("Host %s was learned on an inter-switch port, forgotten", mac)
+				self.update_host_routes(mac)
+		self.update_routes(sw1, sw2, removed=event.removed)
+		self.refresh_backups()
+		if self.max_paths > 1:
+			self.update_multipaths()
+		self.rebuild_forwarding_table()
+		if self.proactive:
+			self.update_proactive_paths()
+
+	### Host learning ###
+
+	def learn_host(self, event, packet):
+		"""
+		Learns the location of the source host of a PacketIn that entered on an edge port.
+		"""
+		if event.port in self.switch_ports[event.dpid] or packet.src.is_multicast:
+			return
+		change = self.hosts.learn(packet.src, event.dpid, event.port)
+		if change is None:
+			return
+		log.debug("Host %s %s: %s port %d", packet.src, change, dpid_to_str(event.dpid), event.port)
+		if change == 'moved':
+			# the rules towards the host on every switch lead to the old location, reactive and slice path ones
+			delete = of.ofp_flow_mod(command=of.OFPFC_DELETE, match=of.ofp_match(dl_dst=packet.src))
+			for connection in core.openflow.connections:
+				connection.send(delete)
+			for key in [key for key in self.installed_paths if key[1] == packet.src]:
+				del self.installed_paths[key]
+		self.update_host_routes(packet.src)
+		if change == 'moved' and self.proactive:
+			# the slice paths towards the host are pushed again for its new location
+			self.update_proactive_paths()
+
+	def update_host_routes(self, mac):
+		"""
+		Recomputes the routes of the slice demands of a host that appeared, moved or disappeared.
+		"""
+		changed = False
+		for demand in self.slice_demands:
+			if mac == demand[0] or mac == demand[1]:
+				path, cost = self.compute_path(*demand)
+				self.set_route(demand, path, cost)
+				changed = True
+		if not changed:
+			return
+		self.refresh_backups()
+		if self.max_paths > 1:
+			self.update_multipaths()
+		self.rebuild_forwarding_table()
+		if self.proactive:
+			self.update_proactive_paths()
+
+	def expire_hosts(self):
+		"""
+		Ages out the hosts that have not been seen for a while.
+		"""
+		for mac in self.hosts.expire():
+			log.debug("Host %s aged out", mac)
+
+	### Path computation ###
+
+	def host_switch(self, mac):
+		"""
+		Returns the dpid string of the switch a host is attached to, or None if unknown.
+		"""
+		location = self.hosts.lookup(mac)
+		if location is None:
+			return None
+		return dpid_to_str(location[0])
+
+	def link_cost(self, sw1, sw2, port):
+		"""
+		Returns the cost of the link between two switches for the slice of a service port.
+		"""
+		bandwidth = self.link_bandwidth.get(link_key(sw1, sw2), DEFAULT_LINK_BANDWIDTH)
+		return SERVICE_LINK_COST.get(port, lambda bw: 1.0)(bandwidth)
+
+	def shortest_distances(self, src_dpid, port, excluded_links=()):
+		"""
+		Runs Dijkstra over the adjacency map with the link costs of a service port.
+		:param excluded_links: link keys that may not be used
+		:return: (dict dpid -> distance, dict dpid -> previous dpid)
+		"""
+		distances = {src_dpid: 0.0}
+		previous = {}
+		heap = [(0.0, src_dpid)]
+		while heap:
+			distance, dpid = heapq.heappop(heap)
+			if distance > distances[dpid]:
+				continue
+			for neighbour, outport in self.adjacency[dpid].items():
+				if outport is None or (excluded_links and link_key(dpid, neighbour) in excluded_links):
+					continue
+				new_distance = distance + self.link_cost(dpid, neighbour, port)
+				if new_distance < distances.get(neighbour, float('inf')):
+					distances[neighbour] = new_distance
+					previous[neighbour] = dpid
+					heapq.heappush(heap, (new_distance, neighbour))
+		return distances, previous
+
+	def compute_path(self, src_mac, dst_mac, port, excluded_links=()):
+		"""
+		Computes the cheapest path between the switches of two hosts for the slice of a service port.
+		:param excluded_links: link keys that may not be used
+		:return: (list of switch dpid strings, cost), or (None, None) if there is no path (yet)
+		"""
+		src_dpid = self.host_switch(src_mac)
+		dst_dpid = self.host_switch(dst_mac)
+		if src_dpid is None or dst_dpid is None:
+			return None, None
+		distances, previous = self.shortest_distances(src_dpid, port, excluded_links)
+		if dst_dpid not in distances:
+			return None, None
+		path = [dst_dpid]
+		while path[-1] != src_dpid:
+			path.append(previous[path[-1]])
+		path.reverse()
+		return path, distances[dst_dpid]
+
+	def set_route(self, demand, path, cost):
+		"""
+		Replaces the cached route of a slice demand and its portmap entries.
+		"""
+		src_mac, dst_mac, port = demand
+		old_path, _ = self.routes[demand]
+		if old_path == path:
+			self.routes[demand] = (path, cost)
+			return
+		if old_path is not None:
+			self.remove_portmap_path(src_mac, dst_mac, port, old_path)
+			for i in range(len(old_path) - 1):
+				self.link_routes[link_key(old_path[i], old_path[i + 1])].discard(demand)
+		self.routes[demand] = (path, cost)
+		if path is not None:
+			self.add_portmap_path(src_mac, dst_mac, port, path)
+			for i in range(len(path) - 1):
+				self.link_routes[link_key(path[i], path[i + 1])].add(demand)
+		log.debug("Slice route %s -> %s (port %d): %s", src_mac, dst_mac, port, path)
+
+	def update_routes(self, sw1, sw2, removed=False):
+		"""
+		Recomputes only the cached routes affected by a link change.
+		A removed link affects the routes using it. An added link affects the routes without a path
+		and the routes it makes cheaper, which is checked with the distances from both link ends.
+		"""
+		if removed:
+			affected = set(self.link_routes.get(link_key(sw1, sw2), ()))
+		else:
+			affected = set(demand for demand, (path, _) in self.routes.items() if path is None)
+			link_distances = {}
+			for demand, (path, cost) in self.routes.items():
+				if path is None:
+					continue
+				src_mac, dst_mac, port = demand
+				if port not in link_distances:
+					link_distances[port] = (self.shortest_distances(sw1, port)[0],
+											self.shortest_distances(sw2, port)[0])
+				distances1, distances2 = link_distances[port]
+				src_dpid, dst_dpid = path[0], path[-1]
+				inf = float('inf')
+				link_cost = self.link_cost(sw1, sw2, port)
+				via_link = min(distances1.get(src_dpid, inf) + link_cost + distances2.get(dst_dpid, inf),
+							   distances2.get(src_dpid, inf) + link_cost + distances1.get(dst_dpid, inf))
+				if via_link < cost:
+					affected.add(demand)
+		for demand in affected:
+			path, cost = self.compute_path(*demand)
+			self.set_route(demand, path, cost)
+
+	### Fast failover ###
+
+	def path_alive(self, path):
+		"""
+		Returns True if all links of a path are in the adjacency map.
+		"""
+		return all(self.adjacency[path[i]].get(path[i + 1]) is not None for i in range(len(path) - 1))
+
+	def refresh_backups(self):
+		"""
+		Precomputes a backup route for every routed demand whose backup is missing, broken or became its route.
+		The backup avoids all links of the route, so a single link failure never breaks both.
+		"""
+		for demand, (path, cost) in self.routes.items():
+			if path is None:
+				continue
+			backup = self.backups.get(demand)
+			if backup is not None and backup[0] is not None and backup[0] != path and self.path_alive(backup[0]):
+				continue
+			route_links = set(link_key(path[i], path[i + 1]) for i in range(len(path) - 1))
+			self.backups[demand] = self.compute_path(*demand, excluded_links=route_links) if route_links else (None, None)
+
+	def fail_over(self, link):
+		"""
+		Moves the routes using a removed link to their precomputed backups, without computing any path, and
+		rewrites the affected rules right away: the proactive paths are reinstalled and the rules forwarding
+		into the dead ports are deleted. A barrier to every touched switch measures when the last rule is in.
+		"""
+		start = time.time()
+		sw1 = dpid_to_str(link.dpid1)
+		sw2 = dpid_to_str(link.dpid2)
+		touched = set([link.dpid1, link.dpid2])
+		failed_over = 0
+		for demand in list(self.link_routes.get(link_key(sw1, sw2), ())):
+			backup = self.backups.get(demand)
+			if backup is None or backup[0] is None or not self.path_alive(backup[0]):
+				continue
+			self.set_route(demand, *backup)
+			touched.update(str_to_dpid(dpid) for dpid in backup[0])
+			failed_over += 1
+		self.rebuild_forwarding_table()
+		if self.proactive:
+			self.update_proactive_paths()
+		for dpid, port in ((link.dpid1, link.port1), (link.dpid2, link.port2)):
+			connection = core.openflow.getConnection(dpid)
+			if connection is not None:
+				connection.send(of.ofp_flow_mod(command=of.OFPFC_DELETE, out_port=port))
+		log.info("Link %s <-> %s down: %d routes moved to their backup, rules sent in %.2f ms",
+				 sw1, sw2, failed_over, (time.time() - start) * 1000)
+
+		failover = {'start': start, 'link': (sw1, sw2), 'pending': set()}
+		for dpid in touched:
+			connection = core.openflow.getConnection(dpid)
+			if connection is None:
+				continue
+			barrier = of.ofp_barrier_request()
+			connection.send(barrier)
+			self.pending_barriers[(dpid, barrier.xid)] = failover
+			failover['pending'].add((dpid, barrier.xid))
+
+	def _handle_BarrierIn(self, event):
+		"""
+		Reports the failover time, from the LinkEvent to the last switch confirming its rules, once all barriers
+		of a failover are answered.
+		"""
+		failover = self.pending_barriers.pop((event.dpid, event.xid), None)
+		if failover is None:
+			return
+		failover['pending'].discard((event.dpid, event.xid))
+		if not failover['pending']:
+			elapsed = time.time() - failover['start']
+			self.failover_times.append(elapsed)
+			log.info("Failover of link %s <-> %s completed in %.2f ms", failover['link'][0], failover['link'][1],
+					 elapsed * 1000)
+
+	### Multipath ###
+
+	def path_bandwidth(self, path):
+		"""
+		Returns the bottleneck bandwidth of a path in Mbps.
+		"""
+		bandwidths = [self.link_bandwidth.get(link_key(path[i], path[i + 1]), DEFAULT_LINK_BANDWIDTH)
+					  for i in range(len(path) - 1)]
+		return min(bandwidths) if bandwidths else DEFAULT_LINK_BANDWIDTH
+
+	def compute_multipaths(self, src_mac, dst_mac, port):
+		"""
+		Enumerates the loop-free paths between the switches of two hosts whose cost is within multipath_slack of
+		the cheapest one. The search is pruned with the distances to the destination switch.
+		:return: list of [path, weight] with the bottleneck bandwidth as weight, cheapest first, at most max_paths
+		"""
+		src_dpid = self.host_switch(src_mac)
+		dst_dpid = self.host_switch(dst_mac)
+		if src_dpid is None or dst_dpid is None:
+			return []
+		# links are symmetric, so the distances from the destination are the distances to it
+		to_dst, _ = self.shortest_distances(dst_dpid, port)
+		if src_dpid not in to_dst:
+			return []
+		bound = to_dst[src_dpid] * (1 + self.multipath_slack) + 1e-9
+		found = []
+
+		def extend(path, cost):
+			dpid = path[-1]
+			if dpid == dst_dpid:
+				found.append((cost, list(path)))
+				return
+			for neighbour, outport in self.adjacency[dpid].items():
+				if outport is None or neighbour in path:
+					continue
+				new_cost = cost + self.link_cost(dpid, neighbour, port)
+				if new_cost + to_dst.get(neighbour, float('inf')) <= bound:
+					path.append(neighbour)
+					extend(path, new_cost)
+					path.pop()
+
+		extend([src_dpid], 0.0)
+		found.sort()
+		return [[path, self.path_bandwidth(path)] for cost, path in found[:self.max_paths]]
+
+	def update_multipaths(self):
+		"""
+		Recomputes the multipath sets of all slice demands. Unlike the primary routes, any added link may add
+		an alternative path, so all of them are recomputed.
+		"""
+		for demand in self.slice_demands:
+			self.multipaths[demand] = self.compute_multipaths(*demand)
+
+	def rebuild_multipath_table(self):
+		"""
+		Builds (dpid, src MAC, dst MAC, port) -> (cumulative path weights, out port per path index) for the demands
+		with more than one path, in both directions. The out port is None where the switch is not on that path.
+		"""
+		multipath_table = {}
+		for (src_mac, dst_mac, port), paths in self.multipaths.items():
+			if len(paths) < 2:
+				continue
+			cumulative_weights = []
+			total = 0.0
+			for path, weight in paths:
+				total += weight
+				cumulative_weights.append(total)
+			cumulative_weights = tuple(cumulative_weights)
+			outports = {}
+			for index, (path, weight) in enumerate(paths):
+				for hop_src, hop_dst, direction in ((path, path[1:], (src_mac, dst_mac)),
+													(path[::-1], path[-2::-1], (dst_mac, src_mac))):
+					for dpid, next_hop_dpid in zip(hop_src, hop_dst):
+						key = (str_to_dpid(dpid),) + direction + (port,)
+						outports.setdefault(key, [None] * len(paths))[index] = self.adjacency[dpid].get(next_hop_dpid)
+			for key, ports in outports.items():
+				multipath_table[key] = (cumulative_weights, tuple(ports))
+		self.multipath_table = multipath_table
+
+	def select_path(self, packet, cumulative_weights):
+		"""
+		Pins a transport flow to a path index by hashing its 5-tuple. Every switch on the path computes the
+		same index for the flow.
+		"""
+		ip = packet.payload
+		transport = ip.payload
+		flow = "%s %s %d %d %d" % (ip.srcip, ip.dstip, ip.protocol, transport.srcport, transport.dstport)
+		point = (zlib.crc32(flow.encode()) & 0xffffffff) / 4294967296.0 * cumulative_weights[-1]
+		return bisect.bisect_right(cumulative_weights, point)
+
+	def rebalance(self):
+		"""
+		Requests port stats and reweights the paths of every demand by their residual bandwidth, using the loads
+		from the previous stats. Only new flows move, the installed rules keep their path until they time out.
+		"""
+		for connection in core.openflow._connections.values():
+			connection.send(of.ofp_stats_request(body=of.ofp_port_stats_request()))
+		if not self.port_load:
+			return
+		for paths in self.multipaths.values():
+			for entry in paths:
+				path = entry[0]
+				residuals = []
+				for i in range(len(path) - 1):
+					bandwidth = self.link_bandwidth.get(link_key(path[i], path[i + 1]), DEFAULT_LINK_BANDWIDTH)
+					outport = self.adjacency[path[i]].get(path[i + 1])
+					load = self.port_load.get((str_to_dpid(path[i]), outport), 0.0)
+					residuals.append(max(bandwidth - load, 0.01 * bandwidth))
+				entry[1] = min(residuals) if residuals else DEFAULT_LINK_BANDWIDTH
+		self.rebuild_multipath_table()
+		log.debug("Multipath weights rebalanced: %s", self.multipaths)
+
+	def _handle_PortStatsReceived(self, event):
+		"""
+		Derives the transmit load in Mbps of every switch port from consecutive port stats.
+		"""
+		now = time.time()
+		for port_stats in event.stats:
+			key = (event.connection.dpid, port_stats.port_no)
+			previous = self.port_tx_bytes.get(key)
+			if previous is not None and now > previous[0]:
+				self.port_load[key] = (port_stats.tx_bytes - previous[1]) * 8 / 1e6 / (now - previous[0])
+			self.port_tx_bytes[key] = (now, port_stats.tx_bytes)
+
+	### QoS ###
+
+	def output_action(self, outport, queue=None):
+		"""
+		Returns the action sending traffic out of a port, through a queue of that port if given.
+		"""
+		if queue is None:
+			return of.ofp_action_output(port=outport)
+		return of.ofp_action_enqueue(port=outport, queue_id=queue)
+
+	def port_bandwidth(self, dpid, port):
+		"""
+		Returns the bandwidth in Mbps of the switch-to-switch link on a port, None for host or unknown ports.
+		"""
+		dpid = dpid_to_str(dpid)
+		for neighbour, outport in self.adjacency[dpid].items():
+			if outport == port:
+				return self.link_bandwidth.get(link_key(dpid, neighbour), DEFAULT_LINK_BANDWIDTH)
+		return None
+
+	def request_queue_stats(self):
+		"""
+		Requests the stats of all the queues of every switch, handled by _handle_QueueStatsReceived.
+		"""
+		for connection in core.openflow._connections.values():
+			connection.send(of.ofp_stats_request(body=of.ofp_queue_stats_request()))
+
+	def _handle_QueueStatsReceived(self, event):
+		"""
+		Derives the rate in Mbps of every queue from consecutive queue stats, and warns about slice queues
+		served below their guaranteed rate while their link is saturated.
+		"""
+		now = time.time()
+		dpid = event.connection.dpid
+		port_rates = defaultdict(dict)
+		for queue_stats in event.stats:
+			key = (dpid, queue_stats.port_no, queue_stats.queue_id)
+			previous = self.queue_tx_bytes.get(key)
+			if previous is not None and now > previous[0]:
+				self.queue_load[key] = (queue_stats.tx_bytes - previous[1]) * 8 / 1e6 / (now - previous[0])
+				port_rates[queue_stats.port_no][queue_stats.queue_id] = self.queue_load[key]
+			self.queue_tx_bytes[key] = (now, queue_stats.tx_bytes)
+
+		for port, rates in sorted(port_rates.items()):
+			bandwidth = self.port_bandwidth(dpid, port)
+			log.debug("Queues of %s port %d (%s Mbps): %s", dpid_to_str(dpid), port, bandwidth,
+					  ", ".join("%d: %.2f Mbps" % item for item in sorted(rates.items())))
+			if bandwidth is None or sum(rates.values()) < 0.9 * bandwidth:
+				continue
+			for queue, rate in sorted(rates.items()):
+				guaranteed = QUEUE_MIN_SHARE.get(queue, 0) * bandwidth
+				if 0 < rate < 0.9 * guaranteed:
+					log.warning("Queue %d of %s port %d gets %.2f Mbps under contention, %.2f Mbps guaranteed",
+								queue, dpid_to_str(dpid), port, rate, guaranteed)
+
+	### Reactive rules ###
+
+	def rebuild_forwarding_table(self):
+		"""
+		Joins the portmap with the adjacency map, so that a PacketIn needs a single lookup to find its out port.
+		"""
+		forwarding_table = {}
+		for (dpid, src_mac, dst_mac, port), next_hop_dpid in self.portmap.items():
+			outport = self.adjacency[dpid].get(next_hop_dpid)
+			if outport is not None:
+				forwarding_table[(str_to_dpid(dpid), src_mac, dst_mac, port)] = outport
+		self.forwarding_table = forwarding_table
+		self.rebuild_multipath_table()
+
+	def classify(self, packet):
+		"""
+		Classifies a packet into the service of its slice with SERVICE_DISPATCH, the first matching service wins.
+		:param packet: parsed ethernet packet
+		:return: (nw_proto, transport field, service port) as used by rule_match, (None, None, None) for
+		TCP/UDP traffic of no service, or None if the packet is not TCP/UDP over IPv4
+		"""
+		if packet.type != IPV4_TYPE:
+			return None
+		ip = packet.payload
+		nw_proto = ip.protocol
+		if nw_proto != TCP_PROTO and nw_proto != UDP_PROTO:
+			return None
+		transport = ip.payload
+		for (proto, port), service in SERVICE_DISPATCH:
+			if proto != nw_proto:
+				continue
+			if port is None:
+				return nw_proto, None, service
+			if transport.dstport == port:
+				return nw_proto, 'tp_dst', service
+			if transport.srcport == port:
+				return nw_proto, 'tp_src', service
+		return None, None, None
+
+	def set_packet(self, msg, event):
+		"""
+		Attaches the packet of a PacketIn to a packet_out or flow_mod. A flow_mod takes the PacketIn itself: POX
+		packs it with the buffer_id of a buffered packet, or follows it with a packet_out of an unbuffered one
+		through the new rule. A packet_out refers to a buffered packet by its buffer_id, only an unbuffered packet
+		is sent back in full.
+		"""
+		if isinstance(msg, of.ofp_flow_mod):
+			msg.data = event.ofp
+			return
+		buffer_id = event.ofp.buffer_id
+		if buffer_id is not None and buffer_id != of.NO_BUFFER:
+			msg.buffer_id = buffer_id
+		else:
+			msg.data = event.ofp.data
+		msg.in_port = event.port
+
+	def flood(self, event):
+		"""
+		Floods the packet, but doesn't install a rule unless the same flood keeps repeating.
+		"""
+		if self.suppress_flood(event):
+			return
+		msg = of.ofp_packet_out()
+		msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
+		self.set_packet(msg, event)
+		event.connection.send(msg)
+
+	def suppress_flood(self, event):
+		"""
+		Counts the floods per (switch, in port, src MAC, dst MAC). Once they repeat, installs a temporary flood rule
+		so a broadcast storm is flooded by the switch instead of through the controller. The rule matches the
+		kind of packet that was flooded, all its fields but the transport ports, below the priority of the
+		forwarding and slice rules, so it floods no slice traffic.
+		:return: True if a flood rule was installed, which also floods the packet
+		"""
+		if not self.flood_threshold:
+			return False
+		packet = event.parsed
+		key = (event.dpid, event.port, packet.src, packet.dst)
+		now = time.time()
+		first, count = self.flood_counts.get(key, (now, 0))
+		if now - first > self.flood_window:
+			first, count = now, 0
+		count += 1
+		if count < self.flood_threshold:
+			self.flood_counts[key] = (first, count)
+			return False
+		del self.flood_counts[key]
+		msg = of.ofp_flow_mod()
+		msg.hard_timeout = self.suppress_timeout
+		msg.priority = FLOOD_PRIORITY
+		msg.match = of.ofp_match.from_packet(packet, event.port)
+		msg.match.tp_src = None
+		msg.match.tp_dst = None
+		msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
+		self.set_packet(msg, event)
+		event.connection.send(msg)
+		log.debug("Flood of %s -> %s at %s suppressed for %d s", packet.src, packet.dst, dpid_to_str(event.dpid),
+				  self.suppress_timeout)
+		return True
+
+	def install_droprule(self, event, packet, service=(None, None, None)):
+		"""
+		Installs a temporary rule dropping the traffic that has nowhere to go, so it stops reaching the controller.
+		:param service: (nw_proto, transport field, service port) tuple from classify
+		"""
+		msg = of.ofp_flow_mod()
+		msg.hard_timeout = self.drop_timeout
+		msg.match = self.rule_match(packet, event.port, *service)
+		self.set_packet(msg, event)
+		event.connection.send(msg)
+
+	def install_fwdrule(self, event, packet, outport, service=(None, None, None), queue=None):
+		"""
+		Installs a reactive forwarding rule for the packet and sends the packet along.
+		:param service: (nw_proto, transport field, service port) tuple from classify
+		:param queue: queue id of outport to send the traffic through, None for a plain output
+		"""
+		msg = of.ofp_flow_mod()
+		msg.idle_timeout = self.idle_timeout
+		msg.hard_timeout = self.hard_timeout
+		msg.flags = of.OFPFF_SEND_FLOW_REM # to keep track of the flow-table occupancy
+		msg.match = self.rule_match(packet, event.port, *service)
+		msg.actions.append(self.output_action(outport, queue))
+		self.set_packet(msg, event)
+		event.connection.send(msg)
+		self.rule_count[event.dpid] += 1
+
+	def rule_match(self, packet, in_port, nw_proto=None, tp_field=None, port=None):
+		"""
+		Builds the match of a reactive forwarding rule according to the rule granularity.
+		:param packet: parsed packet
+		:param in_port: port the packet came in on
+		:param nw_proto: IP protocol of the service the packet belongs to, None if it belongs to no service
+		:param tp_field: 'tp_src' or 'tp_dst', the transport field holding the service port, None to match all ports
+		:param port: service port number
+		:return: ofp_match
+		"""
+		if self.granularity == 'exact' or nw_proto is None:
+			return of.ofp_match.from_packet(packet, in_port)
+		match = of.ofp_match(dl_src=packet.src, dl_dst=packet.dst, dl_type=IPV4_TYPE, nw_proto=nw_proto)
+		if tp_field is not None:
+			setattr(match, tp_field, port)
+		if self.granularity == 'service':
+			match.in_port = in_port
+		return match
+
+	def _handle_FlowRemoved(self, event):
+		"""
+		Keeps the flow-table occupancy up to date when a reactive rule times out or is deleted.
+		"""
+		if event.idleTimeout or event.hardTimeout or event.deleted:
+			self.rule_count[event.dpid] = max(0, self.rule_count[event.dpid] - 1)
+
+	def log_rule_stats(self):
+		"""
+		Logs the PacketIn rate since the previous call and the number of reactive rules per switch.
+		"""
+		total = sum(self.packet_in_count.values())
+		rate = (total - self.last_packet_in_total) / float(self.stats_interval)
+		self.last_packet_in_total = total
+		log.info("Granularity %s: %.1f PacketIn/s, %d dropped by the limiter, %d reactive rules installed (%s)",
+				 self.granularity, rate, sum(self.packet_in_dropped.values()), sum(self.rule_count.values()),
+				 ", ".join("%s: %d" % (dpid_to_str(dpid), count) for dpid, count in sorted(self.rule_count.items())))
+		for (src_mac, dst_mac, port, index), count in sorted(self.multipath_rules.items()):
+			log.info("Multipath %s -> %s (port %d) path %d: %d rules", src_mac, dst_mac, port, index, count)
+
+	### Proactive mode ###
+
+	def service_matches(self, src_mac, dst_mac, port):
+		"""
+		Returns the matches covering the traffic that _handle_PacketIn sends along the slice of a service port.
+		They overlap the matches of the other service port, their rules get the priority of service_priority.
+		:param src_mac: source MAC address
+		:param dst_mac: destination MAC address
+		:param port: service port number (80 or 200)
+		:return: list of ofp_match
+		"""
+		fields = [(TCP_PROTO, {'tp_dst': port}), (TCP_PROTO, {'tp_src': port})]
+		if port == 200:
+			fields.append((UDP_PROTO, {})) # all UDP traffic is sent over the video slice
+		matches = []
+		for nw_proto, tp_fields in fields:
+			match = of.ofp_match(dl_src=src_mac, dl_dst=dst_mac, dl_type=IPV4_TYPE, nw_proto=nw_proto)
+			for field, value in tp_fields.items():
+				setattr(match, field, value)
+			matches.append(match)
+		return matches
+
+	def path_hops(self, dst_mac, path):
+		"""
+		Resolves a path into the output port to use at every switch, the last switch outputs to the host.
+		:param dst_mac: destination MAC address
+		:param path: list of switch dpid strings
+		:return: list of (dpid string, out port), or None if a link or the host port is not known (yet)
+		"""
+		hops = []
+		for i in range(len(path) - 1):
+			outport = self.adjacency[path[i]].get(path[i + 1])
+			if outport is None:
+				return None
+			hops.append((path[i], outport))
+		location = self.hosts.lookup(dst_mac)
+		if location is None or dpid_to_str(location[0]) != path[-1]:
+			return None
+		hops.append((path[-1], location[1]))
+		return hops
+
+	def send_hop_rules(self, hop, command=of.OFPFC_ADD):
+		"""
+		Sends the (permanent) rules of one path hop to its switch.
+		:param hop: (dpid string, out port, src MAC, dst MAC, port) tuple
+		:param command: flow_mod command, OFPFC_ADD or OFPFC_DELETE_STRICT
+		"""
+		dpid, outport, src_mac, dst_mac, port = hop
+		connection = core.openflow.getConnection(str_to_dpid(dpid))
+		if connection is None:
+			log.debug("Switch %s not connected, rules are pushed when it connects", dpid)
+			return
+		for match in self.service_matches(src_mac, dst_mac, port):
+			msg = of.ofp_flow_mod(command=command)
+			msg.match = match
+			msg.priority = service_priority(port)
+			if command == of.OFPFC_ADD:
+				msg.actions.append(self.output_action(outport, self.service_queues.get(port)))
+			connection.send(msg)
+
+	def install_path(self, src_mac, dst_mac, port, path):
+		"""
+		Pushes the rules of a one-directional slice path to every hop at once, replacing a previous version.
+		:return: True if the path is installed after the call
+		"""
+		key = (src_mac, dst_mac, port, tuple(path))
+		hops = self.path_hops(dst_mac, path)
+		if hops is not None:
+			hops = [(dpid, outport, src_mac, dst_mac, port) for dpid, outport in hops]
+		old_hops = self.installed_paths.get(key)
+		if hops == old_hops:
+			return hops is not None
+		if old_hops is not None:
+			self.remove_path(src_mac, dst_mac, port, path)
+		if hops is None:
+			return False
+		for hop in hops:
+			self.send_hop_rules(hop)
+		self.installed_paths[key] = hops
+		log.debug("Installed slice path %s -> %s (port %d) over %s", src_mac, dst_mac, port, path)
+		return True
+
+	def remove_path(self, src_mac, dst_mac, port, path):
+		"""
+		Deletes the rules of an installed one-directional slice path from every hop.
+		"""
+		hops = self.installed_paths.pop((src_mac, dst_mac, port, tuple(path)), None)
+		if hops is None:
+			return
+		for hop in hops:
+			self.send_hop_rules(hop, command=of.OFPFC_DELETE_STRICT)
+		log.debug("Removed slice path %s -> %s (port %d) over %s", src_mac, dst_mac, port, path)
+
+	def update_proactive_paths(self):
+		"""
+		Installs the slice paths whose links are all known, and updates or removes the ones whose links changed.
+		"""
+		for src_mac, dst_mac, port, path, bidirectional in self.slice_paths:
+			self.install_path(src_mac, dst_mac, port, path)
+			if bidirectional:
+				self.install_path(dst_mac, src_mac, port, list(reversed(path)))
 
 	def _handle_PacketIn (self, event):
 		"""
 		Handle packet in messages from the switch to implement above algorithm.
 		"""
 		packet = event.parsed
-		tcpp = event.parsed.find('tcp')
-		udpp = event.parsed.find('udp')
-		'''tcpp=80'''
-
-		# flood, but don't install the rule
-		def flood (message = None):
-			""" Floods the packet """
-			msg = of.ofp_packet_out()
-			msg.actions.append(of.ofp_action_output(port = of.OFPP_FLOOD))
-			msg.data = event.ofp
-			msg.in_port = event.port
-			event.connection.send(msg)
-
-		def install_fwdrule(event,packet,outport):
-			msg = of.ofp_flow_mod()
-			msg.idle_timeout = 10
-			msg.hard_timeout = 30
-			msg.match = of.ofp_match.from_packet(packet, event.port)
-			msg.actions.append(of.ofp_action_output(port = outport))
-			msg.data = event.ofp
-			msg.in_port = event.port
-			event.connection.send(msg)
+		dpid = event.dpid
+		self.packet_in_count[dpid] += 1
+
+		if self.packet_in_rate:
+			bucket = self.packet_in_buckets.get(dpid)
+			if bucket is None:
+				bucket = self.packet_in_buckets[dpid] = TokenBucket(self.packet_in_rate, self.packet_in_burst)
+			if not bucket.consume():
+				self.packet_in_dropped[dpid] += 1
+				return
+
+		self.learn_host(event, packet)
 
+		if packet.dst.is_multicast:
+			self.flood(event)
+			return
 
-		def forward (message = None):
-			this_dpid = dpid_to_str(event.dpid)
+		service = self.classify(packet)
+		if service is None:
+			log.debug("Unknown traffic detected: %s -> %s, flooding", packet.src, packet.dst)
+			self.flood(event)
+			return
 
-			if packet.dst.is_multicast:
-				flood()
+		key = (dpid, packet.src, packet.dst, service[2])
+		queue = self.service_queues.get(service[2])
+		outport = None
+		multipath = self.multipath_table.get(key)
+		if multipath is not None:
+			index = self.select_path(packet, multipath[0])
+			outport = multipath[1][index]
+			self.multipath_rules[key[1:] + (index,)] += 1
+			# the flow is pinned to its own path, so its rule cannot be aggregated with other flows
+			service = (None, None, None)
+		if outport is None:
+			outport = self.forwarding_table.get(key)
+		if outport is None:
+			# no switch path, the destination host may be attached to this switch
+			location = self.hosts.lookup(packet.dst)
+			if location is not None and location[0] == dpid:
+				outport = location[1]
+			if outport is None:
+				log.debug("No mapping found for host %s, or because access for that dst port has been denied", packet.dst)
+				if self.drop_timeout:
+					self.install_droprule(event, packet, service)
 				return
+		self.install_fwdrule(event, packet, outport, service, queue)
+
+def launch(proactive=False, granularity='service', idle_timeout=10, hard_timeout=30, stats_interval=0,
+		   packet_in_rate=0, packet_in_burst=100, flood_threshold=3, flood_window=1, suppress_timeout=5,
+		   drop_timeout=0, max_paths=1, multipath_slack=0, rebalance_interval=0, host_timeout=300,
+		   queues=False, queue_stats_interval=0):
+	# discovery and spanning tree are only needed here, the emulation and benchmarks create CustomSlice without them
+	import pox.openflow.discovery
+	import pox.openflow.spanning_tree
 
-			log.debug("Got unicast packet for %s at %s (input port %d):", packet.dst, dpid_to_str(event.dpid), event.port)
-
-			try:
-				""" Add your logic here """
-
-				log.debug("--------------------Start Forwarding--------------------")
-
-				path_key = None
-				if udpp:
-					if udpp.dstport == 200: # Video Service
-						log.debug("Video directed traffic detected: %s -> %s", packet.src, packet.dst)
-					else:
-						log.debug("UDP traffic detected: %s -> %s (Port: %d)", packet.src, packet.dst, udpp.dstport)
-					path_key = (this_dpid, packet.src, packet.dst, 200)
-				elif tcpp:
-					if tcpp.dstport == 80 or tcpp.srcport == 80: # HTTP Service
-						log.debug("HTTP directed traffic detected: %s -> %s", packet.src, packet.dst)
-						path_key = (this_dpid, packet.src, packet.dst, 80)
-					elif tcpp.dstport == 200 or tcpp.srcport == 200: # need to check because traffic coming back from the server will have different dst port
-						log.debug("TCP traffic detected: %s (src port %s) -> %s (dst port %s)", packet.src, tcpp.srcport, packet.dst, tcpp.dstport)
-						path_key = (this_dpid, packet.src, packet.dst, 200)
-				else:
-					log.debug("Unknown traffic detected: %s -> %s, flooding", packet.src, packet.dst)
-					flood()
-					return
-
-				try:
-					next_hop_dpid = self.portmap[path_key]
-					outport = self.adjacency[this_dpid][next_hop_dpid]
-					log.debug("Forwarding to next hop: %s via port %d", next_hop_dpid, outport)
-					install_fwdrule(event, packet, outport)
-				except KeyError:
-					log.debug("No switch path found for %s -> %s", packet.src, packet.dst)
-					try:
-						outport = self.switch_to_hosts_ports[(this_dpid, packet.dst)]
-						log.debug("Forwarding to host %s via port %d", packet.dst, outport)
-						install_fwdrule(event, packet, outport)
-					except KeyError:
-						log.debug("No mapping found for host %s, or because access for that dst port has been denied", packet.dst)
-						return
-
-			except AttributeError:
-				log.debug("packet type has no transport ports, flooding")
-				# flood and install the flow table entry for the flood
-				install_fwdrule(event,packet,of.OFPP_FLOOD)
-
-			log.debug("--------------------End Forwarding--------------------")
-
-		forward()
-
-def launch():
 	# Ejecute spanning tree para evitar problemas con topologías con bucles
 	pox.openflow.discovery.launch()
 	pox.openflow.spanning_tree.launch()
 
-	core.registerNew(CustomSlice)
+	core.registerNew(CustomSlice, proactive=str_to_bool(proactive), granularity=granularity,
+					 idle_timeout=int(idle_timeout), hard_timeout=int(hard_timeout), stats_interval=int(stats_interval),
+					 packet_in_rate=float(packet_in_rate), packet_in_burst=int(packet_in_burst),
+					 flood_threshold=int(flood_threshold), flood_window=float(flood_window),
+					 suppress_timeout=int(suppress_timeout), drop_timeout=int(drop_timeout),
+					 max_paths=int(max_paths), multipath_slack=float(multipath_slack),
+					 rebalance_interval=int(rebalance_interval), host_timeout=int(host_timeout), queues=str_to_bool(queues),
+					 queue_stats_interval=int(queue_stats_interval))
 
@@ -8,7 +8,17 @@ from mininet.cli import CLI
 from mininet.nodelib import LinuxBridge
 from mininet.node import OVSSwitch
 from mininet.node import OVSKernelSwitch, UserSwitch
-import random
+import os
+import sys
+
+# mn --custom runs this file without __file__, the generator is then looked up in the working directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(globals().get('__file__', 'Topo.py'))))
+from topo_gen import random_topology, fat_tree, leaf_spine, load_topology
+
+# Per-slice switch queues: queue id -> share of the link bandwidth guaranteed to it (min-rate), every queue may
+# borrow up to the full link bandwidth. Queue 0 is the best-effort default for traffic of no slice.
+# Keep in sync with SERVICE_QUEUES and QUEUE_MIN_SHARE in Skeleton-Lab3.py.
+SLICE_QUEUES = {1: 0.6, 2: 0.3}
 
 class P32( Topo ):
     def __init__(self):
@@ -93,73 +103,31 @@ class P31( Topo ):
         self.addLink('s3','h4',port1=4, port2=1,**linkopts[1])
         
         
-class RandomTopo( Topo ):
-    "Simple topology example."
-    def __init__(self, N = 5):
+class GeneratedTopo( Topo ):
+    "Topology built from a topo_gen graph, or from the JSON file it was exported to."
+    def __init__(self, topology):
         # Initialize topology and default options
         Topo.__init__(self)
-        linkopts1 = {'bw':10, 'delay':'1ms', 'loss':0.1, 'max_queue_size':1000, 'use_htb':True}
-        linkopts2 = {'bw':100, 'delay':'10ms', 'loss':0.1, 'max_queue_size':1000, 'use_htb':True}
-        linkopts3 = {'bw':1000, 'delay':'50ms', 'loss':0.1, 'max_queue_size':1000, 'use_htb':True}
-        linkopts = [linkopts1, linkopts2, linkopts3]
-        #N = 6
-        n = list(range(1,(N+1)))
-        init_node = random.choice(n) #Beginning node
-        link_count = random.randrange(N-1,(N*N-N)/2) #Number of links
-        links = {} #List of created links
-        av_links = {}
-        for i in range(1,(N+1)):
-            av_links[i] = list(range(1,(N+1)))
-            av_links[i].remove(i)
-            links[i] = []
-        
-        edges = []
-        links_opt = []
-        
-        
-        while len(n) > 1: #Generate at least a connected graph
-            n.remove(init_node)
-            end_node = random.choice(n)
-            lo = random.choice(linkopts)
-            links[end_node] = links[end_node] + [init_node,lo]
-            av_links[end_node].remove(init_node)
-            links[init_node] = links[init_node] + [end_node,lo]
-            av_links[init_node].remove(end_node)
-            e = (init_node,end_node)
-            edges.append(e)
-            links_opt.append(lo)
-            init_node = end_node
-        
-        
-        for j in range(1,link_count-(N-2)):
-            av_node = list(range(1,N+1))
-            f_links_node = []
-            for k in  range(1,N):
-                if not av_links[k]:
-                    av_node.remove(k)
-            init_node = random.choice(av_node)
-            av_node.remove(init_node)
-            lo = random.choice(linkopts)
-            end_node = random.choice(av_links[init_node])
-            links[end_node] = links[end_node] + [init_node,lo]
-            av_links[end_node].remove(init_node)
-            links[init_node] = links[init_node] + [end_node,lo]
-            av_links[init_node].remove(end_node)
-            e = (init_node,end_node)
-            edges.append(e)
-            links_opt.append(lo)
-        
-        
-        switches = []
-        for i in range(1,(N+1)):
-            sn = self.addSwitch('s%s' % i)
-            Host = self.addHost( 'h%s' % i, ip="10.0.0.%s/24" %i, mac="00:00:00:00:00:0%s" %i )
-            self.addLink(sn,Host)
-            switches.append(sn)
-            
-        for i in range(0,len(edges)):
-            self.addLink(switches[edges[i][0]-1],switches[edges[i][1]-1],**links_opt[i])
-            
+        if not isinstance(topology, dict):
+            topology = load_topology(topology)
+
+        for sn, dpid in topology['switches'].items():
+            self.addSwitch(sn, dpid=dpid.replace('-', '').rjust(16, '0'))
+        for hn, (sn, port) in topology['hosts'].items():
+            ip, mac = topology['addresses'][hn]
+            self.addHost(hn, ip=ip, mac=mac)
+            self.addLink(sn, hn, port1=port, **topology['host_links'].get(hn, {}))
+        for link in topology['links']:
+            sn1, port1, sn2, port2 = link[:4]
+            linkopts = link[4] if len(link) > 4 else {}
+            self.addLink(sn1, sn2, port1=port1, port2=port2, **linkopts)
+
+
+class RandomTopo( GeneratedTopo ):
+    "Random connected topology of N switches with a host each, reproducible with a seed."
+    def __init__(self, N = 5, seed = None):
+        GeneratedTopo.__init__(self, random_topology(N, seed=seed))
+
 
 class P41( Topo ):
     "Simple topology example."
@@ -188,5 +156,52 @@ class P41( Topo ):
         self.addLink(switches[4],switches[3],**linkopts[2])
         self.addLink(switches[4],switches[5],**linkopts[2])
 
-topos = { 'p3-2':  P32, 'p3-1': P31, 'p4-1': P41, 'p4-2':RandomTopo }
+topos = { 'p3-2':  P32, 'p3-1': P31, 'p4-1': P41, 'p4-2':RandomTopo,
+          'fat-tree': lambda k=4: GeneratedTopo(fat_tree(k, {'bw': 100})),
+          'leaf-spine': lambda leaves=4, spines=2, hosts=2: GeneratedTopo(leaf_spine(leaves, spines, hosts, {'bw': 100})),
+          'generated': GeneratedTopo }
+
+
+def configure_queues(net, queues=SLICE_QUEUES):
+    "Create an OVS linux-htb QoS with the slice queues on every switch port of a link with a bandwidth"
+    # the QoS replaces the htb qdisc TCLink put on the port, so its max-rate takes over the bandwidth limit
+    for link in net.links:
+        for intf in (link.intf1, link.intf2):
+            bw = intf.params.get('bw')
+            if not isinstance(intf.node, OVSSwitch) or not bw:
+                continue
+            rate = int(bw * 1e6)
+            cmd = ['ovs-vsctl -- set port %s qos=@qos' % intf.name,
+                   '-- --id=@qos create qos type=linux-htb other-config:max-rate=%d queues=%s' % (
+                       rate, ','.join('%d=@q%d' % (q, q) for q in [0] + sorted(queues))),
+                   '-- --id=@q0 create queue other-config:max-rate=%d' % rate]
+            for q, share in sorted(queues.items()):
+                cmd.append('-- --id=@q%d create queue other-config:min-rate=%d other-config:max-rate=%d' % (
+                    q, int(rate * share), rate))
+            intf.node.cmd(' '.join(cmd))
+
+
+def clear_queues(net):
+    "Remove the QoS and queues created by configure_queues"
+    for switch in net.switches:
+        for intf in switch.intfList():
+            if intf.name != 'lo':
+                switch.cmd('ovs-vsctl clear port %s qos' % intf.name)
+    net.switches[0].cmd('ovs-vsctl --all destroy qos -- --all destroy queue')
+
+
+def run(name='p3-2'):
+    "Start a topology with the slice queues against a remote controller, e.g. sudo python Topo.py p3-2"
+    net = Mininet(topo=topos[name](), link=TCLink, controller=None)
+    net.addController('c0', controller=RemoteController)
+    net.start()
+    configure_queues(net)
+    CLI(net)
+    clear_queues(net)
+    net.stop()
+
+
+if __name__ == '__main__':
+    setLogLevel('info')
+    run(*sys.argv[1:2])
 
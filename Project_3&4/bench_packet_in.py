@@ -0,0 +1,121 @@
+'''
+Microbenchmark of the PacketIn handler of CustomSlice (Skeleton-Lab3.py).
+
+Feeds synthetic PacketIn events for the P32 slices straight into the handler, no switches needed:
+    ./pox.py log.level --WARNING Skeleton-Lab3 bench_packet_in --packets=200000
+'''
+
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.lib.packet import ethernet, ipv4, tcp, udp
+from pox.lib.addresses import IPAddr, EthAddr
+import random
+import time
+
+log = core.getLogger()
+
+# (dpid1, port1, dpid2, port2) switch-to-switch links of P32, in the port order Mininet gives them in Topo.py
+P32_LINKS = [(1, 2, 2, 1), (1, 3, 4, 1), (2, 3, 3, 1), (2, 4, 5, 1), (3, 4, 6, 1),
+             (4, 2, 5, 2), (4, 3, 7, 1), (5, 3, 6, 2), (5, 4, 7, 2), (6, 3, 7, 3)]
+
+# (host, switch, port of the host at that switch) of P32
+P32_HOSTS = [(1, 1, 1), (2, 2, 2), (3, 3, 2), (4, 3, 3), (5, 7, 4), (6, 7, 5)]
+
+# (src host, dst host, protocol, service port, first switch, port of the host at that switch)
+P32_TRAFFIC = [(1, 5, udp, 200, 1, 1), (4, 5, tcp, 200, 3, 3), (1, 6, tcp, 80, 1, 1),
+               (2, 6, tcp, 80, 2, 2), (3, 6, tcp, 80, 3, 2)]
+
+
+class BenchConnection(object):
+    """
+    Stands in for a switch connection, only counts the messages the controller sends.
+    """
+
+    def __init__(self, dpid):
+        self.dpid = dpid
+        self.sent = 0
+
+    def send(self, msg):
+        self.sent += 1
+
+
+class BenchLink(object):
+    def __init__(self, dpid1, port1, dpid2, port2):
+        self.dpid1, self.port1, self.dpid2, self.port2 = dpid1, port1, dpid2, port2
+
+
+class BenchLinkEvent(object):
+    def __init__(self, link):
+        self.link = link
+        self.added = True
+        self.removed = False
+
+
+class BenchPacketIn(object):
+    """
+    PacketIn event with an already parsed packet, so only the handler itself is measured.
+    """
+
+    def __init__(self, connection, port, packet):
+        self.connection = connection
+        self.dpid = connection.dpid
+        self.port = port
+        self.parsed = packet
+        self.ofp = of.ofp_packet_in(in_port=port, buffer_id=1)
+
+
+def make_packet(src, dst, protocol, srcport, dstport):
+    """
+    Builds an ethernet/IPv4/TCP or UDP packet between two P32 hosts.
+    """
+    transport = protocol(srcport=srcport, dstport=dstport)
+    ip = ipv4(protocol=ipv4.TCP_PROTOCOL if protocol is tcp else ipv4.UDP_PROTOCOL,
+              srcip=IPAddr("10.0.0.%d" % src), dstip=IPAddr("10.0.0.%d" % dst))
+    ip.payload = transport
+    packet = ethernet(type=ethernet.IP_TYPE, src=EthAddr("00:00:00:00:00:%02x" % src),
+                      dst=EthAddr("00:00:00:00:00:%02x" % dst))
+    packet.payload = ip
+    return packet
+
+
+def run_benchmark(packets, flows, seed=1):
+    """
+    Runs the benchmark against the registered CustomSlice component.
+    :param packets: number of PacketIn events to handle
+    :param flows: number of distinct flows (ephemeral source ports) the events are spread over
+    :return: handled PacketIn events per second
+    """
+    custom_slice = core.CustomSlice
+    connections = dict((dpid, BenchConnection(dpid)) for dpid in range(1, 8))
+    for link in P32_LINKS:
+        custom_slice._handle_LinkEvent(BenchLinkEvent(BenchLink(*link)))
+    # every host announces itself once, so the controller learns where it is
+    for host, dpid, port in P32_HOSTS:
+        packet = make_packet(host, host, udp, 68, 67)
+        packet.dst = EthAddr("ff:ff:ff:ff:ff:ff")
+        custom_slice._handle_PacketIn(BenchPacketIn(connections[dpid], port, packet))
+
+    rng = random.Random(seed)
+    events = []
+    for i in range(flows):
+        src, dst, protocol, service, dpid, port = rng.choice(P32_TRAFFIC)
+        packet = make_packet(src, dst, protocol, rng.randint(1024, 65535), service)
+        events.append(BenchPacketIn(connections[dpid], port, packet))
+
+    handle = custom_slice._handle_PacketIn
+    start = time.time()
+    for i in range(packets):
+        handle(events[i % flows])
+    elapsed = time.time() - start
+    sent = sum(connection.sent for connection in connections.values())
+    log.warning("Handled %d PacketIn events over %d flows in %.3f s: %.0f PacketIn/s, %d messages sent",
+                packets, flows, elapsed, packets / elapsed, sent)
+    return packets / elapsed
+
+
+def launch(packets=100000, flows=1000):
+    def start():
+        run_benchmark(int(packets), int(flows))
+        core.quit()
+
+    core.call_when_ready(start, ['CustomSlice'])
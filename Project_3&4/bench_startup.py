@@ -0,0 +1,142 @@
+'''
+Startup benchmark of the POX controllers on the offline emulation of of_emulator.py, no Mininet needed.
+
+Every run restarts one controller in a fresh interpreter, next to an emulated network that is already up, and
+measures
+    import          importing the module file, with what it imports itself
+    construct       creating its component, what launch() does besides starting discovery and spanning tree
+    first flow_mod  from the start of the import to the first flow_mod a switch receives, once the switches have
+                    connected, the links are announced and, if that installed nothing, every host has sent a
+                    packet: the restart as the network sees it
+The controllers are TopologySlice on P31, CustomSlice (proactive) on P32, Firewall on the data-center tree and
+StatsCollector on P32, which installs no rules. --clutter leaves that many statistics files of earlier runs in
+the working directory first, --profile prints where import and construction spend their time (cProfile):
+    PYTHONPATH=~/pox python bench_startup.py --runs 5
+    PYTHONPATH=~/pox python bench_startup.py slice --profile
+'''
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# name -> (module file, component class, topology, component arguments)
+CONTROLLERS = {
+    'slice': ('topologySlice.py', 'TopologySlice', 'slices-p31.json', {}),
+    'custom': ('Skeleton-Lab3.py', 'CustomSlice', 'p32.json', {'proactive': True}),
+    'firewall': (os.path.join('..', 'Project_2', 'Skeleton-Lab-2.py'), 'Firewall', 'data_center_tree', {}),
+    'stats': (os.path.join('..', 'Project_Final', 'sdn_statistics.py'), 'StatsCollector', 'p32.json',
+              {'timer_interval': 3600}),
+}
+FIREWALL_POLICIES = os.path.join(HERE, '..', 'Project_2', 'firewall-policies.csv')
+
+
+def restart(name, directory, profile=False):
+    """
+    Starts one controller next to a fresh emulated network, in this interpreter.
+    :return: dict of the import, construct and first flow_mod times in s, the last None if no rule was installed
+    """
+    sys.path.insert(0, HERE)
+    from of_emulator import Emulation, load_module
+    from topo_gen import data_center_tree
+    from pox.core import core
+
+    path, class_name, topology, kwargs = CONTROLLERS[name]
+    emulation = Emulation(data_center_tree(2) if topology == 'data_center_tree' else os.path.join(HERE, topology))
+    if class_name == 'StatsCollector':
+        kwargs = dict(kwargs, stats_dir=os.path.join(directory, 'stats'))
+    profiler = cProfile.Profile() if profile else None
+
+    start = time.time()
+    if profiler:
+        profiler.enable()
+    module = load_module(os.path.join(HERE, path))
+    imported = time.time()
+    if class_name == 'Firewall':
+        module.policyFile = FIREWALL_POLICIES
+    core.register(class_name, getattr(module, class_name)(**kwargs))
+    constructed = time.time()
+    if profiler:
+        profiler.disable()
+    emulation.start()
+    if emulation.first_flow_mod is None:
+        # reactive controllers install their first rules for the first packets of the hosts
+        emulation.announce_hosts()
+
+    if profiler:
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats('cumulative').print_stats(20)
+    first = emulation.first_flow_mod
+    return {'import': imported - start, 'construct': constructed - imported,
+            'first_flow_mod': first - start if first is not None else None}
+
+
+def run_child(name, clutter, profile):
+    """
+    Runs one restart in a fresh interpreter, in a working directory with clutter statistics files.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        for i in range(clutter):
+            with open(os.path.join(directory, 'flow_stats_%d.txt' % i), 'w') as f:
+                f.write("earlier run\n")
+        command = [sys.executable, os.path.abspath(__file__), '--child', name] + (['--profile'] if profile else [])
+        process = subprocess.run(command, cwd=directory, stdout=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            raise RuntimeError("restart of %s failed with exit code %d" % (name, process.returncode))
+        return json.loads(process.stdout.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(directory)
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+
+def milliseconds(value):
+    return "%10.1f" % (value * 1000) if value is not None else "%10s" % "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the startup of the POX controllers on the emulation")
+    parser.add_argument('controllers', nargs='*', metavar='controller',
+                        help="controller to restart, one of %s, all by default" % ", ".join(sorted(CONTROLLERS)))
+    parser.add_argument('--runs', type=int, default=5, help="restarts per controller, the medians are reported")
+    parser.add_argument('--clutter', type=int, default=0,
+                        help="statistics files of earlier runs left in the working directory")
+    parser.add_argument('--profile', action='store_true', help="print the cProfile of import and construction")
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    for name in args.controllers:
+        if name not in CONTROLLERS:
+            parser.error("unknown controller %s, choose from %s" % (name, ", ".join(sorted(CONTROLLERS))))
+
+    if args.child:
+        import logging
+        logging.basicConfig(level=logging.ERROR)
+        print(json.dumps(restart(args.child, os.getcwd(), args.profile)))
+        return
+
+    print("%-10s %10s %10s %10s   (ms, median of %d runs)" % ("controller", "import", "construct", "flow_mod",
+                                                               args.runs))
+    for name in args.controllers or sorted(CONTROLLERS):
+        # only the first run is profiled, the others would print the same
+        runs = [run_child(name, args.clutter, args.profile and run == 0) for run in range(args.runs)]
+        first = [run['first_flow_mod'] for run in runs if run['first_flow_mod'] is not None]
+        print("%-10s %s %s %s" % (name, milliseconds(median([run['import'] for run in runs])),
+                                  milliseconds(median([run['construct'] for run in runs])),
+                                  milliseconds(median(first) if first else None)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+'''
+Controller scenarios on the offline OpenFlow emulation of of_emulator.py, no Mininet VM needed.
+
+Every scenario checks reachability and isolation automatically and reports the controller decisions per second:
+    p32        CustomSlice (Skeleton-Lab3.py) on P32: the slice demands and many random flows over them
+    p32-unbuffered
+               the same with switches that send every packet to the controller in full, like Open vSwitch 2.7+
+    p31        TopologySlice (topologySlice.py) on P31: the upper and lower slices
+    firewall   Firewall (Project_2) with l2_learning on the CustomTopo data-center tree
+    stats      StatsCollector (Project_Final) next to CustomSlice on P32: one round of statistics
+
+Run with POX on the PYTHONPATH, from any directory:
+    PYTHONPATH=~/pox python emulate.py p32 --flows 10000
+'''
+
+import argparse
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from of_emulator import Emulation, load_module
+from topo_gen import data_center_tree
+from pox.core import core
+
+# (client, server, service port) demands of CustomSlice on P32
+P32_DEMANDS = [('h1', 'h5', 200), ('h4', 'h5', 200), ('h1', 'h6', 80), ('h2', 'h6', 80), ('h3', 'h6', 80)]
+# (protocol, port) of the test traffic and the service slice CustomSlice sends it over
+P32_SERVICES = [('tcp', 80, 80), ('tcp', 200, 200), ('udp', 200, 200)]
+
+P31_SLICES = [set(['h1', 'h3']), set(['h2', 'h4'])]
+
+FIREWALL_BLOCKED = [('h1', 'h2'), ('h3', 'h8')]
+
+SCENARIOS = ['p32', 'p32-unbuffered', 'p31', 'firewall', 'stats']
+
+
+def describe(violations):
+    """
+    Formats the violations returned by Emulation.check_reachability.
+    """
+    return ["%s -> %s %s/%d should%s reach it, reached %s" % (
+        expectation[0], expectation[1], expectation[2], expectation[3], "" if expectation[4] else " not",
+        ", ".join(delivered) or "nothing") for expectation, delivered in violations]
+
+
+def report(name, emulation, violations, elapsed):
+    for violation in violations:
+        print("  violation: %s" % violation)
+    print("%s: %d violations, %s, %.2f s" % (name, len(violations), emulation.report(), elapsed))
+    return len(violations)
+
+
+def p32_expectations(emulation):
+    allowed = set()
+    for client, server, service in P32_DEMANDS:
+        allowed.add((client, server, service))
+        allowed.add((server, client, service))
+    expected = []
+    for src in sorted(emulation.hosts):
+        for dst in sorted(emulation.hosts):
+            if src == dst:
+                continue
+            # CustomSlice delivers between hosts of the same switch without a slice
+            local = emulation.hosts[src][0] == emulation.hosts[dst][0]
+            for protocol, port, service in P32_SERVICES:
+                expected.append((src, dst, protocol, port, local or (src, dst, service) in allowed))
+    return expected
+
+
+def run_p32(flows, seed, name='p32', buffered=True):
+    start = time.time()
+    emulation = Emulation(os.path.join(HERE, 'p32.json'), buffered)
+    emulation.load_controller(os.path.join(HERE, 'Skeleton-Lab3.py'), 'CustomSlice')
+    emulation.start()
+    emulation.announce_hosts()
+    violations = describe(emulation.check_reachability(p32_expectations(emulation)))
+
+    rng = random.Random(seed)
+    delivered = 0
+    for i in range(flows):
+        client, server, service = rng.choice(P32_DEMANDS)
+        protocol = rng.choice([protocol for protocol, port, flow_service in P32_SERVICES if flow_service == service])
+        trace = emulation.send(client, server, protocol, service)
+        delivered += server in trace.delivered
+    print("%s: %d of %d random slice flows delivered" % (name, delivered, flows))
+    return report(name, emulation, violations, time.time() - start)
+
+
+def run_p31():
+    start = time.time()
+    emulation = Emulation(os.path.join(HERE, 'slices-p31.json'))
+    emulation.load_controller(os.path.join(HERE, 'topologySlice.py'), 'TopologySlice')
+    emulation.start()
+    domains = {}
+    for slice_hosts in P31_SLICES:
+        for host in slice_hosts:
+            domains[host] = slice_hosts
+    expected = [(src, dst, protocol, port, dst in domains[src])
+                for src in sorted(emulation.hosts) for dst in sorted(emulation.hosts) if src != dst
+                for protocol, port in [('tcp', 80), ('udp', 5001)]]
+    violations = describe(emulation.check_reachability(expected, domains))
+    return report("p31", emulation, violations, time.time() - start)
+
+
+def run_firewall():
+    start = time.time()
+    from pox.forwarding.l2_learning import l2_learning
+    emulation = Emulation(data_center_tree(2))
+    directory = tempfile.mkdtemp()
+    try:
+        policy_file = os.path.join(directory, 'firewall-policies.csv')
+        with open(policy_file, 'w') as f:
+            f.write("id,mac_0,mac_1\n")
+            for i, (host_0, host_1) in enumerate(FIREWALL_BLOCKED):
+                f.write("%d,%s,%s\n" % (i + 1, emulation.hosts[host_0][3], emulation.hosts[host_1][3]))
+        firewall_module = load_module(os.path.join(HERE, '..', 'Project_2', 'Skeleton-Lab-2.py'))
+        firewall_module.policyFile = policy_file
+        core.register('Firewall', firewall_module.Firewall())
+    finally:
+        shutil.rmtree(directory)
+    core.register('l2_learning', l2_learning(False))
+    emulation.start()
+
+    blocked = set(FIREWALL_BLOCKED) | set((host_1, host_0) for host_0, host_1 in FIREWALL_BLOCKED)
+    hosts = set(emulation.hosts)
+    # l2_learning floods to unknown destinations, so every host may see the packets
+    domains = dict((host, hosts) for host in hosts)
+    expected = [(src, dst, 'tcp', 80, (src, dst) not in blocked)
+                for src in sorted(hosts) for dst in sorted(hosts) if src != dst]
+    violations = describe(emulation.check_reachability(expected, domains))
+    return report("firewall", emulation, violations, time.time() - start)
+
+
+def run_stats(flows):
+    start = time.time()
+    directory = tempfile.mkdtemp()
+    try:
+        emulation = Emulation(os.path.join(HERE, 'p32.json'))
+        # StatsCollector reads the IP addresses of every flow entry, so the rules match the full packet header
+        emulation.load_controller(os.path.join(HERE, 'Skeleton-Lab3.py'), 'CustomSlice', granularity='exact')
+        collector = emulation.load_controller(os.path.join(HERE, '..', 'Project_Final', 'sdn_statistics.py'),
+                                              'StatsCollector', timer_interval=3600, stats_dir=directory)
+        emulation.start()
+        emulation.announce_hosts()
+        for i in range(flows):
+            client, server, service = P32_DEMANDS[i % len(P32_DEMANDS)]
+            emulation.send(client, server, 'tcp', service)
+        emulation.advance(5)
+        collector._timer_func()
+        written = sorted(name for name in os.listdir(collector.run_dir) if name.startswith(('flow_stats', 'port_stats')))
+        flow_entries = sum(len(stats.get('flow_stats', [])) for stats in collector.stats.values())
+        print("stats: %d flow entries collected from %d switches, files written: %s" % (
+            flow_entries, len(collector.stats), ", ".join(written)))
+        violations = ["no flow statistics from %s" % name for name, switch in sorted(emulation.switches.items())
+                      if 'flow_stats' not in collector.stats.get(switch.dpid, {})]
+    finally:
+        shutil.rmtree(directory)
+    return report("stats", emulation, violations, time.time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run controller scenarios on the offline OpenFlow emulation")
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help="scenario to run, one of %s, all by default" % ", ".join(SCENARIOS))
+    parser.add_argument('--flows', type=int, default=1000, help="number of random flows of the p32 scenario")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('-v', '--verbose', action='store_true', help="show the controller debug log")
+    args = parser.parse_args()
+    for scenario in args.scenarios:
+        if scenario not in SCENARIOS:
+            parser.error("unknown scenario %s, choose from %s" % (scenario, ", ".join(SCENARIOS)))
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    violations = 0
+    for scenario in args.scenarios or SCENARIOS:
+        if scenario == 'p32':
+            violations += run_p32(args.flows, args.seed)
+        elif scenario == 'p32-unbuffered':
+            violations += run_p32(args.flows, args.seed, scenario, buffered=False)
+        elif scenario == 'p31':
+            violations += run_p31()
+        elif scenario == 'firewall':
+            violations += run_firewall()
+        elif scenario == 'stats':
+            violations += run_stats(min(args.flows, 100))
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == '__main__':
+    main()
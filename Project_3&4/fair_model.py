@@ -0,0 +1,347 @@
+'''
+Analytical fluid model of a topology: max-min fair flow rates, link utilization and expected RTT and loss.
+
+It predicts the bottlenecks of a topology from its link options (bw in Mbit/s, delay, loss in percent,
+max_queue_size) before emulating it. Every link is full duplex, every flow follows its shortest path (or an
+explicit switch path) and gets its max-min fair rate, computed by progressive filling: all unfrozen flows grow
+at the same pace until a link saturates or a flow reaches its demand, then the flows of that link, or that
+flow, are frozen. Every link that is the bottleneck of all its flows is frozen in the same round and a round is
+a handful of numpy operations over all (flow, link) pairs, so thousands of links and flows take well under a
+second.
+
+With --tcp the demand of a flow is capped by the Mathis throughput of a TCP connection over its path loss
+and RTT, which makes the rates comparable with iperf. The loaded RTT adds a full queue on every saturated link,
+comparable with a ping under load.
+
+Topologies are in the layout of topo_gen.py: a JSON file, a generator ("tree:3", "fat-tree:4") or a Mininet
+topology of Topo.py ("p4-1", needs Mininet):
+    python fair_model.py p32.json --flows h1:h5,h4:h5,h1:h6 --tcp
+    python fair_model.py fat-tree:8 --pattern all-pairs --top 5
+    python fair_model.py --measured ../Project_1/run1.json --tcp
+'''
+
+import argparse
+from collections import defaultdict
+import json
+import math
+import re
+
+import numpy as np
+
+from topo_gen import data_center_tree, fat_tree, load_topology
+
+# Relative tolerance of the progressive filling, a link is saturated below EPSILON of its capacity left
+EPSILON = 1e-9
+# Packets netem queues when a link has no max_queue_size
+DEFAULT_QUEUE = 1000
+MTU = 1500
+MSS = 1460
+DELAY = re.compile(r'^\s*([\d.]+)\s*(s|ms|us)?\s*$')
+DELAY_UNITS = {'s': 1.0, 'ms': 1e-3, 'us': 1e-6, None: 1e-6}
+
+
+def parse_delay(delay):
+    """
+    Parses a Mininet delay like "10ms" into seconds, a number without unit is in microseconds like for tc.
+    """
+    if delay is None:
+        return 0.0
+    match = DELAY.match(str(delay))
+    if match is None:
+        raise ValueError("Invalid delay %r" % (delay,))
+    return float(match.group(1)) * DELAY_UNITS[match.group(2)]
+
+
+def topology_from_topo(topo):
+    """
+    Converts a Mininet Topo (e.g. P41 of Topo.py) to the topo_gen layout.
+    """
+    switches = dict((switch, switch) for switch in topo.switches())
+    hosts, host_links, links = {}, {}, []
+    for node1, node2, info in topo.links(sort=True, withInfo=True):
+        opts = dict((key, value) for key, value in info.items()
+                    if key in ('bw', 'delay', 'loss', 'max_queue_size'))
+        if node1 in switches and node2 in switches:
+            links.append([node1, info['port1'], node2, info['port2'], opts])
+        else:
+            host, switch, port = (node1, node2, info['port2']) if node2 in switches else (node2, node1, info['port1'])
+            hosts[host] = [switch, port]
+            host_links[host] = opts
+    return {'name': type(topo).__name__, 'switches': switches, 'links': links, 'hosts': hosts,
+            'host_links': host_links}
+
+
+def max_min_rates(flow_index, link_index, capacity, demand):
+    """
+    Max-min fair rates by progressive filling.
+    Instead of raising all the rates in small steps, every round freezes at once the flows of each link whose
+    fair share (capacity left / unfrozen flows) is the lowest share on the paths of all its flows, at that share,
+    and the flows whose demand is below the shares on their path, at their demand.
+    :param flow_index: flow of every (flow, link) entry, sorted, every flow has at least one entry
+    :param link_index: link of every entry
+    :param capacity: capacity per link, inf for unlimited links
+    :param demand: demand per flow, inf for elastic flows
+    :return: (rate per flow, bottleneck link per flow or -1 if limited by its demand)
+    """
+    flows, links = len(demand), len(capacity)
+    rates = np.zeros(flows)
+    bottleneck = np.full(flows, -1)
+    residual = capacity.astype(float)
+    active = demand > 0
+    while active.any():
+        entries = active[flow_index]
+        flow_entries, link_entries = flow_index[entries], link_index[entries]
+        count = np.bincount(link_entries, minlength=links)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            share = np.where(count > 0, residual / count, np.inf)
+        # lowest share on the path of every unfrozen flow, the entries stay sorted by flow
+        starts = np.flatnonzero(np.r_[True, flow_entries[1:] != flow_entries[:-1]])
+        path_share = np.full(flows, np.inf)
+        path_share[flow_entries[starts]] = np.minimum.reduceat(share[link_entries], starts)
+        limit = np.minimum(path_share, demand)
+        # lowest limit of the flows crossing every link
+        level = np.full(links, np.inf)
+        np.minimum.at(level, link_entries, limit[flow_entries])
+        saturated = np.isfinite(share) & (share <= level * (1 + EPSILON))
+        crossing = np.bincount(flow_entries, weights=saturated[link_entries], minlength=flows) > 0
+        frozen = active & (crossing | (np.isfinite(demand) & (demand <= path_share * (1 + EPSILON))))
+        if not frozen.any():
+            # the remaining flows are elastic and cross only unlimited links
+            rates[active] = np.inf
+            break
+        rates[frozen] = limit[frozen]
+        residual -= np.bincount(link_entries, weights=np.where(frozen[flow_entries], limit[flow_entries], 0),
+                                minlength=links)
+        limited = frozen[flow_entries] & saturated[link_entries]
+        bottleneck[flow_entries[limited]] = link_entries[limited]
+        active &= ~frozen
+    return rates, bottleneck
+
+
+class FluidModel(object):
+    """
+    Directed links and shortest path routes of a topology.
+    """
+
+    def __init__(self, topology):
+        self.topology = topology
+        self.links = [] # (node, node) per direction
+        self.link_ids = {}
+        self.capacity, self.delay, self.loss, self.queue = [], [], [], []
+        self.graph = dict((switch, []) for switch in topology['switches'])
+        self.host_switch = {}
+        for link in topology['links']:
+            self.add_link(link[0], link[2], link[4] if len(link) > 4 else {})
+            self.graph[link[0]].append(link[2])
+            self.graph[link[2]].append(link[0])
+        for host, (switch, port) in topology['hosts'].items():
+            self.add_link(host, switch, topology.get('host_links', {}).get(host, {}))
+            self.host_switch[host] = switch
+        self.capacity = np.array(self.capacity, dtype=float)
+        self.delay = np.array(self.delay)
+        self.loss = np.array(self.loss)
+        self.queue = np.array(self.queue)
+        for neighbours in self.graph.values():
+            neighbours.sort()
+        self.parents = {}
+
+    def add_link(self, node1, node2, opts):
+        # the two directions get consecutive ids, so link ^ 1 is the reverse of link
+        for link in ((node1, node2), (node2, node1)):
+            self.link_ids[link] = len(self.links)
+            self.links.append(link)
+            self.capacity.append(opts.get('bw') or np.inf)
+            self.delay.append(parse_delay(opts.get('delay')))
+            self.loss.append(opts.get('loss', 0) / 100.0)
+            self.queue.append(opts.get('max_queue_size') or DEFAULT_QUEUE)
+
+    def route(self, src, dst, path=None):
+        """
+        Link ids from host src to host dst, over the switch path or else the BFS shortest path.
+        """
+        if path is None:
+            root, target = self.host_switch[src], self.host_switch[dst]
+            if root not in self.parents:
+                parent = {root: None}
+                queue = [root]
+                for switch in queue:
+                    for neighbour in self.graph[switch]:
+                        if neighbour not in parent:
+                            parent[neighbour] = switch
+                            queue.append(neighbour)
+                self.parents[root] = parent
+            parent = self.parents[root]
+            if target not in parent:
+                raise ValueError("%s cannot reach %s" % (src, dst))
+            path = [target]
+            while parent[path[-1]] is not None:
+                path.append(parent[path[-1]])
+            path.reverse()
+        nodes = [src] + list(path) + [dst]
+        try:
+            return [self.link_ids[(nodes[i], nodes[i + 1])] for i in range(len(nodes) - 1)]
+        except KeyError as e:
+            raise ValueError("No link %s-%s on the path of %s -> %s" % (e.args[0][0], e.args[0][1], src, dst))
+
+    def entries(self, routes):
+        flow_index = np.repeat(np.arange(len(routes)), [len(route) for route in routes])
+        link_index = np.array([link for route in routes for link in route], dtype=int)
+        return flow_index, link_index
+
+    def solve(self, flows, demands=None, tcp=False):
+        """
+        Computes the max-min fair rates of flows that run at the same time.
+        :param flows: list of (src host, dst host) or (src host, dst host, switch path)
+        :param demands: demand per flow in Mbit/s, None or inf for elastic flows
+        :param tcp: cap every flow at the Mathis throughput of its path loss and RTT
+        :return: dict of per-flow arrays (rate, bottleneck, rtt, rtt_loaded and loss, RTTs in ms) and per-link
+        arrays (load, utilization)
+        """
+        routes = [self.route(*flow) for flow in flows]
+        # replies and ACKs take the reverse path
+        replies = [[link ^ 1 for link in reversed(route)] for route in routes]
+        flow_index, link_index = self.entries(routes)
+        reply_flow_index, reply_link_index = self.entries(replies)
+        count = len(flows)
+
+        one_way = np.bincount(flow_index, weights=self.delay[link_index], minlength=count)
+        rtt = one_way + np.bincount(reply_flow_index, weights=self.delay[reply_link_index], minlength=count)
+        loss = 1 - np.exp(np.bincount(flow_index, weights=np.log1p(-self.loss[link_index]), minlength=count))
+        demand = np.array([np.inf if d is None else d for d in demands], dtype=float) if demands is not None \
+            else np.full(count, np.inf)
+        if tcp:
+            with np.errstate(divide='ignore'):
+                mathis = MSS * 8 / rtt * math.sqrt(1.5) / np.sqrt(loss) / 1e6
+            demand = np.minimum(demand, mathis)
+
+        rate, bottleneck = max_min_rates(flow_index, link_index, self.capacity, demand)
+        load = np.bincount(link_index, weights=rate[flow_index], minlength=len(self.links))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            utilization = np.where(np.isfinite(self.capacity), load / self.capacity, 0)
+            # a saturated link adds a full queue, of max_queue_size packets, to the RTT
+            queueing = np.where(utilization >= 1 - 1e-6, self.queue * MTU * 8 / (self.capacity * 1e6), 0)
+        rtt_loaded = rtt + np.bincount(flow_index, weights=queueing[link_index], minlength=count) + \
+            np.bincount(reply_flow_index, weights=queueing[reply_link_index], minlength=count)
+        return {'rate': rate, 'bottleneck': bottleneck, 'rtt': 1000 * rtt, 'rtt_loaded': 1000 * rtt_loaded,
+                'loss': loss, 'load': load, 'utilization': utilization}
+
+
+def load(name):
+    """
+    Loads a topology from a JSON file, a topo_gen generator ("tree:3", "fat-tree:4") or Topo.py ("p4-1").
+    """
+    kind, _, argument = name.partition(':')
+    if kind == 'tree':
+        return data_center_tree(int(argument or 2), {'bw': 10, 'delay': '50ms', 'loss': 0.1},
+                                {'bw': 100, 'delay': '10ms', 'loss': 0.1}, {'bw': 1000, 'delay': '1ms', 'loss': 0.1})
+    if kind == 'fat-tree':
+        return fat_tree(int(argument or 4), {'bw': 100})
+    if name.endswith('.json'):
+        return load_topology(name)
+    from Topo import topos
+    return topology_from_topo(topos[name]())
+
+
+def report(model, flows, result, top=10):
+    lines = []
+    order = np.argsort(-result['utilization'])[:top]
+    lines.append("Most utilized links:")
+    for link in order:
+        lines.append("  %s -> %s: %.2f of %.6g Mbit/s, %.1f%%" % (
+            model.links[link][0], model.links[link][1], result['load'][link], model.capacity[link],
+            100 * result['utilization'][link]))
+    lines.append("Flows:")
+    for i, flow in enumerate(flows[:top]):
+        bottleneck = result['bottleneck'][i]
+        lines.append("  %s -> %s: %.3f Mbit/s (%s), RTT %.1f ms, %.1f ms loaded, loss %.2f%%" % (
+            flow[0], flow[1], result['rate'][i],
+            "%s -> %s" % model.links[bottleneck] if bottleneck >= 0 else "demand",
+            result['rtt'][i], result['rtt_loaded'][i], 100 * result['loss'][i]))
+    if len(flows) > top:
+        lines.append("  ... %d more" % (len(flows) - top))
+    rates = result['rate']
+    lines.append("%d flows, rate min %.3f, mean %.3f, max %.3f Mbit/s, %d saturated links" % (
+        len(flows), rates.min(), rates.mean(), rates.max(), int((result['utilization'] >= 1 - 1e-6).sum())))
+    return "\n".join(lines)
+
+
+def compare_measured(measured, tcp=True):
+    """
+    Models the rounds of a perf_runner.py run on CustomTopo and compares them with the measurements.
+    :return: list of (src, dst, modeled rate, measured rate, modeled loaded RTT, measured RTT)
+    """
+    settings = measured['settings']
+    model = FluidModel(data_center_tree(settings['fanout'], *settings['linkopts']))
+    rounds = defaultdict(list)
+    for pair in measured['pairs']:
+        rounds[pair.get('round', 0)].append(pair)
+    rows = []
+    for number, pairs in sorted(rounds.items()):
+        result = model.solve([(pair['src'], pair['dst']) for pair in pairs], tcp=tcp)
+        for i, pair in enumerate(pairs):
+            rows.append((pair['src'], pair['dst'], result['rate'][i], pair['throughput'], result['rtt_loaded'][i],
+                         pair['rtt']))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Max-min fair fluid model of a topology")
+    parser.add_argument('topology', nargs='?', help="JSON file, tree:FANOUT, fat-tree:K or a topology of Topo.py")
+    parser.add_argument('--flows', help="comma separated src:dst host pairs")
+    parser.add_argument('--pattern', choices=['all-pairs'], help="flows between every pair of hosts")
+    parser.add_argument('--matrix', help="traffic matrix JSON, {src: {dst: demand in Mbit/s}}")
+    parser.add_argument('--tcp', action='store_true', help="cap the flows at the TCP throughput of their path")
+    parser.add_argument('--measured', help="perf_runner.py results to compare the model with")
+    parser.add_argument('--top', type=int, default=10, help="links and flows to list")
+    parser.add_argument('-o', '--output', help="JSON file to write the per-flow and per-link results to")
+    args = parser.parse_args()
+
+    if args.measured:
+        with open(args.measured, 'r') as f:
+            rows = compare_measured(json.load(f), args.tcp)
+        errors = []
+        for src, dst, rate, throughput, rtt, measured_rtt in rows:
+            print("%s -> %s: model %.3f Mbit/s, measured %s, model RTT %.1f ms, measured %s" % (
+                src, dst, rate, "%.3f" % throughput if throughput is not None else "-", rtt,
+                "%.1f" % measured_rtt if measured_rtt is not None else "-"))
+            if throughput:
+                errors.append(abs(rate - throughput) / throughput)
+        if errors:
+            print("Mean relative throughput error: %.1f%% over %d pairs" % (100 * sum(errors) / len(errors),
+                                                                            len(errors)))
+        return
+
+    if not args.topology:
+        parser.error("a topology is needed unless --measured is given")
+    topology = load(args.topology)
+    model = FluidModel(topology)
+    demands = None
+    if args.matrix:
+        with open(args.matrix, 'r') as f:
+            matrix = json.load(f)
+        flows = [(src, dst) for src in sorted(matrix) for dst in sorted(matrix[src])]
+        demands = [matrix[src][dst] for src, dst in flows]
+    elif args.flows:
+        flows = [tuple(flow.split(':')) for flow in args.flows.split(',')]
+    elif args.pattern == 'all-pairs':
+        hosts = sorted(topology['hosts'])
+        flows = [(src, dst) for src in hosts for dst in hosts if src != dst]
+    else:
+        parser.error("give the flows with --flows, --pattern or --matrix")
+
+    result = model.solve(flows, demands, args.tcp)
+    print(report(model, flows, result, args.top))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'flows': [{'src': flow[0], 'dst': flow[1], 'rate': float(result['rate'][i]),
+                           'rtt': float(result['rtt'][i]), 'rtt_loaded': float(result['rtt_loaded'][i]),
+                           'loss': float(result['loss'][i])} for i, flow in enumerate(flows)],
+                'links': [{'src': link[0], 'dst': link[1], 'capacity': float(model.capacity[i]),
+                           'load': float(result['load'][i]), 'utilization': float(result['utilization'][i])}
+                          for i, link in enumerate(model.links)],
+            }, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,649 @@
+'''
+Offline emulation of an OpenFlow network for the POX controllers, no Mininet needed.
+
+Emulation stands in for core.openflow and core.openflow_discovery: the switches of a topology file (topo_gen.py or
+slice spec layout) run in-process, keep the flow tables the controller builds, forward simulated packets through
+them, send PacketIns on table misses and answer barriers and stats requests. Everything runs synchronously, a
+packet has gone as far as it will go when send returns. The switches buffer the packets they send to the controller,
+or, with buffered=False, send them in full like Open vSwitch 2.7 and later. Flow mods and packet outs are packed and
+unpacked like over a real connection, so a flow_mod carrying an unbuffered packet is followed by its packet_out.
+
+    emulation = Emulation('p32.json')
+    emulation.load_controller('Skeleton-Lab3.py', 'CustomSlice')
+    emulation.start()
+    emulation.announce_hosts()
+    trace = emulation.send('h1', 'h6', 'tcp', 80)    # trace.delivered == ['h6']
+
+emulate.py runs the P32, P31, firewall and statistics scenarios on top of it.
+'''
+
+from collections import defaultdict, deque, OrderedDict
+import importlib.util
+import json
+import os
+import struct
+import sys
+import threading
+import time
+
+import pox.core
+if pox.core.core is None:
+    # not started by pox.py, bring up the POX core ourselves
+    pox.core.initialize()
+from pox.core import core
+import pox.openflow.libopenflow_01 as of
+from pox.openflow import OpenFlowNexus, ConnectionUp, PacketIn, FlowRemoved, BarrierIn, FlowStatsReceived, \
+    AggregateFlowStatsReceived, TableStatsReceived, PortStatsReceived, QueueStatsReceived
+from pox.openflow.discovery import Link, LinkEvent
+from pox.lib.revent import EventMixin
+from pox.lib.packet import ethernet, ipv4, tcp, udp, arp
+from pox.lib.addresses import IPAddr, EthAddr
+from pox.lib.util import str_to_dpid
+
+from topo_gen import host_address
+
+log = core.getLogger()
+
+# Packets a switch keeps buffered for the controller, the oldest are dropped first
+BUFFER_SIZE = 256
+
+NO_BUFFER = (None, -1, of.NO_BUFFER)
+
+
+def unpack_messages(data):
+    """
+    Splits packed OpenFlow messages, as sent in bulk by TopologySlice, into ofp objects.
+    """
+    messages = []
+    offset = 0
+    while offset < len(data):
+        msg_type = struct.unpack_from('!xB', data, offset)[0]
+        offset, msg = of._message_type_to_class[msg_type].unpack_new(data, offset)
+        messages.append(msg)
+    return messages
+
+
+def output_port(action):
+    """
+    Returns the port of an output or enqueue action and the queue of the latter, None for other actions.
+    """
+    if isinstance(action, of.ofp_action_output):
+        return action.port, None
+    if isinstance(action, of.ofp_action_enqueue):
+        return action.port, action.queue_id
+    return None, None
+
+
+class Trace(object):
+    """
+    What happened to a packet sent into the network: the hosts it reached, the PacketIns it caused, where it was
+    dropped and how often a flooded copy looped back.
+    """
+
+    def __init__(self, packet, size):
+        self.packet = packet
+        self.size = size
+        self.delivered = []
+        self.packet_ins = 0
+        self.drops = 0
+        self.loops = 0
+        # (dpid, in port) the packet has entered, a copy entering again is a forwarding loop
+        self.visited = set()
+
+
+class FlowEntry(object):
+    """
+    Flow table entry of an emulated switch, built from a flow_mod.
+    """
+
+    def __init__(self, msg, now):
+        self.match = msg.match
+        self.priority = msg.priority
+        self.actions = list(msg.actions)
+        self.cookie = msg.cookie
+        self.idle_timeout = msg.idle_timeout
+        self.hard_timeout = msg.hard_timeout
+        self.flags = msg.flags
+        self.created = self.last_used = now
+        self.packet_count = 0
+        self.byte_count = 0
+
+    def expiry_reason(self, now):
+        if self.hard_timeout and now - self.created >= self.hard_timeout:
+            return of.OFPRR_HARD_TIMEOUT
+        if self.idle_timeout and now - self.last_used >= self.idle_timeout:
+            return of.OFPRR_IDLE_TIMEOUT
+        return None
+
+    def outputs_to(self, port):
+        return port == of.OFPP_NONE or any(output_port(action)[0] == port for action in self.actions)
+
+    def duration(self, now):
+        duration = now - self.created
+        return int(duration), int((duration - int(duration)) * 1e9)
+
+
+class EmulatedSwitch(EventMixin):
+    """
+    In-process switch, doubles as its own controller connection.
+    """
+    _eventMixin_events = OpenFlowNexus._eventMixin_events
+
+    def __init__(self, emulation, name, dpid):
+        self.emulation = emulation
+        self.name = name
+        self.dpid = dpid
+        self.connect_time = None
+        # port -> ('switch', peer switch, peer port) or ('host', host name)
+        self.links = {}
+        # flow entries, highest priority first, entries of equal priority in the order they were added
+        self.table = []
+        self.buffers = OrderedDict()
+        self.next_buffer_id = 1
+        # packed packet -> trace of the packets sent to the controller in full, to follow them when they come back
+        self.unbuffered = OrderedDict()
+        self.lookup_count = 0
+        self.matched_count = 0
+        # port -> [rx packets, tx packets, rx bytes, tx bytes]
+        self.port_counters = defaultdict(lambda: [0, 0, 0, 0])
+        # (port, queue id) -> [tx packets, tx bytes]
+        self.queue_counters = defaultdict(lambda: [0, 0])
+
+    def __repr__(self):
+        return "EmulatedSwitch(%s)" % self.name
+
+    def features(self):
+        ports = [of.ofp_phy_port(port_no=port, name="%s-eth%d" % (self.name, port),
+                                 hw_addr=EthAddr("00:00:00:%02x:%02x:%02x" % (self.dpid >> 8 & 0xff, self.dpid & 0xff,
+                                                                              port & 0xff)))
+                 for port in sorted(self.links)]
+        return of.ofp_features_reply(datapath_id=self.dpid, ports=ports)
+
+    def raise_event(self, event_type, *args):
+        # like a POX connection: the nexus gets the event first, then the connection unless it was halted
+        event = core.openflow.raiseEventNoErrors(event_type, *args)
+        if event is None or not event.halt:
+            self.raiseEventNoErrors(event_type, *args)
+
+    ### Controller to switch ###
+
+    def send(self, data):
+        with self.emulation.lock:
+            self.emulation.messages += 1
+            if isinstance(data, (of.ofp_flow_mod, of.ofp_packet_out)):
+                # packed like a POX connection does, which is where the packet attached to them is resolved
+                data = data.pack()
+            if isinstance(data, bytes):
+                for msg in unpack_messages(data):
+                    self.handle_message(msg)
+            else:
+                self.handle_message(data)
+
+    def handle_message(self, msg):
+        if isinstance(msg, of.ofp_flow_mod):
+            if self.emulation.first_flow_mod is None:
+                self.emulation.first_flow_mod = time.time()
+            self.emulation.flow_mods += 1
+            self.flow_mod(msg)
+        elif isinstance(msg, of.ofp_packet_out):
+            self.packet_out(msg)
+        elif isinstance(msg, of.ofp_barrier_request):
+            self.emulation.schedule(self.raise_event, BarrierIn, self, of.ofp_barrier_reply(xid=msg.xid))
+        elif isinstance(msg, of.ofp_stats_request):
+            self.stats_request(msg)
+        else:
+            log.debug("%s ignores %s", self, type(msg).__name__)
+
+    def flow_mod(self, msg):
+        now = self.emulation.now
+        strict = msg.command in (of.OFPFC_MODIFY_STRICT, of.OFPFC_DELETE_STRICT)
+        if strict:
+            matching = [entry for entry in self.table if entry.priority == msg.priority and entry.match == msg.match]
+        else:
+            matching = [entry for entry in self.table if msg.match.matches_with_wildcards(entry.match)]
+
+        if msg.command in (of.OFPFC_DELETE, of.OFPFC_DELETE_STRICT):
+            for entry in matching:
+                if entry.outputs_to(msg.out_port):
+                    self.remove_entry(entry, of.OFPRR_DELETE)
+            return
+
+        if msg.command in (of.OFPFC_MODIFY, of.OFPFC_MODIFY_STRICT) and matching:
+            for entry in matching:
+                entry.actions = list(msg.actions)
+            actions = msg.actions
+        else:
+            # an add replaces the entry with the same match and priority
+            self.table = [entry for entry in self.table
+                          if entry.priority != msg.priority or entry.match != msg.match]
+            entry = FlowEntry(msg, now)
+            index = len(self.table)
+            while index > 0 and self.table[index - 1].priority < entry.priority:
+                index -= 1
+            self.table.insert(index, entry)
+            actions = entry.actions
+
+        if msg.buffer_id not in NO_BUFFER:
+            buffered = self.buffers.pop(msg.buffer_id, None)
+            if buffered is not None:
+                self.emulation.schedule(self.apply_actions, actions, *buffered)
+
+    def remove_entry(self, entry, reason):
+        self.table.remove(entry)
+        if entry.flags & of.OFPFF_SEND_FLOW_REM:
+            duration_sec, duration_nsec = entry.duration(self.emulation.now)
+            msg = of.ofp_flow_removed(match=entry.match, cookie=entry.cookie, priority=entry.priority, reason=reason,
+                                      duration_sec=duration_sec, duration_nsec=duration_nsec,
+                                      idle_timeout=entry.idle_timeout, packet_count=entry.packet_count,
+                                      byte_count=entry.byte_count)
+            self.emulation.schedule(self.raise_event, FlowRemoved, self, msg)
+
+    def expire(self, now):
+        for entry in list(self.table):
+            reason = entry.expiry_reason(now)
+            if reason is not None:
+                self.remove_entry(entry, reason)
+
+    def packet_out(self, msg):
+        if msg.buffer_id not in NO_BUFFER:
+            buffered = self.buffers.pop(msg.buffer_id, None)
+            if buffered is None:
+                log.debug("%s: packet out for unknown buffer %s", self, msg.buffer_id)
+                return
+            packet, in_port, trace = buffered
+        elif msg.data:
+            packet = ethernet(msg.data)
+            in_port = msg.in_port
+            trace = self.unbuffered.pop(msg.data, None) or Trace(packet, len(msg.data))
+        else:
+            return
+        self.emulation.schedule(self.apply_actions, msg.actions, packet, in_port, trace)
+
+    def stats_request(self, msg):
+        body = msg.body
+        now = self.emulation.now
+        if isinstance(body, of.ofp_flow_stats_request) or isinstance(body, of.ofp_aggregate_stats_request):
+            entries = [entry for entry in self.table
+                       if body.match.matches_with_wildcards(entry.match) and entry.outputs_to(body.out_port)]
+            if isinstance(body, of.ofp_flow_stats_request):
+                stats = []
+                for entry in entries:
+                    duration_sec, duration_nsec = entry.duration(now)
+                    stats.append(of.ofp_flow_stats(match=entry.match, duration_sec=duration_sec,
+                                                   duration_nsec=duration_nsec, priority=entry.priority,
+                                                   idle_timeout=entry.idle_timeout, hard_timeout=entry.hard_timeout,
+                                                   cookie=entry.cookie, packet_count=entry.packet_count,
+                                                   byte_count=entry.byte_count, actions=list(entry.actions)))
+                event_type = FlowStatsReceived
+            else:
+                stats = of.ofp_aggregate_stats(packet_count=sum(entry.packet_count for entry in entries),
+                                               byte_count=sum(entry.byte_count for entry in entries),
+                                               flow_count=len(entries))
+                event_type = AggregateFlowStatsReceived
+        elif isinstance(body, of.ofp_port_stats_request):
+            stats = []
+            for port in sorted(self.links):
+                if body.port_no in (port, of.OFPP_NONE):
+                    counters = self.port_counters[port]
+                    stats.append(of.ofp_port_stats(port_no=port, rx_packets=counters[0], tx_packets=counters[1],
+                                                   rx_bytes=counters[2], tx_bytes=counters[3]))
+            event_type = PortStatsReceived
+        elif isinstance(body, of.ofp_queue_stats_request):
+            stats = [of.ofp_queue_stats(port_no=port, queue_id=queue, tx_packets=counters[0], tx_bytes=counters[1])
+                     for (port, queue), counters in sorted(self.queue_counters.items())
+                     if body.port_no in (port, of.OFPP_ALL) and body.queue_id in (queue, of.OFPQ_ALL)]
+            event_type = QueueStatsReceived
+        elif isinstance(body, of.ofp_table_stats_request):
+            stats = [of.ofp_table_stats(table_id=0, name="emulated", active_count=len(self.table),
+                                        lookup_count=self.lookup_count, matched_count=self.matched_count)]
+            event_type = TableStatsReceived
+        else:
+            log.debug("%s ignores stats request %s", self, type(body).__name__)
+            return
+        reply = of.ofp_stats_reply(xid=msg.xid, body=stats)
+        self.emulation.schedule(self.raise_event, event_type, self, [reply], stats)
+
+    ### Data plane ###
+
+    def receive(self, packet, in_port, trace):
+        """
+        A packet enters the switch on a port.
+        """
+        if (self.dpid, in_port) in trace.visited:
+            trace.loops += 1
+            return
+        trace.visited.add((self.dpid, in_port))
+        counters = self.port_counters[in_port]
+        counters[0] += 1
+        counters[2] += trace.size
+        self.process(packet, in_port, trace)
+
+    def process(self, packet, in_port, trace):
+        """
+        Looks the packet up in the flow table, sending it to the controller on a miss.
+        """
+        self.lookup_count += 1
+        match = of.ofp_match.from_packet(packet, in_port)
+        for entry in self.table:
+            if entry.match.matches_with_wildcards(match, consider_other_wildcards=False):
+                self.matched_count += 1
+                entry.packet_count += 1
+                entry.byte_count += trace.size
+                entry.last_used = self.emulation.now
+                self.apply_actions(entry.actions, packet, in_port, trace)
+                return
+        self.packet_in(packet, in_port, trace, of.OFPR_NO_MATCH)
+
+    def packet_in(self, packet, in_port, trace, reason):
+        data = packet.pack()
+        if self.emulation.buffered:
+            buffer_id = self.next_buffer_id
+            self.next_buffer_id += 1
+            self.buffers[buffer_id] = (packet, in_port, trace)
+            if len(self.buffers) > BUFFER_SIZE:
+                self.buffers.popitem(last=False)
+        else:
+            buffer_id = None
+            self.unbuffered[data] = trace
+            if len(self.unbuffered) > BUFFER_SIZE:
+                self.unbuffered.popitem(last=False)
+        msg = of.ofp_packet_in(buffer_id=buffer_id, in_port=in_port, reason=reason, total_len=len(data), data=data)
+        trace.packet_ins += 1
+        self.emulation.schedule(self.emulation.deliver_packet_in, self, msg)
+
+    def apply_actions(self, actions, packet, in_port, trace):
+        outputs = [output_port(action) for action in actions]
+        outputs = [(port, queue) for port, queue in outputs if port is not None]
+        if not outputs:
+            trace.drops += 1
+        for port, queue in outputs:
+            if port == of.OFPP_IN_PORT:
+                self.transmit(packet, in_port, queue, trace)
+            elif port in (of.OFPP_FLOOD, of.OFPP_ALL):
+                for flood_port in sorted(self.links):
+                    if flood_port != in_port:
+                        self.transmit(packet, flood_port, None, trace)
+            elif port == of.OFPP_CONTROLLER:
+                self.packet_in(packet, in_port, trace, of.OFPR_ACTION)
+            elif port == of.OFPP_TABLE:
+                self.process(packet, in_port, trace)
+            else:
+                self.transmit(packet, port, queue, trace)
+
+    def transmit(self, packet, port, queue, trace):
+        peer = self.links.get(port)
+        if peer is None:
+            trace.drops += 1
+            return
+        counters = self.port_counters[port]
+        counters[1] += 1
+        counters[3] += trace.size
+        if queue is not None:
+            counters = self.queue_counters[(port, queue)]
+            counters[0] += 1
+            counters[1] += trace.size
+        if peer[0] == 'host':
+            trace.delivered.append(peer[1])
+        else:
+            peer_switch = self.emulation.switches[peer[1]]
+            self.emulation.schedule(peer_switch.receive, packet, peer[2], trace)
+
+
+class EmulatedNexus(EventMixin):
+    """
+    Stands in for core.openflow.
+    """
+    _eventMixin_events = OpenFlowNexus._eventMixin_events
+
+    def __init__(self):
+        self._connections = {}
+
+    @property
+    def connections(self):
+        # iterating the ConnectionDict of POX gives the connections
+        return list(self._connections.values())
+
+    def getConnection(self, dpid):
+        return self._connections.get(dpid)
+
+    def sendToDPID(self, dpid, data):
+        connection = self._connections.get(dpid)
+        if connection is None:
+            return False
+        connection.send(data)
+        return True
+
+
+class EmulatedDiscovery(EventMixin):
+    """
+    Stands in for core.openflow_discovery, raising the LinkEvents of the topology.
+    """
+    _eventMixin_events = set([LinkEvent])
+
+    def __init__(self):
+        self.adjacency = {}
+
+
+class Emulation(object):
+    """
+    A topology of emulated switches and hosts, registered as core.openflow and core.openflow_discovery.
+    """
+
+    def __init__(self, topology, buffered=True):
+        """
+        buffered - whether the switches buffer the packets of their PacketIns, False sends them in full
+        """
+        if not isinstance(topology, dict):
+            with open(topology, 'r') as f:
+                topology = json.load(f)
+        self.topology = topology
+        self.buffered = buffered
+        # emulated clock of the flow timeouts and stats, moved by advance
+        self.now = 0.0
+        self.lock = threading.RLock()
+        self.pending = deque()
+        self.running = False
+        # counters of the controller activity
+        self.messages = 0
+        self.flow_mods = 0
+        # wall-clock time the first flow_mod reached a switch, None before
+        self.first_flow_mod = None
+        self.packet_ins = 0
+        self.decision_time = 0.0
+        self.next_srcport = 1024
+
+        self.nexus = EmulatedNexus()
+        self.discovery = EmulatedDiscovery()
+        core.register('openflow', self.nexus)
+        core.register('openflow_discovery', self.discovery)
+
+        self.switches = {}
+        for name, dpid in topology['switches'].items():
+            self.switches[name] = EmulatedSwitch(self, name, str_to_dpid(dpid))
+        self.links = []
+        for link in topology.get('links', []):
+            sw1, port1, sw2, port2 = link[:4]
+            self.switches[sw1].links[port1] = ('switch', sw2, port2)
+            self.switches[sw2].links[port2] = ('switch', sw1, port1)
+            self.links.append((sw1, port1, sw2, port2))
+        # host -> (switch, port, IPAddr, EthAddr)
+        self.hosts = {}
+        addresses = topology.get('addresses', {})
+        for host, (switch, port) in topology.get('hosts', {}).items():
+            ip, mac = addresses[host] if host in addresses else host_address(int(host.lstrip('h')))
+            self.hosts[host] = (switch, port, IPAddr(ip.split('/')[0]), EthAddr(mac))
+            self.switches[switch].links[port] = ('host', host)
+
+    def load_controller(self, path, class_name, **kwargs):
+        """
+        Imports a controller module from its file and registers an instance of its component class, without
+        running its launch function (no discovery or spanning tree needed).
+        """
+        module = load_module(path)
+        component = getattr(module, class_name)(**kwargs)
+        core.register(class_name, component)
+        return component
+
+    ### Event processing ###
+
+    def schedule(self, function, *args):
+        self.pending.append((function, args))
+        if not self.running:
+            self.run()
+
+    def run(self):
+        """
+        Processes the pending switch work and events until the network is quiet.
+        """
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+            try:
+                while self.pending:
+                    function, args = self.pending.popleft()
+                    function(*args)
+            finally:
+                self.running = False
+
+    def deliver_packet_in(self, switch, msg):
+        self.packet_ins += 1
+        start = time.time()
+        switch.raise_event(PacketIn, switch, msg)
+        self.decision_time += time.time() - start
+
+    ### Topology events ###
+
+    def start(self):
+        """
+        Connects every switch and announces every link, like the switches and discovery of a fresh network.
+        """
+        for name in sorted(self.switches):
+            self.connect(name)
+        for sw1, port1, sw2, port2 in self.links:
+            self.link_event(sw1, port1, sw2, port2, True)
+
+    def connect(self, name):
+        switch = self.switches[name]
+        switch.connect_time = time.time()
+        self.nexus._connections[switch.dpid] = switch
+        self.schedule(switch.raise_event, ConnectionUp, switch, switch.features())
+
+    def link_event(self, sw1, port1, sw2, port2, added):
+        # discovery reports a link once per direction
+        dpid1, dpid2 = self.switches[sw1].dpid, self.switches[sw2].dpid
+        for link in (Link(dpid1, port1, dpid2, port2), Link(dpid2, port2, dpid1, port1)):
+            if added:
+                self.discovery.adjacency[link] = self.now
+            else:
+                self.discovery.adjacency.pop(link, None)
+            self.schedule(self.discovery.raiseEventNoErrors, LinkEvent, added, link)
+
+    def link_down(self, sw1, sw2):
+        """
+        Takes every link between two switches down, packets sent over them are dropped.
+        """
+        for link in [link for link in self.links if set((link[0], link[2])) == set((sw1, sw2))]:
+            self.links.remove(link)
+            del self.switches[link[0]].links[link[1]]
+            del self.switches[link[2]].links[link[3]]
+            self.link_event(link[0], link[1], link[2], link[3], False)
+
+    def advance(self, seconds):
+        """
+        Moves the emulated clock, expiring the flow entries whose timeout passed.
+        """
+        self.now += seconds
+        with self.lock:
+            for switch in self.switches.values():
+                switch.expire(self.now)
+        self.run()
+
+    ### Traffic ###
+
+    def make_packet(self, src, dst, protocol='tcp', dstport=80, srcport=None):
+        """
+        Builds an ethernet/IPv4/TCP or UDP packet between two hosts, with a fresh source port if none is given.
+        """
+        if srcport is None:
+            srcport = self.next_srcport
+            self.next_srcport = self.next_srcport + 1 if self.next_srcport < 65535 else 1024
+        src_ip, src_mac = self.hosts[src][2:]
+        dst_ip, dst_mac = self.hosts[dst][2:]
+        if protocol == 'tcp':
+            transport = tcp(srcport=srcport, dstport=dstport, off=5, win=65535)
+        else:
+            transport = udp(srcport=srcport, dstport=dstport)
+        ip = ipv4(protocol=ipv4.TCP_PROTOCOL if protocol == 'tcp' else ipv4.UDP_PROTOCOL, srcip=src_ip, dstip=dst_ip)
+        ip.payload = transport
+        packet = ethernet(type=ethernet.IP_TYPE, src=src_mac, dst=dst_mac)
+        packet.payload = ip
+        return packet
+
+    def inject(self, host, packet):
+        """
+        Sends a packet from a host and returns its Trace once the network is quiet.
+        """
+        switch, port = self.hosts[host][:2]
+        trace = Trace(packet, len(packet.pack()))
+        self.schedule(self.switches[switch].receive, packet, port, trace)
+        self.run()
+        return trace
+
+    def send(self, src, dst, protocol='tcp', dstport=80, srcport=None):
+        return self.inject(src, self.make_packet(src, dst, protocol, dstport, srcport))
+
+    def announce_hosts(self):
+        """
+        Every host broadcasts an ARP request for itself, so the controllers learn where the hosts are.
+        """
+        for host in sorted(self.hosts):
+            ip, mac = self.hosts[host][2:]
+            request = arp(opcode=arp.REQUEST, hwsrc=mac, hwdst=EthAddr("00:00:00:00:00:00"), protosrc=ip,
+                          protodst=ip)
+            packet = ethernet(type=ethernet.ARP_TYPE, src=mac, dst=EthAddr("ff:ff:ff:ff:ff:ff"))
+            packet.payload = request
+            self.inject(host, packet)
+
+    def check_reachability(self, expected, domains=None):
+        """
+        Sends a packet for every expectation and checks where it went.
+        :param expected: list of (src host, dst host, protocol, dst port, True if dst should be reached)
+        :param domains: dict host -> set of hosts the packets of the host may reach (its slice), by default only
+        their destination if it should be reached
+        :return: list of (expectation, hosts the packet reached) whose reachability was wrong or whose packet
+        left its domain
+        """
+        violations = []
+        for expectation in expected:
+            src, dst, protocol, dstport, reachable = expectation
+            trace = self.send(src, dst, protocol, dstport)
+            if domains is not None:
+                domain = domains[src]
+            else:
+                domain = set([dst]) if reachable else set()
+            if (dst in trace.delivered) != reachable or not set(trace.delivered) <= domain:
+                violations.append((expectation, trace.delivered))
+        return violations
+
+    def report(self):
+        return "%d PacketIns, %d messages (%d flow_mods) from the controller, %.0f decisions/s" % (
+            self.packet_ins, self.messages, self.flow_mods,
+            self.packet_ins / self.decision_time if self.decision_time else 0)
+
+
+def load_module(path):
+    """
+    Imports a module from a file whose name need not be a valid module name, like Skeleton-Lab3.py.
+    Its directory goes on sys.path for the modules it imports itself.
+    """
+    path = os.path.abspath(path)
+    directory = os.path.dirname(path)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    name = os.path.splitext(os.path.basename(path))[0].replace('-', '_').replace(' ', '_')
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
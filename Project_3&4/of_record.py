@@ -0,0 +1,258 @@
+'''
+Records the OpenFlow events the POX modules receive and replays them offline.
+
+Recording is a POX component, listed before the controller so that it sees every event first:
+    ./pox.py of_record --file=events.oflog Skeleton-Lab3
+
+The log is binary: a header, then one record per event with its timestamp, event kind, dpid and payload.
+The payload of a switch message is the OpenFlow message itself, as packed on the wire (all the parts of a
+stats reply), a LinkEvent is packed as (added, dpid1, port1, dpid2, port2) and ConnectionDown has none.
+
+Replaying feeds a log to controllers on the stand-in core.openflow of of_emulator.py, at real time, at a scaled
+speed or as fast as possible (--speed 0), and reports the handler latency per event kind and the messages the
+controllers sent back:
+    python of_record.py events.oflog Skeleton-Lab3.py:CustomSlice --speed 10
+    python of_record.py events.oflog ../Project_Final/sdn_statistics.py:StatsCollector:timer_interval=3600
+'''
+
+import argparse
+from collections import defaultdict
+import struct
+import time
+
+# of_emulator brings up the POX core when not started by pox.py, so it is imported first
+from of_emulator import EmulatedNexus, EmulatedDiscovery, load_module, unpack_messages
+from pox.core import core
+from pox.openflow import OpenFlowNexus, ConnectionUp, ConnectionDown, PortStatus, PacketIn, FlowRemoved, BarrierIn, \
+    ErrorIn, FlowStatsReceived, AggregateFlowStatsReceived, TableStatsReceived, PortStatsReceived, QueueStatsReceived
+from pox.openflow.discovery import Link, LinkEvent
+from pox.lib.revent import EventMixin
+from pox.lib.recoco import Timer
+
+log = core.getLogger()
+
+LOG_MAGIC = b'OFLOG\x01'
+# timestamp, event kind, dpid, payload length
+RECORD = struct.Struct('!dBQI')
+LINK = struct.Struct('!BQHQH')
+
+# Event kind -> event class, the index is what the log stores
+EVENT_KINDS = [ConnectionUp, ConnectionDown, PortStatus, PacketIn, FlowRemoved, BarrierIn, ErrorIn,
+               FlowStatsReceived, AggregateFlowStatsReceived, TableStatsReceived, PortStatsReceived,
+               QueueStatsReceived, LinkEvent]
+STATS_EVENTS = (FlowStatsReceived, AggregateFlowStatsReceived, TableStatsReceived, PortStatsReceived,
+                QueueStatsReceived)
+
+# Listener priority of the recorder, above the controllers so events are logged before they are handled
+RECORD_PRIORITY = 0x7fffffff
+
+
+class Recorder(object):
+    """
+    Appends every OpenFlow event and LinkEvent to a binary log.
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.file.write(LOG_MAGIC)
+        self.count = 0
+        self.flush_timer = Timer(1, self.file.flush, recurring=True)
+        core.addListenerByName("GoingDownEvent", self.close)
+        log.info("Recording OpenFlow events to %s", filename)
+
+    def close(self, event=None):
+        self.flush_timer.cancel()
+        self.file.close()
+        log.info("Recorded %d events", self.count)
+
+    def start_openflow(self):
+        for kind, event_type in enumerate(EVENT_KINDS):
+            if event_type is not LinkEvent:
+                core.openflow.addListener(event_type, self.recorder(kind), priority=RECORD_PRIORITY)
+
+    def start_discovery(self):
+        core.openflow_discovery.addListener(LinkEvent, self.recorder(EVENT_KINDS.index(LinkEvent)),
+                                            priority=RECORD_PRIORITY)
+
+    def recorder(self, kind):
+        def record(event):
+            self.record(kind, event)
+        return record
+
+    def record(self, kind, event):
+        if isinstance(event, LinkEvent):
+            link = event.link
+            dpid = link.dpid1
+            payload = LINK.pack(event.added, link.dpid1, link.port1, link.dpid2, link.port2)
+        elif isinstance(event, ConnectionDown):
+            dpid = event.dpid
+            payload = b''
+        elif isinstance(event, STATS_EVENTS):
+            dpid = event.connection.dpid
+            payload = b''.join(part.pack() for part in event.ofp)
+        else:
+            dpid = event.connection.dpid
+            payload = event.ofp.pack()
+        self.file.write(RECORD.pack(time.time(), kind, dpid, len(payload)))
+        self.file.write(payload)
+        self.count += 1
+
+
+def read_log(filename):
+    """
+    Reads a log written by Recorder.
+    :return: generator of (timestamp, event class, dpid, payload)
+    """
+    with open(filename, 'rb') as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError("%s is not an OpenFlow event log" % filename)
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            timestamp, kind, dpid, length = RECORD.unpack(header)
+            yield timestamp, EVENT_KINDS[kind], dpid, f.read(length)
+
+
+class ReplayConnection(EventMixin):
+    """
+    Connection of a replayed switch, collects what the controllers send to it.
+    """
+    _eventMixin_events = OpenFlowNexus._eventMixin_events
+
+    def __init__(self, replayer, dpid):
+        self.replayer = replayer
+        self.dpid = dpid
+        self.connect_time = time.time()
+
+    def send(self, data):
+        messages = unpack_messages(data) if isinstance(data, bytes) else [data]
+        for msg in messages:
+            self.replayer.sent[type(msg).__name__] += 1
+
+
+class Replayer(object):
+    """
+    Replays a log to the controllers registered after it, measuring how long their handlers take.
+    """
+
+    def __init__(self):
+        self.nexus = EmulatedNexus()
+        self.discovery = EmulatedDiscovery()
+        core.register('openflow', self.nexus)
+        core.register('openflow_discovery', self.discovery)
+        # event class name -> handler latencies in seconds
+        self.latencies = defaultdict(list)
+        # message class name -> number sent by the controllers
+        self.sent = defaultdict(int)
+
+    def connection(self, dpid):
+        connection = self.nexus._connections.get(dpid)
+        if connection is None:
+            # the log may start after the switch connected
+            connection = self.nexus._connections[dpid] = ReplayConnection(self, dpid)
+        return connection
+
+    def event_args(self, event_type, dpid, payload):
+        """
+        Rebuilds the arguments of a logged event.
+        """
+        if event_type is LinkEvent:
+            added, dpid1, port1, dpid2, port2 = LINK.unpack(payload)
+            return (bool(added), Link(dpid1, port1, dpid2, port2))
+        connection = self.connection(dpid)
+        if event_type is ConnectionDown:
+            del self.nexus._connections[dpid]
+            return (connection,)
+        messages = unpack_messages(payload)
+        if event_type in STATS_EVENTS:
+            if event_type is AggregateFlowStatsReceived:
+                return (connection, messages, messages[0].body)
+            stats = []
+            for part in messages:
+                stats.extend(part.body)
+            return (connection, messages, stats)
+        if event_type is ConnectionUp:
+            connection.connect_time = time.time()
+        return (connection, messages[0])
+
+    def replay(self, filename, speed=0):
+        """
+        Replays a log. With speed 0 the events follow each other as fast as possible, otherwise they keep their
+        logged spacing divided by speed.
+        :return: number of events replayed
+        """
+        first = start = None
+        count = 0
+        for timestamp, event_type, dpid, payload in read_log(filename):
+            if first is None:
+                first, start = timestamp, time.time()
+            if speed:
+                delay = (timestamp - first) / speed - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            args = self.event_args(event_type, dpid, payload)
+            began = time.time()
+            if event_type is LinkEvent:
+                self.discovery.raiseEventNoErrors(event_type, *args)
+            else:
+                # like a POX connection: the nexus gets the event first, then the connection unless it was halted
+                event = self.nexus.raiseEventNoErrors(event_type, *args)
+                if event is None or not event.halt:
+                    args[0].raiseEventNoErrors(event_type, *args)
+            self.latencies[event_type.__name__].append(time.time() - began)
+            count += 1
+        return count
+
+    def report(self):
+        lines = []
+        for name, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            lines.append("%-28s %7d events, mean %.3f ms, p99 %.3f ms, max %.3f ms" % (
+                name, len(latencies), 1000 * sum(latencies) / len(latencies),
+                1000 * latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 1000 * latencies[-1]))
+        lines.append("Sent: %s" % (", ".join("%s %d" % item for item in sorted(self.sent.items())) or "nothing"))
+        return "\n".join(lines)
+
+
+def parse_value(value):
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return {'true': True, 'false': False}.get(value.lower(), value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an OpenFlow event log to POX controllers")
+    parser.add_argument('log', help="log written by the of_record component")
+    parser.add_argument('controllers', nargs='+',
+                        help="controller as file:Class[:option=value,...], e.g. Skeleton-Lab3.py:CustomSlice")
+    parser.add_argument('--speed', type=float, default=0,
+                        help="replay speed relative to the recording, 0 (default) for as fast as possible")
+    args = parser.parse_args()
+
+    replayer = Replayer()
+    for controller in args.controllers:
+        fields = controller.split(':')
+        path, class_name = fields[0], fields[1]
+        options = dict(option.split('=', 1) for option in fields[2].split(',')) if len(fields) > 2 else {}
+        options = dict((key, parse_value(value)) for key, value in options.items())
+        component = getattr(load_module(path), class_name)(**options)
+        core.register(class_name, component)
+
+    start = time.time()
+    count = replayer.replay(args.log, args.speed)
+    print("Replayed %d events in %.2f s" % (count, time.time() - start))
+    print(replayer.report())
+
+
+def launch(file="events.oflog"):
+    recorder = Recorder(file)
+    core.call_when_ready(recorder.start_openflow, ['openflow'])
+    core.call_when_ready(recorder.start_discovery, ['openflow_discovery'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+'''
+Declarative slice specification for TopologySlice.
+
+A spec (JSON, or YAML if PyYAML is installed) describes the topology and the slices:
+
+    {
+      "switches": {"s1": "00-00-00-00-00-01", ...},
+      "links": [["s1", 1, "s2", 1], ...],             # switch, port, switch, port (topo_gen adds link options)
+      "hosts": {"h1": ["s1", 3], ...},                # switch and port the host is attached to
+      "slices": [
+        {"name": "upper", "hosts": ["h1", "h3"],
+         "switches": ["s1", "s2", "s3"],             # optional, switches the slice may use
+         "path": ["s1", "s2", "s3"],                 # optional, explicit path for a two-host slice
+         "services": ["tcp/80", "udp/200"],          # optional, only this traffic is forwarded
+         "isolated": true,                           # optional, no other slice may use its links
+         "queue": 1}                                 # optional, switch queue the slice traffic is enqueued on
+      ]
+    }
+
+compile_spec turns it into per-switch rule sets, after checking the slices for loops, overlaps and
+unreachable endpoints. The result only depends on the spec, so it is computed once and cached.
+'''
+
+from collections import defaultdict, deque
+import json
+import os
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+IP_PROTOCOLS = {'tcp': 6, 'udp': 17}
+
+
+class SliceSpecError(Exception):
+    """
+    Raised when a slice spec is malformed or its slices cannot be compiled.
+    """
+    pass
+
+
+def load_spec(filename):
+    """
+    Loads a slice spec from a JSON or YAML file.
+    """
+    with open(filename, 'r') as f:
+        if filename.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise SliceSpecError("PyYAML is needed to load %s" % filename)
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def parse_service(service):
+    """
+    Parses a service string like "tcp/80" into (IP protocol number, port).
+    """
+    try:
+        proto, port = service.split('/')
+        return IP_PROTOCOLS[proto.lower()], int(port)
+    except (AttributeError, KeyError, ValueError):
+        raise SliceSpecError("Invalid service %r, expected e.g. 'tcp/80'" % (service,))
+
+
+def build_graph(spec):
+    """
+    Builds the switch graph of a spec.
+    :return: dict switch -> dict neighbour switch -> local port
+    """
+    switches = spec.get('switches', {})
+    graph = dict((switch, {}) for switch in switches)
+    for link in spec.get('links', []):
+        sw1, port1, sw2, port2 = link[:4]
+        for switch in (sw1, sw2):
+            if switch not in graph:
+                raise SliceSpecError("Link %s uses unknown switch %s" % (link, switch))
+        graph[sw1][sw2] = port1
+        graph[sw2][sw1] = port2
+    return graph
+
+
+def slice_tree(graph, slice_, hosts):
+    """
+    Finds the switch links a slice uses: the explicit path if given, otherwise the union of the BFS paths
+    from the switch of the first host to the switches of the other hosts, restricted to the allowed switches.
+    :return: list of (switch, switch) links
+    """
+    name = slice_['name']
+    if 'path' in slice_:
+        path = slice_['path']
+        if len(set(path)) != len(path):
+            raise SliceSpecError("Slice %s: path %s has a loop" % (name, path))
+        for i in range(len(path) - 1):
+            if path[i + 1] not in graph.get(path[i], {}):
+                raise SliceSpecError("Slice %s: no link between %s and %s" % (name, path[i], path[i + 1]))
+        endpoints = set(hosts[host][0] for host in slice_['hosts'])
+        if not endpoints <= set(path):
+            raise SliceSpecError("Slice %s: path %s does not reach all its hosts" % (name, path))
+        return [(path[i], path[i + 1]) for i in range(len(path) - 1)]
+
+    allowed = set(slice_.get('switches', graph.keys()))
+    root = hosts[slice_['hosts'][0]][0]
+    parent = {root: None}
+    queue = deque([root])
+    while queue:
+        switch = queue.popleft()
+        for neighbour in sorted(graph[switch]):
+            if neighbour in allowed and neighbour not in parent:
+                parent[neighbour] = switch
+                queue.append(neighbour)
+    links = set()
+    for host in slice_['hosts'][1:]:
+        switch = hosts[host][0]
+        if switch not in parent:
+            raise SliceSpecError("Slice %s: host %s is unreachable from host %s" % (name, host, slice_['hosts'][0]))
+        while parent[switch] is not None:
+            links.add((parent[switch], switch))
+            switch = parent[switch]
+    return sorted(links)
+
+
+def compile_spec(spec):
+    """
+    Compiles a slice spec into per-switch rule sets.
+    Every port of a slice at a switch gets a rule forwarding its traffic to the other ports of the slice there.
+    :return: dict dpid string -> list of rules, a rule being a dict with the slice name, in_port, out_ports and,
+    for slices limited to services, nw_proto plus tp_src or tp_dst, and for slices with a queue, queue
+    """
+    graph = build_graph(spec)
+    hosts = spec.get('hosts', {})
+    for host, (switch, port) in hosts.items():
+        if switch not in graph:
+            raise SliceSpecError("Host %s is attached to unknown switch %s" % (host, switch))
+
+    link_owners = defaultdict(list) # sorted (switch, switch) -> slices using the link
+    slice_ports = [] # (slice, dict switch -> set of ports)
+    for slice_ in spec.get('slices', []):
+        name = slice_['name']
+        if len(slice_.get('hosts', [])) < 2:
+            raise SliceSpecError("Slice %s needs at least two hosts" % name)
+        for host in slice_['hosts']:
+            if host not in hosts:
+                raise SliceSpecError("Slice %s: unknown host %s" % (name, host))
+        ports = defaultdict(set)
+        for sw1, sw2 in slice_tree(graph, slice_, hosts):
+            ports[sw1].add(graph[sw1][sw2])
+            ports[sw2].add(graph[sw2][sw1])
+            link_owners[tuple(sorted((sw1, sw2)))].append(slice_)
+        for host in slice_['hosts']:
+            switch, port = hosts[host]
+            ports[switch].add(port)
+        slice_ports.append((slice_, ports))
+
+    for slice_ in spec.get('slices', []):
+        queue = slice_.get('queue')
+        if queue is not None and (not isinstance(queue, int) or queue < 0):
+            raise SliceSpecError("Slice %s: invalid queue %r" % (slice_['name'], queue))
+
+    for link, owners in link_owners.items():
+        if len(owners) > 1 and any(slice_.get('isolated') for slice_ in owners):
+            raise SliceSpecError("Link %s-%s is shared by slices %s, but %s is isolated" % (
+                link[0], link[1], ", ".join(slice_['name'] for slice_ in owners),
+                ", ".join(slice_['name'] for slice_ in owners if slice_.get('isolated'))))
+
+    rules = defaultdict(list)
+    claimed = defaultdict(list) # (switch, in_port) -> list of (service or None for all traffic, slice name)
+    for slice_, ports in slice_ports:
+        services = [parse_service(service) for service in slice_.get('services', [])]
+        for switch, switch_ports in ports.items():
+            dpid = spec['switches'][switch]
+            for in_port in sorted(switch_ports):
+                for service in services or [None]:
+                    for other_service, owner in claimed[(switch, in_port)]:
+                        if service is None or other_service is None or service == other_service:
+                            raise SliceSpecError("Slices %s and %s overlap on %s port %d" % (
+                                owner, slice_['name'], switch, in_port))
+                for service in services or [None]:
+                    claimed[(switch, in_port)].append((service, slice_['name']))
+                rule = {'slice': slice_['name'], 'in_port': in_port, 'out_ports': sorted(switch_ports - set([in_port]))}
+                if 'queue' in slice_:
+                    rule['queue'] = slice_['queue']
+                if not services:
+                    rules[dpid].append(rule)
+                for nw_proto, tp_port in services:
+                    for tp_field in ('tp_dst', 'tp_src'):
+                        service_rule = dict(rule, nw_proto=nw_proto)
+                        service_rule[tp_field] = tp_port
+                        rules[dpid].append(service_rule)
+    return dict(rules)
+
+
+_compiled_cache = {}
+
+
+def compile_spec_file(filename):
+    """
+    Loads and compiles a spec file, cached on its path and modification time.
+    """
+    key = (os.path.abspath(filename), os.path.getmtime(filename))
+    if key not in _compiled_cache:
+        _compiled_cache[key] = compile_spec(load_spec(filename))
+    return _compiled_cache[key]
@@ -0,0 +1,234 @@
+'''
+Parameterized topology generator for large emulations.
+
+Builds random connected graphs, fat-trees, leaf-spine fabrics and the data-center tree of CustomTopo (Project_1)
+as plain graphs, without Mininet, so controllers and offline tools can load them too. Every generator is
+reproducible from its seed and runs in linear time in the size of the topology.
+
+A topology is a dict in the layout of the slice specs (slice_spec.py), which can be saved to JSON:
+
+    {
+      "name": "fat-tree-4",
+      "switches": {"s1": "00-00-00-00-00-01", ...},        # switch -> dpid
+      "links": [["s1", 1, "s2", 1, {"bw": 100}], ...],     # switch, port, switch, port, link options
+      "hosts": {"h1": ["s3", 3], ...},                      # switch and port the host is attached to
+      "addresses": {"h1": ["10.0.0.1/8", "00:00:00:00:00:01"], ...},
+      "host_links": {"h1": {"bw": 100}, ...}               # options of the link between host and switch
+    }
+
+Usage:
+    python topo_gen.py fat-tree --k 4 -o fat-tree-4.json
+    python topo_gen.py random --switches 1000 --links 3000 --seed 7 -o random-1000.json
+'''
+
+import argparse
+import json
+import random
+
+# Link options RandomTopo in Topo.py chooses from
+RANDOM_LINKOPTS = [
+    {'bw': 10, 'delay': '1ms', 'loss': 0.1, 'max_queue_size': 1000, 'use_htb': True},
+    {'bw': 100, 'delay': '10ms', 'loss': 0.1, 'max_queue_size': 1000, 'use_htb': True},
+    {'bw': 1000, 'delay': '50ms', 'loss': 0.1, 'max_queue_size': 1000, 'use_htb': True},
+]
+
+MAX_HOSTS = 2 ** 24 - 2
+
+
+def dpid_string(number):
+    """
+    Formats a switch number as a dpid string, like pox.lib.util.dpid_to_str does.
+    """
+    return '-'.join('%02x' % ((number >> shift) & 0xff) for shift in range(40, -8, -8))
+
+
+def host_address(number):
+    """
+    Returns the (IP with prefix, MAC) of the host with a given number, 1 -> ("10.0.0.1/8", "00:00:00:00:00:01").
+    """
+    if not 0 < number <= MAX_HOSTS:
+        raise ValueError("Host number %d out of range" % number)
+    octets = (number >> 16, (number >> 8) & 0xff, number & 0xff)
+    return "10.%d.%d.%d/8" % octets, "00:00:00:%02x:%02x:%02x" % octets
+
+
+class TopologyBuilder(object):
+    """
+    Accumulates switches, hosts and links, numbering the switch ports in the order their links are added.
+    """
+
+    def __init__(self, name):
+        self.topology = {'name': name, 'switches': {}, 'links': [], 'hosts': {}, 'addresses': {}, 'host_links': {}}
+        self.next_port = {}
+
+    def add_switch(self):
+        number = len(self.topology['switches']) + 1
+        switch = 's%d' % number
+        self.topology['switches'][switch] = dpid_string(number)
+        self.next_port[switch] = 1
+        return switch
+
+    def port(self, switch):
+        port = self.next_port[switch]
+        self.next_port[switch] = port + 1
+        return port
+
+    def add_link(self, sw1, sw2, linkopts=None):
+        self.topology['links'].append([sw1, self.port(sw1), sw2, self.port(sw2), dict(linkopts or {})])
+
+    def add_host(self, switch, linkopts=None):
+        number = len(self.topology['hosts']) + 1
+        host = 'h%d' % number
+        self.topology['hosts'][host] = [switch, self.port(switch)]
+        self.topology['addresses'][host] = list(host_address(number))
+        self.topology['host_links'][host] = dict(linkopts or {})
+        return host
+
+
+def random_topology(switches, links=None, seed=None, linkopts=RANDOM_LINKOPTS, hosts_per_switch=1,
+                    host_linkopts=None):
+    """
+    Random connected graph: a random spanning tree plus random extra links, each with random link options.
+    :param switches: number of switches
+    :param links: number of switch-to-switch links, at least switches - 1; random if None
+    :param seed: random seed, the same seed gives the same topology
+    :param linkopts: list of link options to choose from
+    :param hosts_per_switch: number of hosts attached to every switch
+    :param host_linkopts: link options of the host links
+    """
+    if switches < 1:
+        raise ValueError("A topology needs at least one switch")
+    rng = random.Random(seed)
+    max_links = switches * (switches - 1) // 2
+    if links is None:
+        links = rng.randint(switches - 1, max_links)
+    if not switches - 1 <= links <= max_links:
+        raise ValueError("%d switches can have between %d and %d links, not %d" % (
+            switches, switches - 1, max_links, links))
+
+    builder = TopologyBuilder('random-%d-%d' % (switches, links))
+    nodes = [builder.add_switch() for i in range(switches)]
+    for switch in nodes:
+        for i in range(hosts_per_switch):
+            builder.add_host(switch, host_linkopts)
+
+    # the spanning tree attaches every switch, in random order, to one of the switches before it
+    order = list(range(switches))
+    rng.shuffle(order)
+    edges = set()
+    for i in range(1, switches):
+        edges.add(tuple(sorted((order[i], order[rng.randrange(i)]))))
+    # the extra links are random pairs drawn until there are enough, without listing every pair: a draw is a
+    # duplicate with probability len(edges) / max_links, so even a complete graph takes about
+    # max_links * ln(max_links) draws
+    while len(edges) < links:
+        a, b = rng.randrange(switches), rng.randrange(switches)
+        if a != b:
+            edges.add((min(a, b), max(a, b)))
+
+    for a, b in sorted(edges):
+        builder.add_link(nodes[a], nodes[b], rng.choice(linkopts))
+    return builder.topology
+
+
+def fat_tree(k=4, linkopts=None):
+    """
+    k-ary fat-tree: (k/2)^2 core switches, k pods of k/2 aggregation and k/2 edge switches,
+    k/2 hosts per edge switch.
+    """
+    if k < 2 or k % 2:
+        raise ValueError("k must be an even number >= 2, not %d" % k)
+    half = k // 2
+    builder = TopologyBuilder('fat-tree-%d' % k)
+    cores = [builder.add_switch() for i in range(half * half)]
+    for pod in range(k):
+        aggs = [builder.add_switch() for i in range(half)]
+        edges = [builder.add_switch() for i in range(half)]
+        for i, agg in enumerate(aggs):
+            # aggregation switch i of every pod connects to core group i
+            for core in cores[i * half:(i + 1) * half]:
+                builder.add_link(core, agg, linkopts)
+            for edge in edges:
+                builder.add_link(agg, edge, linkopts)
+        for edge in edges:
+            for i in range(half):
+                builder.add_host(edge, linkopts)
+    return builder.topology
+
+
+def leaf_spine(leaves=4, spines=2, hosts_per_leaf=2, linkopts=None, host_linkopts=None):
+    """
+    Leaf-spine fabric: every leaf switch connects to every spine switch, hosts hang off the leaves.
+    """
+    builder = TopologyBuilder('leaf-spine-%d-%d' % (leaves, spines))
+    spine_switches = [builder.add_switch() for i in range(spines)]
+    for i in range(leaves):
+        leaf = builder.add_switch()
+        for spine in spine_switches:
+            builder.add_link(spine, leaf, linkopts)
+        for j in range(hosts_per_leaf):
+            builder.add_host(leaf, host_linkopts if host_linkopts is not None else linkopts)
+    return builder.topology
+
+
+def data_center_tree(fanout=2, linkopts1=None, linkopts2=None, linkopts3=None):
+    """
+    Data-center tree of CustomTopo: one core switch, fanout aggregation switches, fanout edge switches per
+    aggregation switch and fanout hosts per edge switch.
+    linkopts - (1:core, 2:aggregation, 3: edge) parameters
+    """
+    builder = TopologyBuilder('data-center-tree-%d' % fanout)
+    core = builder.add_switch()
+    for i in range(fanout):
+        agg = builder.add_switch()
+        builder.add_link(agg, core, linkopts1)
+        for j in range(fanout):
+            edge = builder.add_switch()
+            builder.add_link(edge, agg, linkopts2)
+            for k in range(fanout):
+                builder.add_host(edge, linkopts3)
+    return builder.topology
+
+
+def save_topology(topology, filename):
+    with open(filename, 'w') as f:
+        json.dump(topology, f, indent=1, sort_keys=True)
+
+
+def load_topology(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+GENERATORS = {
+    'random': lambda args: random_topology(args.switches, args.links, args.seed),
+    'fat-tree': lambda args: fat_tree(args.k, {'bw': args.bw}),
+    'leaf-spine': lambda args: leaf_spine(args.leaves, args.spines, args.hosts, {'bw': args.bw}),
+    'tree': lambda args: data_center_tree(args.fanout, {'bw': args.bw}, {'bw': args.bw}, {'bw': args.bw}),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a topology and export it to JSON")
+    parser.add_argument('kind', choices=sorted(GENERATORS))
+    parser.add_argument('-o', '--output', help="JSON file to write, a summary is printed if omitted")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--switches', type=int, default=10, help="random: number of switches")
+    parser.add_argument('--links', type=int, default=None, help="random: number of switch-to-switch links")
+    parser.add_argument('--k', type=int, default=4, help="fat-tree: arity")
+    parser.add_argument('--leaves', type=int, default=4, help="leaf-spine: number of leaf switches")
+    parser.add_argument('--spines', type=int, default=2, help="leaf-spine: number of spine switches")
+    parser.add_argument('--hosts', type=int, default=2, help="leaf-spine: hosts per leaf switch")
+    parser.add_argument('--fanout', type=int, default=2, help="tree: fanout")
+    parser.add_argument('--bw', type=int, default=100, help="bandwidth of the links in Mbps")
+    args = parser.parse_args()
+
+    topology = GENERATORS[args.kind](args)
+    if args.output:
+        save_topology(topology, args.output)
+    print("%s: %d switches, %d links, %d hosts" % (topology['name'], len(topology['switches']),
+                                                   len(topology['links']), len(topology['hosts'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -8,48 +8,61 @@ Teaching Assistant: Arpit Gupta
 '''
 
 from pox.core import core
-from collections import defaultdict
 
 import pox.openflow.libopenflow_01 as of
-import pox.openflow.discovery
-import pox.openflow.spanning_tree
 
-from pox.lib.revent import *
-from pox.lib.util import dpid_to_str
+from pox.lib.revent import EventMixin
 from pox.lib.util import dpidToStr
-from pox.lib.addresses import IPAddr, EthAddr
-from collections import namedtuple
 import os
+import time
+
+from slice_spec import compile_spec_file, SliceSpecError
 
 log = core.getLogger()
+specFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), "slices-p31.json")
+
+IPV4_TYPE = 0x0800
 
 
 class TopologySlice (EventMixin):
 
-    def __init__(self):
+    def __init__(self, spec_file=specFile):
         self.listenTo(core.openflow)
         log.debug("Enabling Slicing Module")
 
+        start = time.time()
+        try:
+            self.rules = compile_spec_file(spec_file)
+        except (IOError, ValueError, SliceSpecError) as e:
+            log.error("Error compiling slice spec %s: %s", spec_file, e)
+            raise
+        log.info("Compiled %d rules for %d switches from %s in %.1f ms", sum(len(rules) for rules in self.rules.values()),
+                 len(self.rules), spec_file, (time.time() - start) * 1000)
+
+        # dpid string -> packed flow_mods of the switch, built on its first connection and reused on reconnects
+        self.packed_rules = {}
 
-    def add_flow_rule(self, connection, in_port, out_port, bidirectional=True):
+
+    def rule_to_flow_mod(self, rule):
         """
-        Adds a flow rule to the switch.
+        Converts a compiled slice rule into a flow_mod.
 
-        :param connection: connection.
-        :param in_port: The incoming port to match traffic.
-        :param out_port: The outgoing port to forward traffic.
-        :param bidirectional: If True, a rule will be added in both directions.
+        :param rule: rule dict from slice_spec.compile_spec.
         """
         msg = of.ofp_flow_mod()
-        msg.match.in_port = in_port
-        msg.actions.append(of.ofp_action_output(port=out_port))
-        connection.send(msg)
-
-        if bidirectional:
-            msg = of.ofp_flow_mod()
-            msg.match.in_port = out_port
-            msg.actions.append(of.ofp_action_output(port=in_port))
-            connection.send(msg)
+        msg.match.in_port = rule['in_port']
+        if 'nw_proto' in rule:
+            msg.match.dl_type = IPV4_TYPE
+            msg.match.nw_proto = rule['nw_proto']
+            for field in ('tp_src', 'tp_dst'):
+                if field in rule:
+                    setattr(msg.match, field, rule[field])
+        for out_port in rule['out_ports']:
+            if 'queue' in rule:
+                msg.actions.append(of.ofp_action_enqueue(port=out_port, queue_id=rule['queue']))
+            else:
+                msg.actions.append(of.ofp_action_output(port=out_port))
+        return msg
         
         
     """This event will be raised each time a switch will connect to the controller"""
@@ -60,19 +73,22 @@ class TopologySlice (EventMixin):
         # example we need to write different rules in different tables.
         dpid = dpidToStr(event.dpid)
         log.debug("Switch %s has come up.", dpid)
-        
-        """ Add your logic here """
 
-        topo = {'00-00-00-00-00-01': [[3, 1], [4, 2]],
-                '00-00-00-00-00-02': [[1,2]],
-                '00-00-00-00-00-03': [[1, 3], [2, 4]],
-                '00-00-00-00-00-04': [1,2]}
+        packed = self.packed_rules.get(dpid)
+        if packed is None:
+            packed = b''.join(self.rule_to_flow_mod(rule).pack() for rule in self.rules.get(dpid, []))
+            self.packed_rules[dpid] = packed
+        if packed:
+            # all rules of the switch in a single send
+            event.connection.send(packed)
+        log.debug("Installed %d slice rules in %s", len(self.rules.get(dpid, [])), dpid)
 
-        for path in topo[dpid]:
-            self.add_flow_rule(event.connection, path[0], path[1])
 
+def launch(spec=specFile):
+    # discovery and spanning tree are only needed here, the emulation and benchmarks create TopologySlice without them
+    import pox.openflow.discovery
+    import pox.openflow.spanning_tree
 
-def launch():
     # Run spanning tree so that we can deal with topologies with loops
     pox.openflow.discovery.launch()
     pox.openflow.spanning_tree.launch()
@@ -80,4 +96,4 @@ def launch():
     '''
     Starting the Topology Slicing module
     '''
-    core.registerNew(TopologySlice)
+    core.registerNew(TopologySlice, spec_file=spec)
@@ -0,0 +1,299 @@
+"""
+Throughput benchmark of the forms of the decision-tree classifier on the CPU.
+
+Every tree is classified in five forms:
+    tree python     the leaves of parse_tree, checked one by one for every packet in Python
+    tree numpy      pipeline_model.TreeModel, the leaves evaluated on arrays of packets
+    tables numpy    pipeline_model.PipelineModel on the rules of generate_rules.py, the switch's lookups
+    compiled python the tree compiled to nested ifs of a generated Python function
+    compiled numpy  the tree compiled to the interval index of every feature (searchsorted) and a dense array of
+                    the class of every combination of intervals
+on the same synthetic (proto, src_port, dst_port) packets, a third of them TCP. The per-packet Python forms run
+on a sample of the packets, tables numpy and compiled numpy are skipped when their dense array would be too large.
+Besides classifications per second, the memory the form allocates when it is built (tracemalloc) and its agreement
+with tree numpy, as the share of packets given the same action, are measured.
+The trees are given tree files and random trees of the given numbers of leaves. Results are written to a JSON
+report and appended to a CSV history to track them over time:
+    python3 bench_classify.py --trees tree-four.txt --leaves 16,256,1024 --packets 2000000
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import generate_rules
+import pipeline_model
+import train_tree
+from tree_parser import MAX_VALUES, SCHEMAS
+
+IPV4_TCP = 6
+# tree numpy goes first, it is the reference of the agreement
+FORMS = ["tree numpy", "tree python", "tables numpy", "compiled python", "compiled numpy"]
+# largest dense array of tables numpy and compiled numpy, in cells
+MAX_CELLS = 50000000
+
+
+def random_tree(leaves, rng, classes=5):
+    """
+    A random tree of the given number of leaves: the leaf with the most packets is split at a random value of a
+    random feature until there are enough.
+    :return: list of (tests, class) as in train_tree.tree_leaves
+    """
+    # (tests, box of (low, high) per feature)
+    nodes = [((), [(0, max_value) for max_value in MAX_VALUES])]
+    while len(nodes) < leaves:
+        sizes = [np.prod([high - low + 1.0 for low, high in box]) for tests, box in nodes]
+        tests, box = nodes.pop(int(np.argmax(sizes)))
+        feature = rng.choice([f for f, (low, high) in enumerate(box) if high > low])
+        low, high = box[feature]
+        threshold = int(rng.integers(low, high))
+        below, above = list(box), list(box)
+        below[feature], above[feature] = (low, threshold), (threshold + 1, high)
+        nodes += [(tests + ((feature, "<=", threshold),), below), (tests + ((feature, ">", threshold),), above)]
+    return [(list(tests), int(rng.integers(classes))) for tests, box in nodes]
+
+
+def synthetic_packets(count, rng):
+    proto = rng.integers(0, 256, count)
+    proto[rng.random(count) < 1 / 3.0] = IPV4_TCP
+    return proto, rng.integers(0, 1 << 16, count), rng.integers(0, 1 << 16, count)
+
+
+class TreePython(object):
+    """
+    The parsed leaves, as the intervals a packet must fall in.
+    """
+
+    def __init__(self, tree):
+        self.leaves = [(intervals, class_) for tests, intervals, class_ in tree.leaves
+                       if all(low <= high for low, high in intervals)]
+
+    def classify_packet(self, proto, src_port, dst_port):
+        if proto != IPV4_TCP:
+            src_port = dst_port = 0
+        for ((proto_low, proto_high), (src_low, src_high), (dst_low, dst_high)), class_ in self.leaves:
+            if proto_low <= proto <= proto_high and src_low <= src_port <= src_high and \
+                    dst_low <= dst_port <= dst_high:
+                return class_
+        return -1
+
+
+def tree_source(tree, name="classify"):
+    """
+    Python source of a function classifying a packet with nested ifs: the tests the leaves share are checked once.
+    """
+    root = {}
+    for tests, intervals, class_ in tree.leaves:
+        node = root
+        for feature, operator, threshold in tests:
+            node = node.setdefault((feature, operator, threshold), {})
+        node.setdefault(None, class_)
+
+    variables = ["proto", "src_port", "dst_port"]
+    lines = [f"def {name}(proto, src_port, dst_port):",
+             f"    if proto != {IPV4_TCP}:",
+             "        src_port = dst_port = 0"]
+
+    def emit(node, depth):
+        indent = "    " * depth
+        for test, child in node.items():
+            if test is None:
+                lines.append(f"{indent}return {child}")
+                return
+            feature, operator, threshold = test
+            lines.append(f"{indent}if {variables[feature]} {'==' if operator == '=' else operator} {threshold!r}:")
+            emit(child, depth + 1)
+
+    emit(root, 1)
+    lines.append("    return -1")
+    return "\n".join(lines) + "\n"
+
+
+def compile_tree(tree):
+    namespace = {}
+    exec(compile(tree_source(tree), "<compiled tree>", "exec"), namespace)
+    return namespace["classify"]
+
+
+class CompiledNumpy(object):
+    """
+    The interval index of every feature and the class of every combination of intervals.
+    """
+
+    def __init__(self, tree):
+        self.points = [np.array(tree.split_points(feature), dtype=np.int64) for feature in range(3)]
+        shape = tuple(len(points) + 1 for points in self.points)
+        if np.prod(shape, dtype=np.float64) > MAX_CELLS:
+            raise MemoryError(f"{shape} intervals are more than {MAX_CELLS} cells")
+        self.classes = np.full(shape, -1, dtype=np.int16)
+        # the first matching leaf wins, so the leaves are written last to first
+        for tests, intervals, class_ in reversed(tree.leaves):
+            if any(low > high for low, high in intervals):
+                continue
+            index = tuple(slice(np.searchsorted(points, low), np.searchsorted(points, high) + 1)
+                          for points, (low, high) in zip(self.points, intervals))
+            self.classes[index] = class_
+
+    def classify(self, proto, src_port, dst_port):
+        tcp = proto == IPV4_TCP
+        values = [proto, np.where(tcp, src_port, 0), np.where(tcp, dst_port, 0)]
+        return self.classes[tuple(np.searchsorted(points, value) for points, value in zip(self.points, values))]
+
+
+def built(build):
+    """
+    Builds a form and measures it.
+    :return: (form, build time in s, bytes allocated by the build and still held, peak bytes)
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    form = build()
+    elapsed = time.perf_counter() - start
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return form, elapsed, held, peak
+
+
+def timed(classify, packets, repeat):
+    """
+    :return: (output of the last run, best time of the runs in s)
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = classify(*packets)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return output, best
+
+
+def per_packet(function):
+    """
+    Runs a function classifying one packet on arrays of packets.
+    """
+    return lambda proto, src_port, dst_port: np.array(
+        [function(*packet) for packet in zip(proto.tolist(), src_port.tolist(), dst_port.tolist())])
+
+
+def bench_tree(name, tree_file, packets, sample, repeat):
+    """
+    Runs every form on one tree.
+    :return: list of result dicts
+    """
+    tree = generate_rules.parse_tree(tree_file)
+    # the actions of the classes, from tree numpy, and the actions tree numpy gives the packets
+    outcomes = expected = None
+
+    def table_model():
+        feature_rules, forwarding_rules, widths = generate_rules.generate_rules(
+            tree, generate_rules.class_to_action_map, generate_rules.action_to_host_port_map)
+        # one range entry per interval, and action_select 0 of a miss
+        shape = tuple(len(rules) + 1 for rules in feature_rules)
+        if np.prod(shape, dtype=np.float64) > MAX_CELLS:
+            raise MemoryError(f"{shape} action_select values are more than {MAX_CELLS} cells")
+        return pipeline_model.PipelineModel(pipeline_model.parse_entries(
+            [rule for rules in feature_rules for rule in rules] + forwarding_rules))
+
+    forms = {
+        "tree python": (lambda: TreePython(tree), lambda form: per_packet(form.classify_packet), True),
+        "tree numpy": (lambda: pipeline_model.TreeModel(tree_file), lambda form: form.classify, False),
+        "tables numpy": (table_model, lambda form: form.classify, False),
+        "compiled python": (lambda: compile_tree(tree), per_packet, True),
+        "compiled numpy": (lambda: CompiledNumpy(tree), lambda form: form.classify, False),
+    }
+    results = []
+    for form_name in FORMS:
+        build, classifier, python = forms[form_name]
+        count = sample if python else len(packets[0])
+        result = {"tree": name, "leaves": len(tree.leaves), "form": form_name, "packets": count}
+        try:
+            form, result["build_s"], result["memory_bytes"], result["build_peak_bytes"] = built(build)
+        except MemoryError as e:
+            result["skipped"] = str(e)
+            results.append(result)
+            continue
+        subset = tuple(field[:count] for field in packets)
+        output, elapsed = timed(classifier(form), subset, 1 if python else repeat)
+        if form_name == "tree numpy":
+            classes = max([class_ for tests, intervals, class_ in tree.leaves] + [0]) + 1
+            # shifted by one for the -1 of packets no leaf matches
+            outcomes = np.array([pipeline_model.DROP] + [form.outcome(class_) for class_ in range(classes)],
+                                dtype=object)
+        if form_name == "tables numpy":
+            actions = np.array(form.actions, dtype=object)[output]
+        else:
+            actions = outcomes[np.asarray(output) + 1]
+        result["classify_s"] = elapsed
+        result["rate"] = count / elapsed
+        if expected is None:
+            expected = actions
+        result["agreement"] = float((actions == expected[:count]).mean())
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the forms of the decision-tree classifier")
+    parser.add_argument("--trees", default="tree-four.txt", help="comma-separated tree files")
+    parser.add_argument("--leaves", default="16,256,1024", help="leaves of the random trees, comma-separated")
+    parser.add_argument("--packets", type=int, default=2000000, help="packets of the array forms")
+    parser.add_argument("--sample", type=int, default=100000, help="packets of the per-packet Python forms")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of the array forms, the best counts")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--report", default="bench_classify.json", help="JSON report of this run")
+    parser.add_argument("--history", default="bench_classify_history.csv", help="CSV the results are appended to")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    packets = synthetic_packets(args.packets, rng)
+    trees = [(os.path.basename(tree_file), tree_file) for tree_file in args.trees.split(",") if tree_file]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for leaves in [int(count) for count in args.leaves.split(",") if count]:
+            tree_file = os.path.join(directory, f"tree-random-{leaves}.txt")
+            train_tree.write_tree(random_tree(leaves, rng), SCHEMAS["ip_proto"], tree_file)
+            trees.append((f"random-{leaves}", tree_file))
+        for name, tree_file in trees:
+            for result in bench_tree(name, tree_file, packets, min(args.sample, args.packets), args.repeat):
+                results.append(result)
+                if "skipped" in result:
+                    print(f"{name:>16} {result['leaves']:>6} leaves  {result['form']:<16} skipped: {result['skipped']}")
+                    continue
+                print(f"{name:>16} {result['leaves']:>6} leaves  {result['form']:<16} "
+                      f"{result['rate'] / 1e6:10.3f} M/s  build {result['build_s'] * 1e3:8.1f} ms  "
+                      f"{result['memory_bytes'] / 2 ** 20:8.2f} MiB  agreement {result['agreement']:.6f}")
+
+    run = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "packets": args.packets,
+        "sample": args.sample,
+        "seed": args.seed,
+    }
+    with open(args.report, 'w') as f:
+        json.dump(dict(run, results=results), f, indent=1)
+    fields = list(run) + ["tree", "leaves", "form", "rate", "build_s", "memory_bytes", "agreement"]
+    new = not os.path.exists(args.history)
+    with open(args.history, 'a', newline='') as f:
+        writer = csv.DictWriter(f, fields, extrasaction="ignore")
+        if new:
+            writer.writeheader()
+        for result in results:
+            writer.writerow(dict(run, **result))
+    print(f"Report written to {args.report}, results appended to {args.history}")
+    if any(result.get("agreement", 1) < 1 for result in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
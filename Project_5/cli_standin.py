@@ -0,0 +1,178 @@
+"""
+Local stand-in for simple_switch_CLI, to test rule loading without a switch.
+
+It reads commands on stdin like the real CLI does when piped, appends every command it receives to a record file
+and answers table_add, table_modify, table_delete, table_clear, table_num_entries, table_dump, register_write and
+counter_read in the format of simple_switch_CLI. The entries, their handles and their direct counters are kept in a
+tables file between sessions, like the switch keeps them between CLI calls, so updates can refer to the entries of
+earlier sessions:
+    python3 generate_rules.py --mode load --cli "python3 cli_standin.py --record commands.txt"
+
+With --traffic, every session reading counters first sends that many random packets (a third of them TCP, 64 to 1500 bytes) through
+the entries of the decision tree (pipeline_model.entry_hits), so the counters grow between polls:
+    python3 p4_counters.py --cli "python3 cli_standin.py --traffic 100000"
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+import pipeline_model
+from generate_rules import TABLES, VERSION_REGISTER
+
+# the tables of generate_rules.py, for any number of features, and the ACL
+TABLE = re.compile(r"MyIngress\.((feature\d+|ipv4)_exact|acl_table)$")
+# the direct counter of every table, as named in simple_switch.p4
+COUNTER = re.compile(r"MyIngress\.((?:feature\d+|ipv4_exact|acl)_table_counter)$")
+
+
+def counter_table(counter):
+    """
+    The table of a direct counter: feature1_table_counter counts feature1_exact, ipv4_exact_table_counter
+    ipv4_exact and acl_table_counter acl_table.
+    """
+    name = COUNTER.match(counter).group(1)[:-len("_table_counter")]
+    return "MyIngress." + {"acl": "acl_table"}.get(name, name if name == "ipv4_exact" else name + "_exact")
+
+
+def send_traffic(tables, counters, packets, seed, version=None):
+    """
+    Counts random packets on the entries they hit.
+    :param tables: dict table -> dict handle -> table_add command
+    :param counters: dict table -> dict handle -> [packets, bytes], updated
+    """
+    rng = np.random.default_rng(seed)
+    proto = rng.integers(0, 256, packets)
+    proto[rng.random(packets) < 1 / 3.0] = pipeline_model.IPV4_TCP
+    src_port, dst_port = rng.integers(0, 1 << 16, packets), rng.integers(0, 1 << 16, packets)
+    sizes = rng.integers(64, 1501, packets)
+    entries = [(table, handle) for table in TABLES for handle in sorted(tables.get(table, {}))]
+    hits = pipeline_model.entry_hits([tables[table][handle] for table, handle in entries],
+                                     proto, src_port, dst_port, version)
+    for hit in hits.values():
+        counted = hit >= 0
+        packet_counts = np.bincount(hit[counted], minlength=len(entries))
+        byte_counts = np.bincount(hit[counted], weights=sizes[counted], minlength=len(entries))
+        for index in np.flatnonzero(packet_counts):
+            table, handle = entries[index]
+            counter = counters.setdefault(table, {}).setdefault(handle, [0, 0])
+            counter[0] += int(packet_counts[index])
+            counter[1] += int(byte_counts[index])
+
+
+def load_tables(tables_file):
+    """
+    :return: (dict table -> dict handle -> table_add command, dict table -> dict handle -> [packets, bytes],
+    value of the rules_version register or None, sessions so far)
+    """
+    tables = {table: {} for table in TABLES}
+    if not os.path.exists(tables_file):
+        return tables, {}, None, 0
+    with open(tables_file, 'r') as f:
+        state = json.load(f)
+    if "tables" not in state:
+        # handle lists of earlier stand-in versions, without the commands
+        tables.update((table, {handle: None for handle in handles}) for table, handles in state.items())
+        return tables, {}, None, 0
+    for table, entries in state["tables"].items():
+        tables[table] = {int(handle): command for handle, command in entries.items()}
+    counters = {table: {int(handle): counter for handle, counter in table_counters.items()}
+                for table, table_counters in state["counters"].items()}
+    return tables, counters, state["version"], state["sessions"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in for simple_switch_CLI that records its commands")
+    parser.add_argument("--record", default="cli_standin_commands.txt", help="file the commands are appended to")
+    parser.add_argument("--tables", default="cli_standin_tables.json",
+                        help="file the entries, their handles and counters are kept in")
+    parser.add_argument("--traffic", type=int, default=0, help="random packets counted at the start of every session")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the traffic, plus the number of the session")
+    parser.add_argument("--thrift-port", type=int, default=9090, help="ignored")
+    args = parser.parse_args()
+
+    tables, counters, version, sessions = load_tables(args.tables)
+    lines = sys.stdin.readlines()
+    # a poll reads the counters in one session, the sessions listing entries send no traffic
+    if args.traffic and any(line.startswith("counter_read") for line in lines):
+        known = {table: {handle: command for handle, command in entries.items() if command}
+                 for table, entries in tables.items()}
+        send_traffic(known, counters, args.traffic, args.seed + sessions, version)
+    handles = max([handle + 1 for entries in tables.values() for handle in entries] + [0])
+    with open(args.record, 'a') as record:
+        for line in lines:
+            command = line.strip()
+            if not command:
+                continue
+            record.write(command + "\n")
+            words = command.split()
+            output = ""
+            if len(words) > 1 and TABLE.match(words[1]):
+                tables.setdefault(words[1], {})
+            if words[0].startswith("table_") and len(words) > 1 and not TABLE.match(words[1]):
+                output = f"Error: Invalid table name ({words[1]})"
+            elif words[0] == "table_add":
+                if "=>" not in words or len(words) < 4:
+                    output = "Error: Invalid table operation (BAD_MATCH_KEY)"
+                else:
+                    tables[words[1]][handles] = command
+                    output = f"Adding entry to range match table {words[1]}\nEntry has been added with handle {handles}"
+                    handles += 1
+            elif words[0] in ("table_modify", "table_delete"):
+                handle = words[3 if words[0] == "table_modify" else 2]
+                if not handle.isdigit() or int(handle) not in tables[words[1]]:
+                    output = "Error: Invalid table operation (INVALID_HANDLE)"
+                elif words[0] == "table_delete":
+                    del tables[words[1]][int(handle)]
+                    counters.get(words[1], {}).pop(int(handle), None)
+                    output = f"Deleting entry {handle} from {words[1]}"
+                else:
+                    old = tables[words[1]][int(handle)]
+                    if old:
+                        # the entry keeps its key and priority, the action and its parameters change
+                        old_words = old.split()
+                        arrow = old_words.index("=>")
+                        priority = old_words[-1:] if any("->" in key or "&&&" in key
+                                                          for key in old_words[3:arrow]) else []
+                        tables[words[1]][int(handle)] = " ".join(["table_add", words[1], words[2]] +
+                                                                 old_words[3:arrow + 1] + words[4:] + priority)
+                    output = f"Modifying entry {handle} for range match table {words[1]}"
+            elif words[0] == "table_clear":
+                tables[words[1]] = {}
+                counters.pop(words[1], None)
+            elif words[0] == "table_num_entries":
+                output = str(len(tables[words[1]]))
+            elif words[0] == "table_dump":
+                output = "==========\nTABLE ENTRIES"
+                for handle, entry in sorted(tables[words[1]].items()):
+                    output += f"\n**********\nDumping entry {handle:#x}"
+                    if entry:
+                        entry_words = entry.split()
+                        output += f"\nAction entry: {entry_words[2]} - {', '.join(entry_words[entry_words.index('=>') + 1:])}"
+                output += "\n=========="
+            elif words[0] == "register_write" and len(words) == 4:
+                if words[1] == VERSION_REGISTER:
+                    version = int(words[3], 0)
+                output = ""
+            elif words[0] == "counter_read" and len(words) == 3 and COUNTER.match(words[1]):
+                table = counter_table(words[1])
+                if not words[2].isdigit() or int(words[2]) not in tables.get(table, {}):
+                    output = "Invalid counter operation (INVALID_ENTRY_HANDLE)"
+                else:
+                    packets, bytes_ = counters.get(table, {}).get(int(words[2]), [0, 0])
+                    output = (f"this is the direct counter for table {table}\n"
+                              f"{words[1]}[{words[2]}]=  BmCounterValue(packets={packets}, bytes={bytes_})")
+            else:
+                output = f"*** Unknown syntax: {command}"
+            print(f"RuntimeCmd: {output}")
+    print("RuntimeCmd: ")
+    with open(args.tables, 'w') as f:
+        json.dump({"tables": tables, "counters": counters, "version": version, "sessions": sessions + 1}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Decision-tree compilation over any number of header features.
+
+Every feature has a table that sets its action_select metadata field to the number of the interval its value
+falls in (0 on a miss), and ipv4_exact matches the action_select fields of all the features. simple_switch.p4 has
+three features with 14-bit action_select fields. With other features, every field gets the fewest bits that number
+its intervals, and the fields together must fit a budget of metadata bits. When they do not, the intervals no leaf
+tells apart are merged first (see optimize_rules.py). The P4 declarations of the metadata, actions, tables and
+apply block are written next to the rules, to be pasted into the program:
+    python3 generate_rules.py --tree tree-ttl.txt --features ip_proto,src_port,dst_port,ttl --p4-out dt_tables.p4
+
+A feature is given by its name in the tree file, or as name=header.field:width, with :tcp for fields of the TCP
+header, which non-TCP packets skip with action_select 1 (the interval of value 0).
+"""
+
+import collections
+
+# name in the tree file, P4 header field, width in bits, whether the field is only valid for TCP packets
+Feature = collections.namedtuple("Feature", "name field width tcp_only")
+
+KNOWN_FEATURES = {feature.name: feature for feature in [
+    Feature("ip_proto", "hdr.ipv4.protocol", 8, False),
+    Feature("src_port", "hdr.tcp.src_port", 16, True),
+    Feature("dst_port", "hdr.tcp.dst_port", 16, True),
+    Feature("ttl", "hdr.ipv4.ttl", 8, False),
+    Feature("pkt_len", "hdr.ipv4.totalLen", 16, False),
+    Feature("diffserv", "hdr.ipv4.diffserv", 8, False),
+    Feature("tcp_window", "hdr.tcp.window", 16, True),
+]}
+# the features and action_select width of simple_switch.p4
+FEATURES = [KNOWN_FEATURES[name] for name in ("ip_proto", "src_port", "dst_port")]
+SELECT_WIDTH = 14
+SELECT_BUDGET = len(FEATURES) * SELECT_WIDTH
+
+
+class FeatureCompileError(Exception):
+    """
+    Raised for invalid feature lists and rules that do not fit the action_select budget.
+    """
+    pass
+
+
+def parse_features(spec):
+    """
+    Parses a comma-separated feature list, e.g. "ip_proto,src_port,dst_port,ttl=hdr.ipv4.ttl:8".
+    :return: list of Feature
+    """
+    features = []
+    for item in spec.split(","):
+        name, _, definition = item.strip().partition("=")
+        if not definition:
+            if name not in KNOWN_FEATURES:
+                raise FeatureCompileError(f"unknown feature {name}, give it as {name}=header.field:width "
+                                          f"or use one of {', '.join(KNOWN_FEATURES)}")
+            features.append(KNOWN_FEATURES[name])
+            continue
+        parts = definition.split(":")
+        if len(parts) not in (2, 3) or not parts[1].isdigit() or parts[2:] not in ([], ["tcp"]):
+            raise FeatureCompileError(f"invalid feature {item}, expected name=header.field:width[:tcp]")
+        features.append(Feature(name, parts[0], int(parts[1]), parts[2:] == ["tcp"]))
+    names = [feature.name for feature in features]
+    if len(set(names)) != len(names):
+        raise FeatureCompileError(f"duplicate feature in {spec}")
+    return features
+
+
+def tables(feature_count):
+    """
+    The tables of the features and ipv4_exact, in the order the rules are loaded.
+    """
+    return [f"MyIngress.feature{i}_exact" for i in range(1, feature_count + 1)] + ["MyIngress.ipv4_exact"]
+
+
+def select_widths(interval_counts, versioned=False):
+    """
+    The fewest bits of every action_select field, whose values 1..n number the intervals (0 is a miss), plus the
+    top bit of the version for versioned rules.
+    """
+    return [max(count.bit_length(), 1) + versioned for count in interval_counts]
+
+
+def check_widths(interval_counts, widths, versioned=False):
+    """
+    Raises FeatureCompileError if an action_select field cannot number the intervals of its feature.
+    """
+    for feature, (count, width) in enumerate(zip(interval_counts, widths), 1):
+        if count.bit_length() > width - versioned:
+            raise FeatureCompileError(f"feature {feature} has {count} intervals, more than its "
+                                      f"{width}-bit action_select can number")
+
+
+def table_size(entries):
+    """
+    The declared size of a table: the next power of two of its entries, at least 16.
+    """
+    return max(16, 1 << max(entries - 1, 0).bit_length())
+
+
+def p4_declarations(features, widths, entries, match="range", versioned=False):
+    """
+    The P4 declarations of the compiled tables.
+    :param widths: bits of the action_select field of every feature
+    :param entries: entries of every table, in the order of tables()
+    :param match: "range", "ternary" or "prefix" as in generate_rules
+    """
+    feature_match = {"range": "range", "ternary": "ternary", "prefix": "lpm"}[match]
+    select_match = "range" if match == "range" else "ternary"
+    names = ", ".join(feature.name for feature in features)
+    lines = [f"// Decision-tree tables over {names}, generated by generate_rules.py", "",
+             "// metadata, replaces the action_select fields of struct metadata", "struct metadata {"]
+    lines += [f"     bit<{width}> action_select{i};" for i, width in enumerate(widths, 1)]
+    if versioned:
+        lines.append("     bit<1> version;")
+    lines += ["}", "", "// MyIngress declarations"]
+    if versioned:
+        lines += ["    register<bit<1>>(1) rules_version;", ""]
+    for i, (feature, width) in enumerate(zip(features, widths), 1):
+        lines += [f"    action set_actionselect{i}(bit<{width}> featurevalue{i}) {{",
+                  f"        meta.action_select{i} = featurevalue{i};",
+                  "    }", "",
+                  f"    table feature{i}_exact {{",
+                  "        key = {"]
+        if versioned:
+            lines.append("            meta.version : exact;")
+        lines += [f"            {feature.field} : {feature_match};",
+                  "        }",
+                  "        actions = {",
+                  "            NoAction;",
+                  f"            set_actionselect{i};",
+                  "        }",
+                  f"        size = {table_size(entries[i - 1])};",
+                  "    }", ""]
+    lines += ["    table ipv4_exact {", "        key = {"]
+    lines += [f"            meta.action_select{i} : {select_match};" for i in range(1, len(features) + 1)]
+    lines += ["        }",
+              "        actions = {",
+              "            ipv4_forward;",
+              "            drop;",
+              "            NoAction;",
+              "        }",
+              f"        size = {table_size(entries[-1])};",
+              "        default_action = drop();",
+              "    }", "",
+              "// MyIngress apply block, the decision-tree part",
+              "    apply {",
+              "        if (hdr.ipv4.isValid()) {"]
+    if versioned:
+        lines.append("            rules_version.read(meta.version, 0);")
+    tcp = [i for i, feature in enumerate(features, 1) if feature.tcp_only]
+    lines += [f"            feature{i}_exact.apply();" for i, feature in enumerate(features, 1) if not feature.tcp_only]
+    if tcp:
+        lines.append("            if (hdr.ipv4.protocol == IPV4_TCP) {")
+        lines += [f"                feature{i}_exact.apply();" for i in tcp]
+        lines.append("            } else {")
+        for i in tcp:
+            one = f"((bit<{widths[i - 1]}>)meta.version << {widths[i - 1] - 1}) | 1" if versioned else "1"
+            lines.append(f"                meta.action_select{i} = {one};")
+        lines.append("            }")
+    lines += ["        }", "        ipv4_exact.apply();", "    }", ""]
+    return "\n".join(lines)
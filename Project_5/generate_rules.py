@@ -1,77 +1,50 @@
-import re
+import argparse
+import bisect
+import shlex
+import subprocess
+import time
 
-fields = ["ip_proto", "src_port", "dst_port"]
-# fields = ["proto", "src", "dst"] # for the lecture demo and their tree file, uncomment this
+import optimize_rules
+import update_rules
+from feature_compiler import (FEATURES, SELECT_BUDGET, SELECT_WIDTH, FeatureCompileError, check_widths,
+                              p4_declarations, parse_features, select_widths, tables)
+from tree_parser import SCHEMAS, parse_tree_file
 
-def parse_tree(tree_file):
-    """
-    Parses the decision tree file and extracts ranges tables, conditions and actions.
-    """
-    with open(tree_file, 'r') as f:
-        lines = f.readlines()
+CLI = "simple_switch_CLI --thrift-port 9090"
+"""Class matching guide (see https://github.com/grupogita/ONOSP4-tutorial/blob/main/DecisionTrees2/README.md):"""
+# Maps class to action
+class_to_action_map = {
+    0: 2,
+    1: 3,
+    2: 2,
+    3: 3,
+    4: 4,
+}
+# Maps action to host and port
+action_to_host_port_map = {
+    0: (), # drop
+    2: (2, 2),
+    3: (3, 3),
+    4: (4, 4),
+}
 
-    ip_proto = []
-    src_port = []
-    dst_port = []
-    conditions = []
+# tables the rules are added to, in the order they are loaded
+TABLES = tables(len(FEATURES))
+# register of the rule version of simple_switch.p4 compiled with -DVERSIONED
+VERSION_REGISTER = "MyIngress.rules_version"
 
-    for line in lines:
-        line = line.strip()
+def parse_tree(tree_file, fields=None, max_values=None):
+    """
+    Parses the decision tree file into its thresholds and leaves, see tree_parser.py.
+    """
+    return parse_tree_file(tree_file, fields, max_values)
 
-        if not line or line.startswith("#"):
-            continue
-        try:
-            if "when" in line:
-                when_match = re.match(r"when\s*(.*?)\s*then\s*(\d+);?", line)
-                if when_match:
-                    condition = when_match.group(1).strip()
-                    class_ = int(when_match.group(2).strip())
-                    conditions.append((condition, class_))
-            else:
-                match = re.search(r"=\s*(\[[^\]]*\])", line)
-                if "proto" in line and match:
-                    ip_proto = eval(match.group(1))
-                elif "src" in line and match:
-                    src_port = eval(match.group(1))
-                elif "dst" in line and match:
-                    dst_port = eval(match.group(1))
-        except Exception as e:
-            print(f"Error parsing line: {line}\n{e}")
-
-    return ip_proto, src_port, dst_port, conditions
-
-def extract_range(condition, field, value_list, max_val):
-    """
-    Extracts the min and max range for a field in a condition based on condition field inequalities.
-    """
-    matches = re.findall(rf"{field}([<>=!]+)(\d+)", condition)
-    min_range = 0
-    max_range = max_val
-
-    for operator, value in matches:
-        value = int(value)
-        if operator in ("<", "<="):
-            max_range = min(max_range, value - 1 if operator == "<" else value)
-        elif operator in (">", ">="):
-            min_range = max(min_range, value + 1 if operator == ">" else value)
-        elif operator == "=":
-            min_range = max(min_range, value)
-            max_range = min(max_range, value)
-
-    # map the extracted range to action select range indices
-    start_action = 1
-    end_action = 1
-
-    for i, val in enumerate(sorted(value_list + [max_val])):
-        if min_range <= val:
-            start_action = i + 1
-            break
-    for i, val in enumerate(sorted(value_list + [max_val])):
-        if max_range <= val:
-            end_action = i + 1
-            break
-
-    return start_action, end_action
+def action_range(low, high, starts):
+    """
+    Maps the values low..high of a feature to the range of action_select values of the intervals they span.
+    :param starts: the first value of every interval of the feature
+    """
+    return bisect.bisect_right(starts, low), bisect.bisect_right(starts, high)
 
 def class_to_action(class_, class_to_action_map):
     """
@@ -103,92 +76,370 @@ def get_dst_host_ip_port_string(class_, class_to_action_map, action_to_host_port
     host_in_hex = f"0x0A00010{host:X}"
     return f"{host_in_hex} {port}"
 
-def generate_rules(ip_proto, src_port, dst_port, conditions, class_to_action_map, action_to_host_port_map):
+def feature_intervals(value_list, max_val):
+    """
+    Splits the values of a feature after every split point, interval i sets action_select to i + 1 unless
+    select_numbers keeps the values of the loaded rules.
+    """
+    intervals = []
+    prev_val = 0
+    for val in sorted(value_list):
+        intervals.append((prev_val, val))
+        prev_val = val + 1
+    intervals.append((prev_val, max_val))
+    return intervals
+
+def select_numbers(intervals, previous, largest):
     """
-    Generates rules for shell script based on the decision tree.
+    Numbers the intervals of a feature with increasing action_select values. Without previous rules they are
+    1..n, with them every interval the previous rules share keeps its value where the order leaves room, so the
+    ipv4_exact entries of the leaves an update keeps keep their keys. The first interval, the one of the value 0
+    non-TCP packets get for the ports, is always 1.
+    :param previous: dict (low, high) -> action_select value of the interval in the previous rules
+    :param largest: largest action_select value of the field
+    :return: list of the action_select value of every interval
     """
+    if not previous:
+        return list(range(1, len(intervals) + 1))
+    count = len(intervals)
+    # intervals i < j can keep their values v_i < v_j if the j - i - 1 intervals between them fit, v_j - j >= v_i - i,
+    # so the longest run of intervals with a non-decreasing v - i keeps its values
+    candidates = []
+    for i, interval in enumerate(intervals[1:], 1):
+        value = previous.get(interval)
+        if value is not None and 1 <= value - i <= largest - count + 1:
+            candidates.append((i, value))
+    tails, tail_candidates, parents = [], [], []
+    for candidate, (i, value) in enumerate(candidates):
+        slot = bisect.bisect_right(tails, value - i)
+        if slot == len(tails):
+            tails.append(value - i)
+            tail_candidates.append(candidate)
+        else:
+            tails[slot] = value - i
+            tail_candidates[slot] = candidate
+        parents.append(tail_candidates[slot - 1] if slot else None)
+    kept = {0: 1}
+    candidate = tail_candidates[-1] if tail_candidates else None
+    while candidate is not None:
+        i, value = candidates[candidate]
+        kept[i] = value
+        candidate = parents[candidate]
+    # the other intervals are spread between the kept ones, leaving room for the intervals of later updates
+    anchors = sorted(kept.items()) + [(count, largest + 1)]
+    numbers = []
+    for (i, value), (j, end) in zip(anchors, anchors[1:]):
+        step = (end - value) // (j - i)
+        numbers.extend(value + k * step for k in range(j - i))
+    return numbers
 
-    def generate_range_rules(feature_name, value_list, max_val, action_offset):
+def tree_leaves(tree, intervals, class_to_action_map, action_to_host_port_map):
+    """
+    Returns the leaves of the tree as (action_select ranges per feature, ipv4_forward parameters),
+    leaving out the leaves no packet can reach.
+    """
+    starts = [[low for low, high in feature] for feature in intervals]
+    leaves = []
+    for tests, leaf_intervals, action_class in tree.leaves:
+        if any(low > high for low, high in leaf_intervals):
+            continue
+        ranges = tuple(action_range(low, high, feature) for (low, high), feature in zip(leaf_intervals, starts))
+        leaves.append((ranges, get_dst_host_ip_port_string(action_class, class_to_action_map, action_to_host_port_map)))
+    return leaves
+
+def generate_rules(tree, class_to_action_map, action_to_host_port_map, optimize=False, match="range", version=None,
+                   features=FEATURES, select_budget=None, previous=None):
+    """
+    Generates the table_add commands of the decision tree.
+    optimize - merge the intervals and leaves that lead to the same action, see optimize_rules.py
+    match - "range" entries, or "ternary" or "prefix" entries for targets without range matching
+            ("prefix" gives lpm entries in the feature tables and, as ipv4_exact has several keys, ternary ones there)
+    version - 0 or 1, the rule version of a program compiled with -DVERSIONED: the feature tables match the
+              version and it becomes the top bit of every action_select value
+    features - the features of the tree, in the order of its fields, see feature_compiler.py
+    select_budget - total bits of the action_select fields, each gets the fewest bits its intervals need,
+                    by default every field has the 14 bits of simple_switch.p4
+    previous - list per feature of dict (low, high) -> action_select value of the loaded rules, see
+               update_rules.loaded_selects: the intervals they share keep their value
+    :return: (list of the rules of every feature table, rules of ipv4_exact, bits of every action_select field)
+    """
+    intervals = [feature_intervals(tree.split_points(feature), max_val) for feature, max_val in enumerate(tree.max_values)]
+    leaves = tree_leaves(tree, intervals, class_to_action_map, action_to_host_port_map)
+    if optimize:
+        intervals, leaves = optimize_rules.optimize(intervals, leaves)
+    versioned = version is not None
+    if select_budget is None:
+        widths = [SELECT_WIDTH] * len(features)
+    else:
+        widths = select_widths([len(feature) for feature in intervals], versioned)
+        if sum(widths) > select_budget and not optimize:
+            # merging intervals no leaf tells apart changes no classification
+            intervals, leaves = optimize_rules.optimize(intervals, leaves)
+            widths = select_widths([len(feature) for feature in intervals], versioned)
+        if sum(widths) > select_budget:
+            raise FeatureCompileError(f"the action_select fields need {sum(widths)} bits "
+                                      f"({', '.join(map(str, widths))}), more than the budget of {select_budget}")
+    check_widths([len(feature) for feature in intervals], widths, versioned)
+    numbers = [select_numbers(feature, selects, (1 << (width - versioned)) - 1)
+               for feature, selects, width in zip(intervals, previous or [None] * len(features), widths)]
+    offsets = [version << (width - 1) if versioned else 0 for width in widths]
+    version_key = f"{version} " if versioned else ""
+
+    def generate_range_rules(feature):
         """
         Generates range-based rules for a feature.
         """
-        if not value_list:
-            return [f"simple_switch_CLI --thrift-port 9090 <<< \"table_add MyIngress.{feature_name}_exact MyIngress.set_actionselect{action_offset} 0x0->0x{max_val:X} => 1 1\""]
-
         rules = []
-        prev_val = 0
-        action = 1
-
-        for val in sorted(value_list):
-            rules.append(f"simple_switch_CLI --thrift-port 9090 <<< \"table_add MyIngress.{feature_name}_exact MyIngress.set_actionselect{action_offset} 0x{prev_val:X}->0x{val:X} => {action} 1\"")
-            prev_val = val + 1
-            action += 1
-
-        rules.append(f"simple_switch_CLI --thrift-port 9090 <<< \"table_add MyIngress.{feature_name}_exact MyIngress.set_actionselect{action_offset} 0x{prev_val:X}->0x{max_val:X} => {action} 1\"")
+        width = features[feature].width
+        for number, (low, high) in zip(numbers[feature], intervals[feature]):
+            action = offsets[feature] + number
+            table_add = f"table_add MyIngress.feature{feature + 1}_exact MyIngress.set_actionselect{feature + 1} {version_key}"
+            if match == "range":
+                rules.append(f"{table_add}0x{low:X}->0x{high:X} => {action} 1")
+            elif match == "ternary":
+                rules.extend(f"{table_add}{key} => {action} 1" for key in optimize_rules.ternary_keys(low, high, width))
+            else:
+                rules.extend(f"{table_add}0x{value:X}/{length} => {action}"
+                             for value, length in optimize_rules.prefix_cover(low, high, width))
         return rules
 
-    feature1_rules = generate_range_rules("feature1", ip_proto, 0x20, 1)
-    feature2_rules = generate_range_rules("feature2", src_port, 0xFFFF, 2)
-    feature3_rules = generate_range_rules("feature3", dst_port, 0xFFFF, 3)
+    feature_rules = [generate_range_rules(feature) for feature in range(len(features))]
 
     forwarding_rules = []
-    for condition, action_class in conditions:
-        proto_action_start, proto_action_end = extract_range(condition, fields[0], ip_proto, 0x20)
-        src_action_start, src_action_end = extract_range(condition, fields[1], src_port, 0xFFFF)
-        dst_action_start, dst_action_end = extract_range(condition, fields[2], dst_port, 0xFFFF)
+    for ranges, action_params in leaves:
+        ranges = [(feature[start - 1] + offset, feature[end - 1] + offset)
+                  for (start, end), feature, offset in zip(ranges, numbers, offsets)]
+        table_add = "table_add MyIngress.ipv4_exact MyIngress.ipv4_forward"
+        if match == "range":
+            keys = [" ".join(f"{start}->{end}" for start, end in ranges)]
+        else:
+            keys = [""]
+            for (start, end), width in zip(ranges, widths):
+                keys = [f"{key} {ternary}".strip() for key in keys
+                        for ternary in optimize_rules.ternary_keys(start, end, width)]
+        forwarding_rules.extend(f"{table_add} {key} => {action_params} 1" for key in keys)
 
-        forwarding_rules.append(
-            f"simple_switch_CLI --thrift-port 9090 <<< \"table_add MyIngress.ipv4_exact MyIngress.ipv4_forward "
-            f"{proto_action_start}->{proto_action_end} {src_action_start}->{src_action_end} {dst_action_start}->{dst_action_end} => {get_dst_host_ip_port_string(action_class, class_to_action_map, action_to_host_port_map)} 1\""
-        )
+    return feature_rules, forwarding_rules, widths
 
-    return feature1_rules, feature2_rules, feature3_rules, forwarding_rules
 
-
-def write_rules_script(feature1_rules, feature2_rules, feature3_rules, forwarding_rules, output_file):
+def write_rules_script(feature_rules, forwarding_rules, output_file, cli=CLI):
     """
-    Writes the rules to a shell script.
+    Writes the rules to a shell script, one CLI call per rule.
     """
     with open(output_file, 'w') as f:
-        if feature1_rules:
-            for rule in feature1_rules:
-                f.write(rule + ";\n")
-            f.write("\n")
-        if feature2_rules:
-            for rule in feature2_rules:
-                f.write(rule + ";\n")
-            f.write("\n")
-        if feature3_rules:
-            for rule in feature3_rules:
-                f.write(rule + ";\n")
-            f.write("\n")
+        for rules in feature_rules:
+            if rules:
+                for rule in rules:
+                    f.write(f"{cli} <<< \"{rule}\";\n")
+                f.write("\n")
         for rule in forwarding_rules:
-            f.write(rule + ";\n")
+            f.write(f"{cli} <<< \"{rule}\";\n")
+
+
+def batch_commands(feature_rules, forwarding_rules, clear=True):
+    """
+    Returns the commands of one CLI session: the table clears, then all the rules.
+    """
+    commands = [f"table_clear {table}" for table in tables(len(feature_rules))] if clear else []
+    return commands + [rule for rules in feature_rules for rule in rules] + forwarding_rules
+
+
+def write_rules_batch(commands, output_file):
+    """
+    Writes the commands to a file for a single CLI session: simple_switch_CLI --thrift-port 9090 < rules-dt.txt
+    """
+    with open(output_file, 'w') as f:
+        for command in commands:
+            f.write(command + "\n")
+
+
+def expected_entries(commands, tables=TABLES):
+    """
+    Returns the number of entries every table has after the commands.
+    """
+    entries = {table: 0 for table in tables}
+    for command in commands:
+        words = command.split()
+        if words[0] == "table_clear":
+            entries[words[1]] = 0
+        elif words[0] == "table_add":
+            entries[words[1]] = entries.get(words[1], 0) + 1
+        elif words[0] == "table_delete":
+            entries[words[1]] = entries.get(words[1], 0) - 1
+    return entries
+
+
+def run_session(commands, cli=CLI):
+    """
+    Sends the commands through one CLI session.
+    :return: (list of the answers to the commands, time in s)
+    """
+    start = time.time()
+    process = subprocess.run(shlex.split(cli), input="\n".join(commands) + "\n", capture_output=True, text=True)
+    elapsed = time.time() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{cli} exited with {process.returncode}: {process.stderr.strip()}")
+    # the CLI prints its prompt before reading every command, so the answer to command i follows prompt i
+    answers = [answer.strip() for answer in process.stdout.split("RuntimeCmd:")[1:]]
+    return answers + [""] * (len(commands) - len(answers)), elapsed
+
+
+def load_rules(commands, cli=CLI, expected=None):
+    """
+    Sends the commands through one CLI session, then checks the number of entries of every table.
+    :param expected: entries every table should have, by default counted from the commands
+    :return: (dict of table -> (expected entries, entries in the switch), error lines of the CLI, load time in s,
+    answers to the commands)
+    """
+    expected = expected or expected_entries(commands)
+    session = commands + [f"table_num_entries {table}" for table in expected]
+    answers, elapsed = run_session(session, cli)
+    errors = [f"{command}: {answer}" for command, answer in zip(session, answers)
+              if answer.startswith(("Error", "Invalid", "***"))]
+    counts = [int(answer) if answer.isdigit() else None for answer in answers[len(commands):len(session)]]
+    return ({table: (expected[table], count) for table, count in zip(expected, counts)}, errors, elapsed,
+            answers[:len(commands)])
 
 
 if __name__ == "__main__":
 
-    tree_file = "tree-four.txt"
-    output_file = "rules-dt.sh"
-
-    """Class matching guide (see https://github.com/grupogita/ONOSP4-tutorial/blob/main/DecisionTrees2/README.md):"""
-    # Maps class to action
-    class_to_action_map = {
-        0: 2,
-        1: 3,
-        2: 2,
-        3: 3,
-        4: 4,
-    }
-    # Maps action to host and port
-    action_to_host_port_map = {
-        0: (), # drop
-        2: (2, 2),
-        3: (3, 3),
-        4: (4, 4),
-    }
-
-    ip_proto, src_port, dst_port, conditions = parse_tree(tree_file)
-    feature1_rules, feature2_rules, feature3_rules, forwarding_rules = generate_rules(ip_proto, src_port, dst_port, conditions, class_to_action_map, action_to_host_port_map)
-    write_rules_script(feature1_rules, feature2_rules, feature3_rules, forwarding_rules, output_file)
-    print(f"Rules script generated: {output_file}")
+    parser = argparse.ArgumentParser(description="Generate the P4 table rules of a decision tree")
+    parser.add_argument("--tree", default="tree-four.txt", help="decision tree file")
+    parser.add_argument("--fields", choices=sorted(SCHEMAS),
+                        help="feature names of the tree file, detected from the file by default")
+    parser.add_argument("--features", help="features of the tree instead of the three of simple_switch.p4, e.g. "
+                                           "ip_proto,src_port,dst_port,ttl, see feature_compiler.py")
+    parser.add_argument("--select-bits", type=int,
+                        help=f"bit budget of all action_select fields, each gets the bits it needs "
+                             f"(default {SELECT_BUDGET} with --features, otherwise {SELECT_WIDTH} bits per field)")
+    parser.add_argument("--p4-out", help="also write the P4 metadata, table and apply declarations of the rules")
+    parser.add_argument("--mode", choices=["script", "batch", "load", "diff", "update"], default="script",
+                        help="script: a shell script with one CLI call per rule (default), batch: a command file "
+                             "for one CLI session, load: load the rules through one CLI session now, diff: a "
+                             "command file updating the loaded rules to the new ones, update: run that update now")
+    parser.add_argument("-o", "--output", help="output file, rules-dt.sh, rules-dt.txt or rules-update.txt by default")
+    parser.add_argument("--state", default="rules-dt.state.json",
+                        help="entries in the switch and their handles, written by load and update, read by diff "
+                             "and update")
+    parser.add_argument("--versioned", action="store_true",
+                        help="rules for simple_switch.p4 compiled with -DVERSIONED, updated by switching versions")
+    parser.add_argument("--cli", default=CLI, help=f"switch CLI command, default {CLI}")
+    parser.add_argument("--no-clear", action="store_true", help="do not clear the tables before adding the rules")
+    parser.add_argument("--optimize", action="store_true",
+                        help="merge the intervals and leaves that lead to the same action")
+    parser.add_argument("--match", choices=["range", "ternary", "prefix"], default="range",
+                        help="match kind of the entries, the P4 program must declare the same")
+    parser.add_argument("--p4", default="simple_switch.p4", help="P4 program with the table sizes")
+    args = parser.parse_args()
+
+    tree_file = args.tree
+    output_file = args.output or {"batch": "rules-dt.txt", "diff": "rules-update.txt"}.get(args.mode, "rules-dt.sh")
+    if args.versioned and args.mode == "script":
+        parser.error("--versioned rules are loaded in one CLI session, use --mode batch, load, diff or update")
+
+    version = 0 if args.versioned else None
+    if args.mode in ("diff", "update"):
+        old_version, old_entries = update_rules.load_state(args.state)
+        if args.versioned != (old_version is not None):
+            parser.error(f"{args.state} holds {'un' if old_version is None else ''}versioned rules, "
+                         f"{'load them with --versioned first' if old_version is None else 'update them with --versioned'}")
+        if args.versioned:
+            version = 1 - old_version
+
+    try:
+        features = parse_features(args.features) if args.features else FEATURES
+    except FeatureCompileError as e:
+        parser.error(str(e))
+    table_names = tables(len(features))
+    select_budget = args.select_bits or (SELECT_BUDGET if args.features else None)
+    if args.features:
+        tree = parse_tree(tree_file, [feature.name for feature in features],
+                          [(1 << feature.width) - 1 for feature in features])
+    else:
+        tree = parse_tree(tree_file, SCHEMAS.get(args.fields))
+    previous = None
+    if args.mode in ("diff", "update") and not args.versioned and args.match == "range":
+        # intervals the loaded rules share keep their action_select value, and the leaves the tree keeps their keys
+        previous = update_rules.loaded_selects([command for command, handle in old_entries], len(features))
+    try:
+        feature_rules, forwarding_rules, widths = generate_rules(tree, class_to_action_map, action_to_host_port_map, args.optimize, args.match, version, features, select_budget, previous)
+    except FeatureCompileError as e:
+        raise SystemExit(f"Cannot compile {tree_file}: {e}")
+    all_rules = [rule for rules in feature_rules for rule in rules] + forwarding_rules
+    if args.p4_out:
+        with open(args.p4_out, 'w') as f:
+            f.write(p4_declarations(features, widths, [len(rules) for rules in feature_rules] + [len(forwarding_rules)],
+                                    args.match, args.versioned))
+        print(f"P4 declarations written to {args.p4_out}, action_select bits {', '.join(map(str, widths))}")
+    over_capacity = False
+    for table, entries, size in optimize_rules.capacity_report(all_rules, optimize_rules.table_sizes(args.p4)):
+        print(f"{table}: {entries} entries of {size if size else 'unknown size'}{' OVER CAPACITY' if size and entries > size else ''}")
+        over_capacity |= bool(size and entries > size)
+    if args.mode == "script":
+        write_rules_script(feature_rules, forwarding_rules, output_file, args.cli)
+        print(f"Rules script generated: {output_file}")
+    elif args.mode in ("diff", "update"):
+        new_commands = all_rules
+        if args.versioned:
+            commands, added = update_rules.versioned_plan(old_entries, new_commands, version)
+            window, worst = 0, 0
+        else:
+            # the reference model only knows the three features of simple_switch.p4
+            commands, added, window, worst = update_rules.in_place_plan(old_entries, new_commands, table_names,
+                                                                        0 if args.features else 500)
+            if window is None or len(commands) > len(new_commands) + len(table_names):
+                print(f"In-place update of {len(commands)} commands "
+                      f"{'not replayed' if window is None else 'longer than a reload'}, clearing and reloading instead")
+                commands, added = update_rules.reload_plan(new_commands, table_names)
+                window, worst = len(commands), None
+        kinds = [command.split()[0] for command in commands]
+        print(f"Update: {len(commands)} commands instead of {len(new_commands) + len(table_names)}"
+              + "".join(f", {kinds.count(kind)} {kind}" for kind in sorted(set(kinds))))
+        for table, peak in update_rules.peak_entries(old_entries, commands, table_names).items():
+            size = optimize_rules.table_sizes(args.p4).get(table.split('.')[-1])
+            if size and peak > size:
+                print(f"{table}: {peak} entries during the update, more than its {size} OVER CAPACITY")
+                over_capacity = True
+        if worst is None:
+            print(f"Window of inconsistency: the whole reload, {window} commands")
+        elif args.versioned:
+            print(f"Window of inconsistency: none, the rules switch to version {version} with one register write")
+        else:
+            print(f"Window of inconsistency: {window} commands, at most {worst} packets of the header space get "
+                  f"an action of neither rule set")
+        if args.mode == "diff":
+            write_rules_batch(commands, output_file)
+            print(f"Update batch generated: {output_file}, load it with: {args.cli} < {output_file}, "
+                  f"the next diff needs the state of --mode update")
+        else:
+            expected = expected_entries(new_commands, table_names)
+            table_counts, errors, elapsed, answers = load_rules(commands, args.cli, expected)
+            for error in errors:
+                print(f"CLI error: {error}")
+            for table, (expected, count) in table_counts.items():
+                print(f"{table}: {count} entries, expected {expected}{'' if count == expected else ' MISMATCH'}")
+            print(f"Updated with {len(commands)} commands in {elapsed:.3f} s"
+                  + (f", inconsistent for about {window * elapsed / max(len(commands), 1):.3f} s" if window else ""))
+            update_rules.save_state(args.state, version,
+                                    update_rules.updated_entries(old_entries, commands, added, answers))
+            if errors or any(count != expected for expected, count in table_counts.values()):
+                raise SystemExit(1)
+    else:
+        commands = batch_commands(feature_rules, forwarding_rules, not args.no_clear)
+        if args.versioned:
+            commands.append(f"register_write {VERSION_REGISTER} 0 {version}")
+        if args.mode == "batch":
+            write_rules_batch(commands, output_file)
+            print(f"Rules batch generated: {output_file}, load it with: {args.cli} < {output_file}")
+        else:
+            table_counts, errors, elapsed, answers = load_rules(commands, args.cli, expected_entries(commands, table_names))
+            update_rules.save_state(args.state, version, update_rules.loaded_entries(commands, answers))
+            for error in errors:
+                print(f"CLI error: {error}")
+            for table, (expected, count) in table_counts.items():
+                print(f"{table}: {count} entries, expected {expected}{'' if count == expected else ' MISMATCH'}")
+            print(f"Loaded {len(commands)} commands in one session in {elapsed:.3f} s")
+            if errors or any(count != expected for expected, count in table_counts.values()):
+                raise SystemExit(1)
+    if over_capacity:
+        raise SystemExit(1)
@@ -0,0 +1,147 @@
+"""
+Table-entry minimization of the decision-tree rules.
+
+The rules are kept as intervals and leaves:
+    intervals: per feature table, the list of (low, high) value ranges, interval i sets action_select to i + 1
+    leaves:    list of (((start1, end1), (start2, end2), (start3, end3)), action parameters), the action_select
+               ranges of an ipv4_exact entry and its ipv4_forward parameters
+
+Two reductions are repeated until neither changes anything:
+    - adjacent intervals of a feature that fall in exactly the same leaves are merged into one action_select value
+    - leaves with the same action that are adjacent along one feature and equal along the others are merged
+
+For targets without range matching, ranges are converted to prefix or ternary entries, the minimal prefix cover of
+every range (the ternary entries of ipv4_exact are the cross product of the covers of its three ranges).
+"""
+
+import re
+
+# Width in bits of the keys: ipv4.protocol, tcp.src_port, tcp.dst_port and the action_select metadata
+FEATURE_WIDTHS = [8, 16, 16]
+ACTION_SELECT_WIDTH = 14
+
+
+def merge_intervals(intervals, leaves):
+    """
+    Merges the adjacent intervals of every feature that no leaf tells apart and renumbers the leaf ranges.
+    :return: (intervals, leaves)
+    """
+    intervals = [list(feature) for feature in intervals]
+    for feature, feature_intervals in enumerate(intervals):
+        # leaves containing every action_select value of the feature
+        signatures = [tuple(ranges[feature][0] <= value <= ranges[feature][1] for ranges, action in leaves)
+                      for value in range(1, len(feature_intervals) + 1)]
+        renumber = [1]
+        merged = [feature_intervals[0]]
+        for value in range(1, len(feature_intervals)):
+            if signatures[value] == signatures[value - 1]:
+                merged[-1] = (merged[-1][0], feature_intervals[value][1])
+            else:
+                merged.append(feature_intervals[value])
+            renumber.append(len(merged))
+        intervals[feature] = merged
+        renumbered = []
+        for ranges, action in leaves:
+            ranges = list(ranges)
+            start, end = ranges[feature]
+            ranges[feature] = (renumber[start - 1], renumber[end - 1])
+            renumbered.append((tuple(ranges), action))
+        leaves = renumbered
+    return intervals, leaves
+
+
+def merge_leaves(leaves):
+    """
+    Merges leaves with the same action whose ranges are adjacent along one feature and equal along the others.
+    """
+    changed = True
+    while changed:
+        changed = False
+        for feature in range(len(leaves[0][0]) if leaves else 0):
+            groups = {}
+            for ranges, action in leaves:
+                key = (action, ranges[:feature] + ranges[feature + 1:])
+                groups.setdefault(key, []).append(ranges)
+            merged = []
+            for (action, others), group in groups.items():
+                group.sort(key=lambda ranges: ranges[feature])
+                current = group[0]
+                for ranges in group[1:]:
+                    if ranges[feature][0] == current[feature][1] + 1:
+                        current = current[:feature] + ((current[feature][0], ranges[feature][1]),) + \
+                            current[feature + 1:]
+                        changed = True
+                    else:
+                        merged.append((current, action))
+                        current = ranges
+                merged.append((current, action))
+            leaves = merged
+    return leaves
+
+
+def optimize(intervals, leaves):
+    """
+    Repeats the interval and leaf merges until the entry count stops shrinking.
+    :return: (intervals, leaves)
+    """
+    while True:
+        count = sum(len(feature) for feature in intervals) + len(leaves)
+        leaves = merge_leaves(leaves)
+        intervals, leaves = merge_intervals(intervals, leaves)
+        if sum(len(feature) for feature in intervals) + len(leaves) == count:
+            return intervals, sorted(leaves)
+
+
+def prefix_cover(low, high, width):
+    """
+    Minimal list of (value, prefix length) prefixes covering the range low..high of a width-bit key.
+    """
+    prefixes = []
+    while low <= high:
+        size = low & -low if low else 1 << width
+        while size > high - low + 1:
+            size >>= 1
+        prefixes.append((low, width - size.bit_length() + 1))
+        low += size
+    return prefixes
+
+
+def ternary_keys(low, high, width):
+    """
+    Ternary value&&&mask keys covering the range low..high of a width-bit key.
+    """
+    full = (1 << width) - 1
+    return [f"0x{value:X}&&&0x{full ^ (full >> length):X}" for value, length in prefix_cover(low, high, width)]
+
+
+def table_sizes(p4_file):
+    """
+    Reads the size of every table of a P4 program.
+    :return: dict table name -> number of entries
+    """
+    with open(p4_file, 'r') as f:
+        program = f.read()
+    sizes = {}
+    for match in re.finditer(r"\btable\s+(\w+)\s*\{", program):
+        # the body ends at the brace closing the table, the key and actions have braces of their own
+        depth, end = 1, match.end()
+        while depth and end < len(program):
+            depth += {'{': 1, '}': -1}.get(program[end], 0)
+            end += 1
+        size = re.search(r"^\s*size\s*=\s*(\d+)", program[match.end():end], re.M)
+        if size:
+            sizes[match.group(1)] = int(size.group(1))
+    return sizes
+
+
+def capacity_report(commands, sizes):
+    """
+    Counts the table_add commands per table against the table sizes.
+    :return: list of (table, entries, size or None)
+    """
+    entries = {}
+    for command in commands:
+        words = command.split()
+        if words[0] == "table_add":
+            entries[words[1]] = entries.get(words[1], 0) + 1
+    return [(table, count, sizes.get(table.split('.')[-1])) for table, count in entries.items()]
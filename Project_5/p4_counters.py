@@ -0,0 +1,202 @@
+"""
+Polling of the direct counters of simple_switch.p4, to see which leaves of the decision tree carry the traffic.
+
+Every table of simple_switch.p4 has a direct counter of packets and bytes per entry. A poll reads the counters of the
+entries generate_rules.py --mode load recorded in its state file, and of the entries acl_table lists, through one
+CLI session. Between polls, the counts give the packet and byte rate of every entry: the entries of ipv4_exact are
+the leaves of the tree, the entries of the feature tables its intervals. Hot leaves and entries no packet hits
+show up without capturing packets.
+
+The counts are dicts shaped like the OpenFlow flow statistics of of_json.flow_stats_to_list, the match being the
+table, handle, keys and action of the entry and the duration the time since the rules were loaded, so the
+StatsCollector of Project_Final/sdn_statistics.py stores and reports them like its flow statistics
+(sdn_statistics --p4_state=...). On their own:
+    python3 p4_counters.py --state rules-dt.state.json --interval 5 --polls 3
+    python3 p4_counters.py --cli "python3 cli_standin.py --traffic 100000" --interval 1 --polls 3
+
+The client that reads the counters is pluggable: anything with a read(entries) method, see CounterClient.
+"""
+
+import argparse
+import os
+import re
+import time
+
+import generate_rules
+import update_rules
+
+ACL_TABLE = "MyIngress.acl_table"
+COUNTER_VALUE = re.compile(r"packets=(\d+), bytes=(\d+)")
+DUMPED_ENTRY = re.compile(r"Dumping entry (0x[0-9a-fA-F]+)")
+
+
+def counter_name(table):
+    """
+    The direct counter of a table, as named in simple_switch.p4: feature1_exact is counted by
+    feature1_table_counter, ipv4_exact by ipv4_exact_table_counter and acl_table by acl_table_counter.
+    """
+    name = table.split(".")[-1]
+    if name.startswith("feature"):
+        name = name[:-len("_exact")] + "_table"
+    elif name == "ipv4_exact":
+        name += "_table"
+    return f"MyIngress.{name}_counter"
+
+
+class CounterClient(object):
+    """
+    Reads direct counters through the switch CLI, one session per call.
+    """
+
+    def __init__(self, cli=generate_rules.CLI):
+        self.cli = cli
+
+    def handles(self, table):
+        """
+        The handles of the entries of a table, from table_dump.
+        """
+        answers, elapsed = generate_rules.run_session([f"table_dump {table}"], self.cli)
+        return [int(handle, 16) for handle in DUMPED_ENTRY.findall(answers[0])]
+
+    def read(self, entries):
+        """
+        :param entries: list of (table, handle)
+        :return: dict (table, handle) -> (packets, bytes), without the entries whose counter could not be read
+        """
+        commands = [f"counter_read {counter_name(table)} {handle}" for table, handle in entries]
+        answers, elapsed = generate_rules.run_session(commands, self.cli)
+        counts = {}
+        for entry, answer in zip(entries, answers):
+            value = COUNTER_VALUE.search(answer)
+            if value:
+                counts[entry] = (int(value.group(1)), int(value.group(2)))
+        return counts
+
+
+class LeafCounters(object):
+    """
+    The counters of the loaded entries, as flow statistics.
+    """
+
+    def __init__(self, client, state_file="rules-dt.state.json", acl=True):
+        self.client = client
+        self.state_file = state_file
+        self.acl = acl
+        self.loaded = None # modification time of the state file the entries were read from
+        self.entries = {} # (table, handle) -> table_add command
+        self.since = {} # (table, handle) -> time the entry was loaded, or first seen for acl_table entries
+
+    def load(self):
+        """
+        Reads the entries from the state file again when generate_rules.py has changed it.
+        """
+        loaded = os.path.getmtime(self.state_file)
+        if loaded == self.loaded:
+            return
+        version, entries = update_rules.load_state(self.state_file)
+        self.entries = {(command.split()[1], handle): command for command, handle in entries if handle is not None}
+        # entries an update kept have been counting since they were loaded
+        self.since = {entry: self.since.get(entry, loaded) for entry in self.entries}
+        self.loaded = loaded
+
+    def poll(self):
+        """
+        Reads the counters of all entries.
+        :return: list of flow statistics dicts: match (table, handle, keys, action), packet_count, byte_count,
+        duration_sec and duration_nsec since the entry was loaded
+        """
+        self.load()
+        entries = dict(self.entries)
+        if self.acl:
+            acl_entries = [(ACL_TABLE, handle) for handle in self.client.handles(ACL_TABLE)]
+            entries.update((entry, None) for entry in acl_entries)
+            acl_since = {entry: self.since.get(entry, time.time()) for entry in acl_entries}
+            self.since = {entry: since for entry, since in self.since.items() if entry[0] != ACL_TABLE}
+            self.since.update(acl_since)
+        counts = self.client.read(list(entries))
+        now = time.time()
+        stats = []
+        for (table, handle), (packets, bytes_) in counts.items():
+            command = entries[(table, handle)]
+            duration = max(now - self.since[(table, handle)], 1e-3)
+            match = {"table": table, "handle": handle, "keys": "", "action": ""}
+            if command:
+                key, action, params = update_rules.entry_key(command)
+                match.update(keys=" ".join(key[1]), action=f"{action} {params}".strip())
+            stats.append({"match": match, "packet_count": packets, "byte_count": bytes_,
+                          "duration_sec": int(duration), "duration_nsec": int(duration % 1 * 1e9)})
+        return stats
+
+
+def leaves(stats):
+    """
+    The statistics of the leaves of the tree, the entries of ipv4_exact.
+    """
+    return [flow for flow in stats if flow["match"]["table"] == generate_rules.TABLES[-1]]
+
+
+def dead_entries(stats):
+    """
+    The entries no packet has hit.
+    """
+    return [flow for flow in stats if flow["packet_count"] == 0]
+
+
+def rates(stats, previous):
+    """
+    The packet and byte rates of every entry since the previous poll, or since the rules were loaded.
+    :param previous: the statistics of the previous poll or None
+    :return: dict (table, handle) -> (packets per s, bytes per s)
+    """
+    before = {(flow["match"]["table"], flow["match"]["handle"]): flow for flow in previous or []}
+    result = {}
+    for flow in stats:
+        entry = (flow["match"]["table"], flow["match"]["handle"])
+        old = before.get(entry)
+        duration = flow["duration_sec"] + flow["duration_nsec"] / 1e9
+        packets, bytes_ = flow["packet_count"], flow["byte_count"]
+        if old and old["packet_count"] <= packets:
+            duration -= old["duration_sec"] + old["duration_nsec"] / 1e9
+            packets -= old["packet_count"]
+            bytes_ -= old["byte_count"]
+        duration = max(duration, 1e-3)
+        result[entry] = (packets / duration, bytes_ / duration)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Poll the direct counters of the decision-tree rules")
+    parser.add_argument("--state", default="rules-dt.state.json", help="state file of generate_rules.py --mode load")
+    parser.add_argument("--cli", default=generate_rules.CLI, help=f"switch CLI command, default {generate_rules.CLI}")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between polls")
+    parser.add_argument("--polls", type=int, default=0, help="polls before stopping, 0: poll until interrupted")
+    parser.add_argument("--top", type=int, default=10, help="hottest leaves to list")
+    parser.add_argument("--no-acl", action="store_true", help="do not read the counters of acl_table")
+    args = parser.parse_args()
+
+    counters = LeafCounters(CounterClient(args.cli), args.state, acl=not args.no_acl)
+    previous = None
+    poll = 0
+    while not args.polls or poll < args.polls:
+        if poll:
+            time.sleep(args.interval)
+        poll += 1
+        stats = counters.poll()
+        entry_rates = rates(stats, previous)
+        hot = sorted(leaves(stats), key=lambda flow: entry_rates[(flow["match"]["table"], flow["match"]["handle"])],
+                     reverse=True)
+        print(f"Poll {poll}: {len(stats)} entries, {sum(flow['packet_count'] for flow in leaves(stats))} packets "
+              f"on {len(leaves(stats))} leaves")
+        for flow in hot[:args.top]:
+            packet_rate, byte_rate = entry_rates[(flow["match"]["table"], flow["match"]["handle"])]
+            print(f"\tleaf {flow['match']['handle']} ({flow['match']['keys']} => {flow['match']['action']}): "
+                  f"{packet_rate:.1f} packets/s, {byte_rate:.1f} bytes/s, {flow['packet_count']} packets in total")
+        dead = dead_entries(stats)
+        if dead:
+            print(f"\tentries without packets: " +
+                  ", ".join(f"{flow['match']['table'].split('.')[-1]} {flow['match']['handle']}" for flow in dead))
+        previous = stats
+
+
+if __name__ == "__main__":
+    main()
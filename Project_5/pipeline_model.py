@@ -0,0 +1,353 @@
+"""
+NumPy reference model of the decision-tree pipeline of simple_switch.p4, to verify the generated rules.
+
+The model loads the table entries (rules-dt.sh or a batch file of generate_rules.py) and classifies packets like
+the switch: feature1_exact on the IP protocol, feature2_exact and feature3_exact on the TCP ports (other protocols
+get action_select 1 for both), then ipv4_exact on the three action_select values, dropping on a miss. The feature
+tables become lookup arrays over all their key values and ipv4_exact a dense array over the action_select values
+they produce, so classifying a packet is three array lookups. Rules whose array would have more than
+MAX_FORWARD_CELLS cells are refused.
+
+The rules are compared with a direct evaluation of the tree. As both are constant between their thresholds and
+entry boundaries, evaluating one packet per cell of that grid checks the whole (proto, src_port, dst_port) space:
+    python3 pipeline_model.py --tree tree-four.txt --rules rules-dt.sh
+    python3 pipeline_model.py --tree tree-four.txt --rules rules-dt.txt --samples 10000000
+
+The switch only looks at the ports of TCP packets, so the tree is evaluated with both ports 0 for other packets.
+"""
+
+import argparse
+import re
+import time
+
+import numpy as np
+
+import generate_rules
+from optimize_rules import FEATURE_WIDTHS, ACTION_SELECT_WIDTH
+from tree_parser import SCHEMAS
+
+IPV4_TCP = 6
+DROP = "drop"
+CLI_CALL = re.compile(r'<<<\s*"(.*)"')
+OPERATORS = {
+    "<=": np.less_equal, ">=": np.greater_equal, "<": np.less, ">": np.greater,
+    "=": np.equal, "==": np.equal,
+}
+# largest dense array of ipv4_exact, in cells
+MAX_FORWARD_CELLS = 50000000
+
+
+class ModelSizeError(MemoryError):
+    """
+    Raised when the ipv4_exact array of the rules would be larger than MAX_FORWARD_CELLS.
+    """
+    pass
+
+
+def parse_entries(lines):
+    """
+    Reads the table_add commands of the lines of a rules script or batch file, or of a command list.
+    :return: dict table -> list of (priority, keys, action parameters)
+    """
+    entries = {}
+    for line in lines:
+        call = CLI_CALL.search(line)
+        words = (call.group(1) if call else line).split()
+        if not words or words[0] != "table_add":
+            continue
+        arrow = words.index("=>")
+        params = words[arrow + 1:]
+        keys = words[3:arrow]
+        # range and ternary entries end with their priority
+        priority = int(params.pop()) if any("->" in key or "&&&" in key for key in keys) else 0
+        entries.setdefault(words[1], []).append((priority, keys, " ".join(params)))
+    # bmv2 matches the entry with the lowest priority value, ties go to the first added
+    for table_entries in entries.values():
+        table_entries.sort(key=lambda entry: entry[0])
+    return entries
+
+
+def load_entries(rules_file):
+    """
+    Reads the table_add commands of a rules script or batch file.
+    :return: dict table -> list of (priority, keys, action parameters)
+    """
+    with open(rules_file, 'r') as f:
+        return parse_entries(f)
+
+
+def key_matches(key, values, width):
+    """
+    Evaluates a range (low->high), ternary (value&&&mask), lpm (value/length) or exact key on an array of values.
+    """
+    if "->" in key:
+        low, high = (int(value, 0) for value in key.split("->"))
+        return (values >= low) & (values <= high)
+    if "&&&" in key:
+        value, mask = (int(part, 0) for part in key.split("&&&"))
+        return (values & mask) == value
+    if "/" in key:
+        value, length = key.split("/")
+        shift = width - int(length)
+        return (values >> shift) == (int(value, 0) >> shift)
+    return values == int(key, 0)
+
+
+class PipelineModel(object):
+    """
+    The feature tables and ipv4_exact as lookup arrays.
+    """
+
+    def __init__(self, entries):
+        self.conflicts = [] # (table, keys, action) of entries hidden by earlier overlapping ones
+        self.features = []
+        for table, width in zip(generate_rules.TABLES[:3], FEATURE_WIDTHS):
+            values = np.arange(1 << width)
+            lut = np.zeros(1 << width, dtype=np.int64) # 0: miss, action_select stays 0
+            for priority, keys, params in entries.get(table, []):
+                self.fill(table, lut, key_matches(keys[0], values, width), int(params.split()[0]), keys, params)
+            self.features.append(lut)
+
+        self.actions = [DROP]
+        forward = entries.get(generate_rules.TABLES[3], [])
+        # the action_select values the feature tables and non-TCP packets can produce, ipv4_exact is indexed by
+        # their rank so its size does not depend on how they are numbered
+        self.selects = [np.union1d(lut, [1]) for lut in self.features]
+        self.ranks = [np.searchsorted(selects, lut) for selects, lut in zip(self.selects, self.features)]
+        self.skipped = [int(np.searchsorted(selects, 1)) for selects in self.selects]
+        shape = tuple(len(selects) for selects in self.selects)
+        if np.prod(shape, dtype=np.float64) > MAX_FORWARD_CELLS:
+            raise ModelSizeError(f"ipv4_exact over {' x '.join(map(str, shape))} action_select values would be "
+                                 f"more than {MAX_FORWARD_CELLS} cells")
+        self.forward = np.zeros(shape, dtype=np.int64) # index in self.actions, 0: miss, dropped
+        for priority, keys, params in forward:
+            if params not in self.actions:
+                self.actions.append(params)
+            masks = [key_matches(key, selects, ACTION_SELECT_WIDTH) for key, selects in zip(keys, self.selects)]
+            self.fill(generate_rules.TABLES[3], self.forward, np.ix_(*masks), self.actions.index(params), keys, params)
+
+    def fill(self, table, array, where, value, keys, params):
+        current = array[where]
+        if (current[current != 0] != value).any():
+            self.conflicts.append((table, keys, params))
+        array[where] = np.where(current == 0, value, current)
+
+    def classify(self, proto, src_port, dst_port):
+        """
+        Classifies packets given as arrays of their fields.
+        :return: array of indices in self.actions
+        """
+        tcp = proto == IPV4_TCP
+        ranks = [self.ranks[0][proto],
+                 np.where(tcp, self.ranks[1][src_port], self.skipped[1]),
+                 np.where(tcp, self.ranks[2][dst_port], self.skipped[2])]
+        return self.forward[ranks[0], ranks[1], ranks[2]]
+
+    def boundaries(self):
+        """
+        The values of every feature where a feature table changes its result.
+        """
+        return [np.flatnonzero(np.diff(lut)) + 1 for lut in self.features]
+
+
+class TreeModel(object):
+    """
+    Direct evaluation of the leaves of a tree file.
+    """
+
+    def __init__(self, tree_file, fields=None):
+        tree = generate_rules.parse_tree(tree_file, fields)
+        self.leaves = []
+        for tests, intervals, class_ in tree.leaves:
+            self.leaves.append(([(feature, OPERATORS[operator], threshold) for feature, operator, threshold in tests],
+                                class_))
+
+    def outcome(self, class_):
+        """
+        The ipv4_forward parameters, or DROP, the rules should give a class.
+        """
+        host_port = generate_rules.action_to_host_port_map.get(generate_rules.class_to_action_map.get(class_))
+        if not host_port:
+            return DROP
+        return generate_rules.get_dst_host_ip_port_string(class_, generate_rules.class_to_action_map,
+                                                          generate_rules.action_to_host_port_map)
+
+    def classify(self, proto, src_port, dst_port):
+        """
+        :return: array of classes, -1 where no leaf matches
+        """
+        tcp = proto == IPV4_TCP
+        features = [proto, np.where(tcp, src_port, 0), np.where(tcp, dst_port, 0)]
+        classes = np.full(len(proto), -1)
+        for tests, class_ in self.leaves:
+            match = classes < 0
+            for feature, operator, threshold in tests:
+                match &= operator(features[feature], threshold)
+            classes[match] = class_
+        return classes
+
+    def boundaries(self):
+        """
+        The values of every feature where a test of the tree can change its outcome.
+        """
+        points = [set(), set(), set()]
+        for tests, class_ in self.leaves:
+            for feature, operator, threshold in tests:
+                points[feature].update([int(np.floor(threshold)), int(np.floor(threshold)) + 1, int(np.ceil(threshold))])
+        return [np.array(sorted(point), dtype=np.int64) for point in points]
+
+def entry_hits(commands, proto, src_port, dst_port, version=None):
+    """
+    The entry every packet hits in every table, which is what the direct counters of the switch count.
+    :param commands: table_add commands in the order they were added
+    :param version: the value of the rules_version register for rules of simple_switch.p4 compiled with -DVERSIONED
+    :return: dict table -> array of the index in commands of the entry hit by every packet, -1 on a miss or when
+    the packet skips the table
+    """
+    entries = {table: [] for table in generate_rules.TABLES}
+    for index, command in enumerate(commands):
+        words = command.split()
+        if words[1] not in entries:
+            continue
+        arrow = words.index("=>")
+        keys, params = words[3:arrow], words[arrow + 1:]
+        priority = int(params.pop()) if any("->" in key or "&&&" in key for key in keys) else 0
+        entries[words[1]].append((priority, index, keys, params))
+    # bmv2 matches the entry with the lowest priority value, ties go to the first added
+    for table_entries in entries.values():
+        table_entries.sort(key=lambda entry: entry[:2])
+
+    tcp = proto == IPV4_TCP
+    # the action_select value other protocols get for the ports, with the version as its top bit
+    skipped = 1 if version is None else version << (ACTION_SELECT_WIDTH - 1) | 1
+    hits, selects = {}, []
+    for table, values, width, applied in zip(generate_rules.TABLES, (proto, src_port, dst_port), FEATURE_WIDTHS,
+                                             (np.ones(len(proto), dtype=bool), tcp, tcp)):
+        hit = np.full(len(proto), -1)
+        select = np.where(applied, 0, skipped)
+        for priority, index, keys, params in entries[table]:
+            if keys[:-1] and version is not None and int(keys[0], 0) != version:
+                continue
+            match = applied & (hit < 0) & key_matches(keys[-1], values, width)
+            hit[match] = index
+            select[match] = int(params[0], 0)
+        hits[table] = hit
+        selects.append(select)
+    hit = np.full(len(proto), -1)
+    for priority, index, keys, params in entries[generate_rules.TABLES[3]]:
+        match = hit < 0
+        for key, select in zip(keys, selects):
+            match &= key_matches(key, select, ACTION_SELECT_WIDTH)
+        hit[match] = index
+    hits[generate_rules.TABLES[3]] = hit
+    return hits
+
+
+def expected_actions(tree, pipeline, classes):
+    """
+    Maps tree classes to indices in pipeline.actions, adding the outcomes no entry gives.
+    """
+    indices = np.full(len(classes), -1)
+    for class_ in np.unique(classes):
+        outcome = DROP if class_ < 0 else tree.outcome(int(class_))
+        if outcome not in pipeline.actions:
+            pipeline.actions.append(outcome)
+        indices[classes == class_] = pipeline.actions.index(outcome)
+    return indices
+
+
+def cells(*models):
+    """
+    Splits every feature into the intervals where none of the models (trees or tables) change.
+    :return: list per feature of the cell start values, the last cell ends at the largest value of the feature
+    """
+    starts = []
+    for feature, width in enumerate(FEATURE_WIDTHS):
+        points = np.concatenate([[0, IPV4_TCP, IPV4_TCP + 1] if width == 8 else [0]] +
+                                [model.boundaries()[feature] for model in models]).astype(np.int64)
+        starts.append(np.unique(points[(points >= 0) & (points < 1 << width)]))
+    return starts
+
+
+def cell_sizes(starts):
+    """
+    The number of packets of every cell of the grid, in the order of its raveled meshgrid.
+    """
+    ends = [np.append(start[1:] - 1, (1 << width) - 1) for start, width in zip(starts, FEATURE_WIDTHS)]
+    return np.multiply.outer(np.multiply.outer(ends[0] - starts[0] + 1, ends[1] - starts[1] + 1),
+                             ends[2] - starts[2] + 1).ravel()
+
+
+def verify_space(tree, pipeline):
+    """
+    Compares the tree and the rules on the whole (proto, src_port, dst_port) space, one packet per cell.
+    :return: (number of mismatching packets, list of mismatching regions as
+    ((proto low, high), (src low, high), (dst low, high), expected outcome, outcome of the rules))
+    """
+    starts = cells(tree, pipeline)
+    ends = [np.append(start[1:] - 1, (1 << width) - 1) for start, width in zip(starts, FEATURE_WIDTHS)]
+    grid = [axis.ravel() for axis in np.meshgrid(*starts, indexing='ij')]
+    expected = expected_actions(tree, pipeline, tree.classify(*grid))
+    actual = pipeline.classify(*grid)
+    mismatches = np.flatnonzero(expected != actual)
+    sizes = cell_sizes(starts)
+    regions = []
+    for cell in mismatches:
+        index = np.unravel_index(cell, [len(start) for start in starts])
+        regions.append(tuple((int(starts[f][i]), int(ends[f][i])) for f, i in enumerate(index)) +
+                       (pipeline.actions[expected[cell]], pipeline.actions[actual[cell]]))
+    return int(sizes[mismatches].sum()), regions
+
+
+def verify_samples(tree, pipeline, samples, seed=None):
+    """
+    Compares the tree and the rules on random packets, a third of them TCP.
+    :return: number of mismatching packets
+    """
+    rng = np.random.default_rng(seed)
+    proto = rng.integers(0, 256, samples)
+    proto[rng.random(samples) < 1 / 3.0] = IPV4_TCP
+    src_port, dst_port = rng.integers(0, 1 << 16, samples), rng.integers(0, 1 << 16, samples)
+    expected = expected_actions(tree, pipeline, tree.classify(proto, src_port, dst_port))
+    return int((expected != pipeline.classify(proto, src_port, dst_port)).sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify generated P4 rules against the decision tree")
+    parser.add_argument("--tree", default="tree-four.txt", help="decision tree file")
+    parser.add_argument("--fields", choices=sorted(SCHEMAS),
+                        help="feature names of the tree file, detected from the file by default")
+    parser.add_argument("--rules", default="rules-dt.sh", help="rules script or batch file of generate_rules.py")
+    parser.add_argument("--samples", type=int, default=0, help="also compare this many random packets")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-regions", type=int, default=20, help="mismatching regions to list")
+    args = parser.parse_args()
+
+    start = time.time()
+    tree = TreeModel(args.tree, SCHEMAS.get(args.fields))
+    try:
+        pipeline = PipelineModel(load_entries(args.rules))
+    except ModelSizeError as e:
+        raise SystemExit(f"Cannot verify {args.rules}: {e}")
+    for table, keys, params in pipeline.conflicts:
+        print(f"Overlapping entry of {table} partly hidden: {' '.join(keys)} => {params}")
+
+    mismatching, regions = verify_space(tree, pipeline)
+    for proto, src, dst, expected, actual in regions[:args.max_regions]:
+        print(f"proto {proto[0]}-{proto[1]}, src_port {src[0]}-{src[1]}, dst_port {dst[0]}-{dst[1]}: "
+              f"tree {expected}, rules {actual}")
+    if len(regions) > args.max_regions:
+        print(f"... {len(regions) - args.max_regions} more regions")
+    print(f"Whole space: {mismatching} of {256 * 65536 * 65536} packets mismatch, in {len(regions)} regions")
+    if args.samples:
+        sampled = verify_samples(tree, pipeline, args.samples, args.seed)
+        print(f"Samples: {sampled} of {args.samples} packets mismatch")
+    else:
+        sampled = 0
+    print(f"Verified in {time.time() - start:.2f} s")
+    if mismatching or sampled or pipeline.conflicts:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
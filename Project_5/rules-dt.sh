@@ -1,4 +1,4 @@
-simple_switch_CLI --thrift-port 9090 <<< "table_add MyIngress.feature1_exact MyIngress.set_actionselect1 0x0->0x20 => 1 1";
+simple_switch_CLI --thrift-port 9090 <<< "table_add MyIngress.feature1_exact MyIngress.set_actionselect1 0x0->0xFF => 1 1";
 
 simple_switch_CLI --thrift-port 9090 <<< "table_add MyIngress.feature2_exact MyIngress.set_actionselect2 0x0->0xBFB => 1 1";
 simple_switch_CLI --thrift-port 9090 <<< "table_add MyIngress.feature2_exact MyIngress.set_actionselect2 0xBFC->0x13B7 => 2 1";
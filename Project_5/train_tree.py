@@ -0,0 +1,359 @@
+"""
+Trains the decision tree of the switch on a packet trace and writes it as a tree file for generate_rules.py.
+
+The trace is a CSV file with a header, one packet per row: the IP protocol, the TCP source and destination port
+and the class of the packet. The columns are found by name, the schema names (ip_proto, src_port, dst_port or
+proto, src, dst) and the tshark field names work, so a pcap can be exported with
+    tshark -r trace.pcap -T fields -E header=y -E separator=, -e ip.proto -e tcp.srcport -e tcp.dstport
+and a class column added. Empty ports (non-TCP packets) read as 0, as do the ports of every non-TCP packet, since
+the switch only matches the ports of TCP packets.
+
+The trace is read in chunks and reduced to the class counts of every distinct (proto, src_port, dst_port), so
+its size only bounds the reading time. The tree is a CART tree grown best-first on the Gini impurity: the split
+of every node is searched over all its values at once with cumulative class counts, and the leaf with the
+largest impurity decrease is split next, until the depth, leaf or table budget is reached. The budget comes from
+the table sizes of the P4 program: a leaf is an ipv4_exact entry and every threshold of a feature adds an entry
+to its feature table.
+    python3 train_tree.py trace.csv -o tree-iot.txt --max-depth 10 --holdout 0.2
+"""
+
+import argparse
+import csv
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+import generate_rules
+import optimize_rules
+from tree_parser import MAX_VALUES, SCHEMAS
+
+IPV4_TCP = 6
+# column names of the features, besides the schema names
+COLUMNS = [["ip.proto", "protocol"], ["tcp.srcport"], ["tcp.dstport"]]
+LABELS = ["class", "label"]
+
+
+def find_columns(header, label=None):
+    """
+    The indices of the three feature columns and of the class column of a trace header.
+    """
+    names = [name.strip().lower() for name in header]
+    columns = []
+    for feature, aliases in enumerate(COLUMNS):
+        candidates = [schema[feature] for schema in SCHEMAS.values()] + aliases
+        found = [names.index(name) for name in candidates if name in names]
+        if not found:
+            raise ValueError(f"no column for feature {SCHEMAS['ip_proto'][feature]} in {', '.join(header)}")
+        columns.append(found[0])
+    for name in [label.lower()] if label else LABELS:
+        if name in names:
+            return columns, names.index(name)
+    raise ValueError(f"no class column {label or ' or '.join(LABELS)} in {', '.join(header)}")
+
+
+def read_trace(trace_file, chunk_size=1000000, label=None):
+    """
+    Reads a trace in chunks.
+    :return: generator of (features, labels): an (n, 3) int64 array and a list of the n class labels
+    """
+    with open(trace_file, 'r', newline='') as f:
+        reader = csv.reader(f)
+        columns, label_column = find_columns(next(reader), label)
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                return
+            features = np.zeros((len(rows), 3), dtype=np.int64)
+            for feature, column in enumerate(columns):
+                values = np.char.strip(np.array([row[column] for row in rows]))
+                features[:, feature] = np.where(values == "", "0", values).astype(np.float64)
+            # the switch does not look at the ports of other protocols
+            features[features[:, 0] != IPV4_TCP, 1:] = 0
+            yield features, [row[label_column].strip() for row in rows]
+
+
+class TraceCounts(object):
+    """
+    Class counts of every distinct (proto, src_port, dst_port) of a trace, merged chunk by chunk.
+    """
+
+    def __init__(self, classes):
+        self.classes = classes # label -> class index, shared between the training and holdout counts
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    def add(self, features, labels):
+        ids = np.array([self.classes.setdefault(label, len(self.classes)) for label in labels], dtype=np.int64)
+        keys = (features[:, 0] << 32) | (features[:, 1] << 16) | features[:, 2]
+        width = len(self.classes)
+        counts = np.zeros((len(self.keys), width), dtype=np.int64)
+        counts[:, :self.counts.shape[1]] = self.counts
+        keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        merged = np.zeros((len(keys), width), dtype=np.int64)
+        np.add.at(merged, inverse[:len(self.keys)], counts)
+        np.add.at(merged, (inverse[len(self.keys):], ids), 1)
+        self.keys, self.counts = keys, merged
+
+    def features(self):
+        return np.stack([self.keys >> 32, (self.keys >> 16) & 0xFFFF, self.keys & 0xFFFF], axis=1)
+
+    def renumber(self, numbers, width):
+        """
+        Moves the class counts from the order the labels were seen in to the class numbers of the tree.
+        :param numbers: dict label -> class number
+        """
+        counts = np.zeros((len(self.keys), width), dtype=np.int64)
+        for label, index in self.classes.items():
+            if index < self.counts.shape[1]:
+                counts[:, numbers[label]] = self.counts[:, index]
+        self.counts = counts
+
+
+def gini(counts):
+    """
+    Weighted Gini impurity n * (1 - sum p^2) of class count rows.
+    """
+    totals = counts.sum(axis=-1)
+    return totals - (counts.astype(np.float64) ** 2).sum(axis=-1) / np.maximum(totals, 1)
+
+
+def best_split(features, counts, min_samples_leaf=1, allowed=None):
+    """
+    Searches the split of a node with the largest impurity decrease.
+    :param features: (n, 3) distinct packets of the node
+    :param counts: (n, classes) their class counts
+    :param allowed: per feature, None or an array of the only thresholds it may use
+    :return: (decrease, feature, threshold) or None, the split being feature <= threshold
+    """
+    parent = gini(counts.sum(axis=0))
+    best = None
+    for feature in range(features.shape[1]):
+        order = np.argsort(features[:, feature], kind="stable")
+        values = features[order, feature]
+        left = np.cumsum(counts[order], axis=0)
+        # a split goes between two different values, after the last row of a value
+        ends = np.flatnonzero(values[:-1] != values[1:])
+        if allowed is not None and allowed[feature] is not None:
+            ends = ends[np.isin(values[ends], allowed[feature])]
+        if not len(ends):
+            continue
+        left = left[ends]
+        right = counts.sum(axis=0) - left
+        sizes = left.sum(axis=1), right.sum(axis=1)
+        valid = (sizes[0] >= min_samples_leaf) & (sizes[1] >= min_samples_leaf)
+        if not valid.any():
+            continue
+        decrease = np.where(valid, parent - gini(left) - gini(right), -np.inf)
+        i = int(np.argmax(decrease))
+        if best is None or decrease[i] > best[0]:
+            best = (float(decrease[i]), feature, int(values[ends[i]]))
+    if best is None or best[0] <= 1e-9:
+        return None
+    return best
+
+
+class Node(object):
+    """
+    A node of the tree, a leaf while split is None.
+    """
+
+    def __init__(self, rows, depth, counts):
+        self.rows = rows # indices of the distinct packets of the node
+        self.depth = depth
+        self.counts = counts # class counts of its packets
+        self.split = None # (feature, threshold), packets with feature <= threshold go left
+        self.children = None
+
+    def prediction(self):
+        return int(np.argmax(self.counts))
+
+
+def grow_tree(features, counts, max_depth=None, max_leaves=1024, max_thresholds=(1023, 1023, 1023),
+              min_samples_leaf=1):
+    """
+    Grows a CART tree best-first.
+    :param max_thresholds: per feature, the most distinct thresholds its table can hold
+    :return: (root Node, list of the sorted thresholds per feature)
+    """
+    root = Node(np.arange(len(features)), 0, counts.sum(axis=0))
+    thresholds = [set() for feature in range(features.shape[1])]
+    leaves = 1
+    heap = []
+    order = itertools.count() # breaks ties in the heap
+
+    def push(node):
+        if max_depth is not None and node.depth >= max_depth:
+            return
+        allowed = [np.array(sorted(used)) if len(used) >= limit else None
+                   for used, limit in zip(thresholds, max_thresholds)]
+        split = best_split(features[node.rows], counts[node.rows], min_samples_leaf, allowed)
+        if split:
+            heapq.heappush(heap, (-split[0], next(order), node, split[1:]))
+
+    push(root)
+    while heap and leaves < max_leaves:
+        decrease, _, node, (feature, threshold) = heapq.heappop(heap)
+        if threshold not in thresholds[feature] and len(thresholds[feature]) >= max_thresholds[feature]:
+            # the table of the feature filled up since the split was searched
+            push(node)
+            continue
+        thresholds[feature].add(threshold)
+        below = features[node.rows, feature] <= threshold
+        node.split = (feature, threshold)
+        node.children = []
+        for rows in (node.rows[below], node.rows[~below]):
+            child = Node(rows, node.depth + 1, counts[rows].sum(axis=0))
+            node.children.append(child)
+            push(child)
+        leaves += 1
+    return root, [sorted(used) for used in thresholds]
+
+
+def prune(node):
+    """
+    Turns the subtrees whose leaves all predict the same class into leaves.
+    :return: the class of the subtree, or None if it predicts several
+    """
+    if node.split is None:
+        return node.prediction()
+    predictions = [prune(child) for child in node.children]
+    if predictions[0] is not None and predictions[0] == predictions[1]:
+        node.split, node.children = None, None
+        return predictions[0]
+    return None
+
+
+def tree_leaves(node, tests=()):
+    """
+    The leaves of a tree as (list of (feature, operator, threshold), class), left to right.
+    """
+    if node.split is None:
+        return [(list(tests), node.prediction())]
+    feature, threshold = node.split
+    return tree_leaves(node.children[0], tests + ((feature, "<=", threshold),)) + \
+        tree_leaves(node.children[1], tests + ((feature, ">", threshold),))
+
+
+def used_thresholds(leaves, features=3):
+    thresholds = [set() for feature in range(features)]
+    for tests, class_ in leaves:
+        for feature, operator, threshold in tests:
+            thresholds[feature].add(threshold)
+    return [sorted(used) for used in thresholds]
+
+
+def write_tree(leaves, fields, tree_file):
+    """
+    Writes the leaves in the tree file format of generate_rules.py.
+    """
+    with open(tree_file, 'w') as f:
+        for field, thresholds in zip(fields, used_thresholds(leaves, len(fields))):
+            f.write(f"{field} = [{', '.join(str(threshold) for threshold in thresholds)}];\n")
+        for tests, class_ in leaves:
+            # a tree without splits still needs a test, one that every packet passes
+            condition = " and ".join(f"{fields[feature]}{operator}{threshold}" for feature, operator, threshold
+                                     in tests) or f"{fields[0]}<={MAX_VALUES[0]}"
+            f.write(f" when {condition}  then {class_};\n")
+
+
+def predict(root, features):
+    """
+    Classifies distinct packets with the tree, passing every node the packets that reach it.
+    :return: array of classes
+    """
+    classes = np.zeros(len(features), dtype=np.int64)
+    stack = [(root, np.arange(len(features)))]
+    while stack:
+        node, rows = stack.pop()
+        if node.split is None:
+            classes[rows] = node.prediction()
+            continue
+        feature, threshold = node.split
+        below = features[rows, feature] <= threshold
+        stack += [(node.children[0], rows[below]), (node.children[1], rows[~below])]
+    return classes
+
+
+def accuracy(root, counts):
+    """
+    The share of the packets of a renumbered TraceCounts the tree classifies right.
+    """
+    predicted = predict(root, counts.features())
+    return counts.counts[np.arange(len(predicted)), predicted].sum() / float(max(counts.counts.sum(), 1))
+
+
+def class_ids(classes):
+    """
+    Maps the labels to the class numbers of the tree file: integer labels keep their number, other labels are
+    numbered in sorted order.
+    :return: dict label -> class number
+    """
+    if all(label.isdigit() for label in classes):
+        return {label: int(label) for label in classes}
+    return {label: number for number, label in enumerate(sorted(classes))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the decision tree of the switch on a packet trace")
+    parser.add_argument("trace", help="CSV trace with proto, src_port, dst_port and class columns")
+    parser.add_argument("-o", "--output", default="tree-trained.txt", help="tree file to write")
+    parser.add_argument("--fields", choices=sorted(SCHEMAS), default="ip_proto",
+                        help="feature names of the tree file")
+    parser.add_argument("--label", help="name of the class column, class or label by default")
+    parser.add_argument("--max-depth", type=int, default=None)
+    parser.add_argument("--max-leaves", type=int, default=None,
+                        help="most leaves, the size of ipv4_exact in the P4 program by default")
+    parser.add_argument("--min-samples-leaf", type=int, default=1, help="fewest packets of a leaf")
+    parser.add_argument("--holdout", type=float, default=0.0, help="share of the packets kept out for testing")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=1000000, help="rows read at a time")
+    parser.add_argument("--p4", default="simple_switch.p4", help="P4 program with the table sizes")
+    args = parser.parse_args()
+
+    start = time.time()
+    rng = np.random.default_rng(args.seed)
+    labels = {}
+    train, test = TraceCounts(labels), TraceCounts(labels)
+    packets = 0
+    for features, chunk_labels in read_trace(args.trace, args.chunk_size, args.label):
+        held = rng.random(len(features)) < args.holdout
+        train.add(features[~held], [label for label, out in zip(chunk_labels, held) if not out])
+        if held.any():
+            test.add(features[held], [label for label, out in zip(chunk_labels, held) if out])
+        packets += len(features)
+    read_time = time.time() - start
+
+    if not labels:
+        raise SystemExit(f"{args.trace} has no packets")
+    numbers = class_ids(labels)
+    width = max(numbers.values()) + 1
+    train.renumber(numbers, width)
+    test.renumber(numbers, width)
+    if any(str(number) != label for label, number in numbers.items()):
+        print("Classes: " + ", ".join(f"{label} = {number}" for label, number in sorted(numbers.items(),
+                                                                                    key=lambda item: item[1])))
+
+    sizes = optimize_rules.table_sizes(args.p4)
+    table_sizes = [sizes.get(table.split('.')[-1], 1024) for table in generate_rules.TABLES]
+    max_leaves = args.max_leaves or table_sizes[3]
+    # a feature table holds one entry per interval, one more than its thresholds
+    root, thresholds = grow_tree(train.features(), train.counts, args.max_depth, max_leaves,
+                                 [size - 1 for size in table_sizes[:3]], args.min_samples_leaf)
+    prune(root)
+    leaves = tree_leaves(root)
+    write_tree(leaves, SCHEMAS[args.fields], args.output)
+
+    print(f"Read {packets} packets, {len(train.keys)} distinct, in {read_time:.2f} s")
+    print(f"Tree: {len(leaves)} leaves, depth {max(len(tests) for tests, class_ in leaves)}, thresholds "
+          + ", ".join(f"{field} {len(used)}" for field, used in zip(SCHEMAS[args.fields], used_thresholds(leaves))))
+    print(f"Training accuracy: {accuracy(root, train):.4f}")
+    if len(test.keys):
+        print(f"Holdout accuracy: {accuracy(root, test):.4f}")
+    print(f"Tree written to {args.output} in {time.time() - start:.2f} s, "
+          f"generate the rules with: python3 generate_rules.py --tree {args.output}")
+
+
+if __name__ == "__main__":
+    main()
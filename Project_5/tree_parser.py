@@ -0,0 +1,183 @@
+"""
+Streaming parser of decision-tree files.
+
+A tree file declares the thresholds of every feature and lists the leaves of the tree, one per when statement:
+    src_port = [3067, 5047, 38241];
+    when src_port<=38241 and src_port<=3067 and dst_port<=67 then 4;
+
+The file is read line by line and never evaluated, every leaf is turned into the interval of integer values of
+each feature that satisfies its tests as it is read, so files with tens of thousands of leaves parse in one pass.
+Thresholds may be floats: src<=23505.5 holds up to 23505 and src>23505.5 from 23506 on.
+
+The feature names follow a schema, ip_proto/src_port/dst_port or proto/src/dst (the lecture demo), given or
+detected from the first feature name of the file. Trees over other features give their names and largest values.
+"""
+
+import math
+import re
+
+# Feature names of the IP protocol, TCP source port and TCP destination port
+SCHEMAS = {
+    "ip_proto": ["ip_proto", "src_port", "dst_port"],
+    "proto": ["proto", "src", "dst"],
+}
+# Largest value of every feature: the 8-bit IP protocol, the 16-bit TCP ports
+MAX_VALUES = [0xFF, 0xFFFF, 0xFFFF]
+
+TOKEN = re.compile(r"\s*(?:(?P<number>[-+]?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)|(?P<name>[A-Za-z_]\w*)"
+                   r"|(?P<op><=|>=|==|!=|<|>|=)|(?P<punct>[\[\],;]))")
+
+
+class TreeParseError(Exception):
+    """
+    Raised when a tree file is malformed.
+    """
+    pass
+
+
+class Tree(object):
+    """
+    A parsed tree.
+    fields - the feature names
+    max_values - the largest value of every feature, MAX_VALUES for the three features of the schemas
+    thresholds - per feature, the declared thresholds
+    leaves - list of (tests, intervals, class): the (feature index, operator, threshold) tests of the leaf and the
+             (low, high) interval of values per feature that passes them, empty if low > high
+    """
+
+    def __init__(self, fields, max_values=None):
+        self.fields = fields
+        self.max_values = max_values or MAX_VALUES
+        self.thresholds = [[] for field in fields]
+        self.leaves = []
+
+    def split_points(self, feature):
+        """
+        The values v after which the feature tables start a new interval (v + 1 is in the next one): the declared
+        thresholds plus the interval ends of the leaves.
+        """
+        points = set(int(math.floor(threshold)) for threshold in self.thresholds[feature])
+        for tests, intervals, class_ in self.leaves:
+            low, high = intervals[feature]
+            if low <= high:
+                points.update([low - 1, high])
+        return sorted(point for point in points if 0 <= point < self.max_values[feature])
+
+
+def tokenize(line, number):
+    position = 0
+    tokens = []
+    for match in TOKEN.finditer(line):
+        if match.start() != position:
+            break
+        position = match.end()
+        tokens.append((match.lastgroup, match.group(match.lastgroup)))
+    if line[position:].strip():
+        raise TreeParseError(f"line {number}: unexpected {line[position:].strip()[:20]!r}")
+    return tokens
+
+
+def test_interval(operator, threshold, max_value):
+    """
+    The (low, high) integer values x for which "x operator threshold" holds.
+    """
+    if operator == "<=":
+        return 0, min(max_value, math.floor(threshold))
+    if operator == "<":
+        return 0, min(max_value, math.ceil(threshold) - 1)
+    if operator == ">=":
+        return max(0, math.ceil(threshold)), max_value
+    if operator == ">":
+        return max(0, math.floor(threshold) + 1), max_value
+    if threshold != int(threshold) or not 0 <= threshold <= max_value:
+        return 1, 0
+    return int(threshold), int(threshold)
+
+
+class TreeParser(object):
+    """
+    Parses the statements of a tree file line by line.
+    """
+
+    def __init__(self, fields=None, max_values=None):
+        self.tree = Tree(fields, max_values) if fields else None
+
+    def feature(self, name, number):
+        if self.tree is None:
+            for schema in SCHEMAS.values():
+                if name in schema:
+                    self.tree = Tree(schema)
+                    break
+            else:
+                raise TreeParseError(f"line {number}: {name} is no feature of the schemas {', '.join(SCHEMAS)}")
+        if name not in self.tree.fields:
+            raise TreeParseError(f"line {number}: unknown feature {name}, the features are "
+                                 f"{', '.join(self.tree.fields)}")
+        return self.tree.fields.index(name)
+
+    def parse_line(self, line, number):
+        line = line.split("#", 1)[0]
+        statement = []
+        for token in tokenize(line, number) + [("punct", ";")]:
+            if token == ("punct", ";"):
+                if statement:
+                    self.statement(statement, number)
+                statement = []
+            else:
+                statement.append(token)
+
+    def statement(self, tokens, number):
+        kinds = [kind for kind, value in tokens]
+        if tokens[0] == ("name", "when"):
+            self.leaf(tokens, number)
+        elif kinds[:3] == ["name", "op", "punct"] and tokens[1][1] == "=" and tokens[2][1] == "[" \
+                and tokens[-1] == ("punct", "]"):
+            feature = self.feature(tokens[0][1], number)
+            values = tokens[3:-1]
+            if any(kind != "number" for kind, value in values[::2]) or \
+                    any(token != ("punct", ",") for token in values[1::2]) or len(values) % 2 == 0 and values:
+                raise TreeParseError(f"line {number}: invalid threshold list of {tokens[0][1]}")
+            self.tree.thresholds[feature] = [float(value) for kind, value in values[::2]]
+        else:
+            raise TreeParseError(f"line {number}: expected a threshold list or a when statement")
+
+    def leaf(self, tokens, number):
+        # when TEST (and TEST)* then CLASS, a TEST being feature operator number
+        if len(tokens) < 6 or tokens[-2] != ("name", "then") or tokens[-1][0] != "number":
+            raise TreeParseError(f"line {number}: expected when ... then CLASS")
+        tests = []
+        body = tokens[1:-2]
+        for i in range(0, len(body), 4):
+            test = body[i:i + 3]
+            if [kind for kind, value in test] != ["name", "op", "number"] or \
+                    (i + 3 < len(body) and body[i + 3] != ("name", "and")):
+                raise TreeParseError(f"line {number}: expected feature operator threshold, joined by and")
+            if test[1][1] == "!=":
+                raise TreeParseError(f"line {number}: != does not give an interval")
+            tests.append((self.feature(test[0][1], number), test[1][1], float(test[2][1])))
+        if len(body) % 4 != 3:
+            raise TreeParseError(f"line {number}: dangling and")
+        intervals = [(0, max_value) for max_value in self.tree.max_values]
+        for feature, operator, threshold in tests:
+            low, high = test_interval(operator, threshold, self.tree.max_values[feature])
+            intervals[feature] = (max(intervals[feature][0], low), min(intervals[feature][1], high))
+        self.tree.leaves.append((tests, tuple(intervals), int(float(tokens[-1][1]))))
+
+
+def parse_tree_file(tree_file, fields=None, max_values=None):
+    """
+    Parses a tree file.
+    :param fields: feature names, detected from the file if None
+    :param max_values: largest value of every feature, MAX_VALUES by default
+    :return: Tree
+    """
+    parser = TreeParser(fields, max_values)
+    with open(tree_file, 'r') as f:
+        for number, line in enumerate(f, 1):
+            try:
+                parser.parse_line(line, number)
+            except TreeParseError as e:
+                raise TreeParseError(f"{tree_file}: {e}")
+    if parser.tree is None:
+        raise TreeParseError(f"{tree_file}: no features")
+    return parser.tree
@@ -0,0 +1,258 @@
+"""
+Incremental updates of the rules loaded in the switch, instead of clearing and reloading every table.
+
+generate_rules.py --mode load records the entries it loads and the handles the switch gave them in a state file.
+An update compares them with the newly generated rules and only sends the difference, in one of two ways:
+
+in place      entries with the same table, key and priority but other action parameters are changed with
+              table_modify, the others are added with table_add or removed with table_delete. Packets can meet a
+              mix of old and new entries while the update runs: every order of the operations is replayed on the
+              reference model of pipeline_model.py and the one with the shortest window of inconsistency, the
+              operations during which some packets get an action neither the old nor the new rules give, is used.
+              The intervals of the feature tables keep their action_select values where they can (see
+              generate_rules.select_numbers), so the leaves the new tree keeps keep their ipv4_exact entries. An
+              update longer than clearing and reloading the tables, or too large to replay, becomes that reload.
+versioned     for simple_switch.p4 compiled with -DVERSIONED: the new rules are added as the inactive version
+              next to the active ones, one register_write of the rules_version register makes every packet use
+              them, then the old version is deleted. No packet sees a mix, but every table needs room for both.
+
+    python3 generate_rules.py --tree tree-new.txt --mode diff -o update.txt
+    python3 generate_rules.py --tree tree-new.txt --mode update [--versioned]
+"""
+
+import json
+import re
+
+import numpy as np
+
+import generate_rules
+import pipeline_model
+
+HANDLE = re.compile(r"handle (\d+)")
+# operation orders tried for in-place updates: whether the tables go in reverse load order, then the operation
+# order within every table
+ORDERS = [(False, ["table_modify", "table_add", "table_delete"]),
+          (True, ["table_modify", "table_add", "table_delete"]),
+          (False, ["table_add", "table_modify", "table_delete"]),
+          (True, ["table_add", "table_modify", "table_delete"]),
+          (False, ["table_delete", "table_add", "table_modify"]),
+          (True, ["table_delete", "table_add", "table_modify"])]
+
+
+def entry_key(command):
+    """
+    What identifies the entry of a table_add command in the switch.
+    :return: ((table, match keys, priority), action, action parameters)
+    """
+    words = command.split()
+    arrow = words.index("=>")
+    keys = tuple(words[3:arrow])
+    params = words[arrow + 1:]
+    # range and ternary entries end with their priority, which table_modify cannot change
+    priority = params.pop() if any("->" in key or "&&&" in key for key in keys) else None
+    return (words[1], keys, priority), words[2], " ".join(params)
+
+
+def load_state(state_file):
+    """
+    :return: (rule version or None, list of (table_add command, handle) of the entries in the switch)
+    """
+    with open(state_file, 'r') as f:
+        state = json.load(f)
+    return state["version"], [(entry["command"], entry["handle"]) for entry in state["entries"]]
+
+
+def save_state(state_file, version, entries):
+    with open(state_file, 'w') as f:
+        json.dump({"version": version, "entries": [{"command": command, "handle": handle}
+                                                   for command, handle in entries]}, f, indent=1)
+
+
+def loaded_entries(commands, answers):
+    """
+    The (table_add command, handle) of every entry a CLI session added.
+    """
+    entries = []
+    for command, answer in zip(commands, answers):
+        handle = HANDLE.search(answer)
+        if command.startswith("table_add") and handle:
+            entries.append((command, int(handle.group(1))))
+    return entries
+
+
+def loaded_selects(commands, features):
+    """
+    The action_select value of every interval of the feature tables, from their range entries.
+    :param features: number of features
+    :return: list per feature of dict (low, high) -> action_select value
+    """
+    tables = generate_rules.tables(features)[:-1]
+    selects = [{} for table in tables]
+    for command in commands:
+        (table, keys, priority), action, params = entry_key(command)
+        if table in tables and len(keys) == 1 and "->" in keys[0]:
+            low, high = (int(value, 0) for value in keys[0].split("->"))
+            selects[tables.index(table)][(low, high)] = int(params.split()[0])
+    return selects
+
+
+def diff(old_entries, new_commands):
+    """
+    Compares the entries in the switch with new table_add commands.
+    :return: (modifications, additions, deletions): lists of (table, operation command, new table_add command or
+    None), the operation of an addition being the table_add command itself
+    """
+    old = {}
+    for command, handle in old_entries:
+        key, action, params = entry_key(command)
+        old[key] = (action, params, handle)
+    modifies, adds = [], []
+    for command in new_commands:
+        key, action, params = entry_key(command)
+        if key not in old:
+            adds.append((key[0], command, command))
+            continue
+        old_action, old_params, handle = old.pop(key)
+        if (old_action, old_params) != (action, params):
+            modifies.append((key[0], f"table_modify {key[0]} {action} {handle} {params}", command))
+    deletes = [(key[0], f"table_delete {key[0]} {handle}", None) for key, (action, params, handle) in old.items()]
+    return modifies, adds, deletes
+
+
+def ordered(operations, order, tables=None):
+    """
+    Sorts the operations of diff() into one of the ORDERS.
+    :param tables: the tables in load order, generate_rules.TABLES by default
+    :return: list of (table, operation command, new table_add command or None)
+    """
+    reverse, kinds = order
+    tables = tables or generate_rules.TABLES
+    tables = tables[::-1] if reverse else tables
+    return sorted(operations, key=lambda operation: (tables.index(operation[0]), kinds.index(operation[1].split()[0])))
+
+
+def apply_operation(entries, operation):
+    """
+    The table_add commands of the entries after an operation of diff(), entries being (command, handle) pairs.
+    """
+    table, command, new_command = operation
+    words = command.split()
+    if words[0] == "table_add":
+        return entries + [(new_command, None)]
+    handle = int(words[3] if words[0] == "table_modify" else words[2])
+    if words[0] == "table_delete":
+        return [entry for entry in entries if entry[1] != handle or entry[0].split()[1] != table]
+    # a modified entry keeps its place, and so its precedence among entries of the same priority
+    return [(new_command, handle) if entry[1] == handle and entry[0].split()[1] == table else entry
+            for entry in entries]
+
+
+def inconsistent_packets(old, new, state):
+    """
+    The packets the rules in state give an action that neither the old nor the new rules give.
+    """
+    starts = pipeline_model.cells(old, new, state)
+    grid = [axis.ravel() for axis in np.meshgrid(*starts, indexing='ij')]
+    outcomes = [np.array(model.actions, dtype=object)[model.classify(*grid)] for model in (old, new, state)]
+    return int(pipeline_model.cell_sizes(starts)[(outcomes[2] != outcomes[0]) & (outcomes[2] != outcomes[1])].sum())
+
+
+def replay(old_entries, new_commands, operations):
+    """
+    Replays the operations on the reference model.
+    :return: (window, worst): the operations from the first to the last state with inconsistent packets, and the
+    most inconsistent packets of a state
+    """
+    old = pipeline_model.PipelineModel(pipeline_model.parse_entries(command for command, handle in old_entries))
+    new = pipeline_model.PipelineModel(pipeline_model.parse_entries(new_commands))
+    entries = list(old_entries)
+    inconsistent = []
+    for operation in operations:
+        entries = apply_operation(entries, operation)
+        state = pipeline_model.PipelineModel(pipeline_model.parse_entries(command for command, handle in entries))
+        inconsistent.append(inconsistent_packets(old, new, state))
+    steps = [step for step, packets in enumerate(inconsistent) if packets]
+    return (steps[-1] - steps[0] + 1 if steps else 0), max(inconsistent + [0])
+
+
+def in_place_plan(old_entries, new_commands, tables=None, max_replayed=500):
+    """
+    The in-place update with the shortest window of inconsistency.
+    :param tables: the tables in load order, generate_rules.TABLES by default
+    :param max_replayed: largest update that is replayed, larger ones, and rules too large for the reference
+    model, use the first order unchecked
+    :return: (list of operation commands, list of the new table_add commands in the same order or None,
+    window or None if not replayed, most inconsistent packets or None)
+    """
+    operations = [operation for group in diff(old_entries, new_commands) for operation in group]
+    best = None
+    if len(operations) <= max_replayed:
+        try:
+            for order in ORDERS:
+                plan = ordered(operations, order, tables)
+                window, worst = replay(old_entries, new_commands, plan)
+                if best is None or (window, worst) < best[:2]:
+                    best = (window, worst, plan)
+                if not window:
+                    break
+        except pipeline_model.ModelSizeError:
+            best = None
+    window, worst, plan = best or (None, None, ordered(operations, ORDERS[0], tables))
+    return [command for table, command, new_command in plan], \
+        [new_command for table, command, new_command in plan], window, worst
+
+
+def reload_plan(new_commands, tables=None):
+    """
+    The update that clears every table and adds the new rules, for updates in place that would take more commands
+    or could not be replayed.
+    :param tables: the tables in load order, generate_rules.TABLES by default
+    :return: (list of operation commands, list of the new table_add commands in the same order or None)
+    """
+    clears = [f"table_clear {table}" for table in tables or generate_rules.TABLES]
+    return clears + new_commands, [None] * len(clears) + new_commands
+
+
+def versioned_plan(old_entries, new_commands, version):
+    """
+    The update to the rules of the given version: add them, switch the version, delete the old entries.
+    :return: (list of operation commands, list of the new table_add commands in the same order or None)
+    """
+    switch = f"register_write {generate_rules.VERSION_REGISTER} 0 {version}"
+    deletes = [f"table_delete {command.split()[1]} {handle}" for command, handle in old_entries]
+    return new_commands + [switch] + deletes, new_commands + [None] * (1 + len(deletes))
+
+
+def peak_entries(old_entries, commands, tables=None):
+    """
+    The most entries every table holds at once while the commands run.
+    """
+    entries = {table: 0 for table in tables or generate_rules.TABLES}
+    for command, handle in old_entries:
+        entries[command.split()[1]] += 1
+    peak = dict(entries)
+    for command in commands:
+        words = command.split()
+        if words[0] == "table_clear":
+            entries[words[1]] = 0
+        elif words[0] in ("table_add", "table_delete"):
+            entries[words[1]] += 1 if words[0] == "table_add" else -1
+            peak[words[1]] = max(peak[words[1]], entries[words[1]])
+    return peak
+
+
+def updated_entries(old_entries, commands, new_commands, answers):
+    """
+    The (table_add command, handle) of the entries in the switch after an update, from the answers of the CLI.
+    """
+    entries = list(old_entries)
+    for command, new_command, answer in zip(commands, new_commands, answers):
+        words = command.split()
+        if words[0] == "table_add":
+            handle = HANDLE.search(answer)
+            entries.append((new_command, int(handle.group(1)) if handle else None))
+        elif words[0] in ("table_modify", "table_delete"):
+            entries = apply_operation(entries, (words[1], command, new_command))
+        elif words[0] == "table_clear":
+            entries = [entry for entry in entries if entry[0].split()[1] != words[1]]
+    return entries
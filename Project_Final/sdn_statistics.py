@@ -4,39 +4,66 @@ the switch (e.g. flow duration, number of packets, etc.). Some statistics can be
 openflow or different tools (e.g. sflow). The idea here would be to implement a SDN
 environment (using any controller) where you show what statistics you can get with any tool
 (openflow, sflow or more).
+
+The statistics files of every run are written to a directory of their own, stats/run-<start time>/ by default
+(--stats_dir), so earlier runs are kept and startup does not depend on how many files they left.
+
+Besides the OpenFlow switches, the direct counters of the decision-tree rules of a P4 switch (Project_5) can be
+polled with the same timer: every entry becomes a flow, its match being the table, handle, keys and action of the
+entry, stored, diffed and written like the OpenFlow flow statistics, with the hottest entries in top_leaves.txt.
+The poll runs in a worker thread, so the CLI session does not hold up the POX event loop, and its counters are
+handled back in the loop. p4_counters is imported from Project_5, which must be on the PYTHONPATH:
+    PYTHONPATH=../Project_5 ./pox.py sdn_statistics --p4_state=../Project_5/rules-dt.state.json
 """
 
 
 from pox.core import core
 import pox.openflow.libopenflow_01 as of
 
-from pox.lib.revent import *
+from pox.lib.revent import EventMixin
 from pox.lib.util import dpid_to_str
 from pox.lib.util import dpidToStr
 from pox.lib.recoco import Timer
-from pox.openflow.of_json import *
+from pox.openflow.of_json import flow_stats_to_list
 import os
+import threading
 from datetime import datetime
 
 log = core.getLogger()
 
+# every run writes its statistics files to a directory of its own in here
+STATS_ROOT = "stats"
+# the P4 switch in self.stats
+P4_SWITCH = "p4"
+
 class StatsCollector(EventMixin):
     """
     Class that handles collecting flow and port statistics from switches and writing them to a file.
     """
 
-    def __init__(self, timer_interval=5):
+    def __init__(self, timer_interval=5, p4_state=None, p4_cli=None, stats_dir=STATS_ROOT):
+        """
+        p4_state - state file of the rules loaded in a P4 switch by generate_rules.py, whose counters are polled too
+        p4_cli - the CLI of that switch, simple_switch_CLI --thrift-port 9090 by default
+        stats_dir - directory the run directories of the statistics files are created in
+        """
         self.listenTo(core.openflow)
         self.stats = {} # store statistics per switch
         self.paths = {} # store paths per flow
-        # remove txt statistics files from previous runs
-        for file in os.listdir():
-            if file.startswith('flow_stats'):
-                os.remove(file)
-            if file.startswith('port_stats'):
-                os.remove(file)
-            if file.startswith('top_talkers'):
-                os.remove(file)
+        # the files of previous runs stay in their own directories, nothing is scanned or deleted on startup
+        self.run_dir = self.make_run_dir(stats_dir)
+        log.info("Writing statistics to %s", self.run_dir)
+
+        self.p4_counters = None
+        self.p4_poll = None # worker thread of the P4 poll in progress
+        if p4_state:
+            # the P4 tools need numpy, only import them when a P4 switch is polled
+            try:
+                import p4_counters
+            except ImportError as e:
+                raise ImportError("Polling a P4 switch needs Project_5 on the PYTHONPATH: %s" % e)
+            client = p4_counters.CounterClient(p4_cli) if p4_cli else p4_counters.CounterClient()
+            self.p4_counters = p4_counters.LeafCounters(client, p4_state)
 
         self.interval = timer_interval # timer interval in seconds
         Timer(self.interval, self._timer_func, recurring=True) # library timer function
@@ -56,6 +83,39 @@ class StatsCollector(EventMixin):
         for connection in core.openflow._connections.values(): # iterate over all connected switches
             self.request_stats(connection)
         log.debug("Sent %i flow/port stats request(s)", len(core.openflow._connections))
+        if self.p4_counters:
+            self.start_p4_poll()
+
+    def start_p4_poll(self):
+        """
+        Polls the counters of the P4 switch in a worker thread, unless the previous poll is still running
+        """
+        if self.p4_poll is not None and self.p4_poll.is_alive():
+            log.debug("Previous P4 poll still running, skipping this one")
+            return
+        self.p4_poll = threading.Thread(target=self.poll_p4, name="p4_poll")
+        self.p4_poll.daemon = True
+        self.p4_poll.start()
+
+    def poll_p4(self):
+        """
+        Reads the counters of the P4 switch in the worker thread and hands them to the event loop
+        """
+        try:
+            stats_data = self.p4_counters.poll()
+        except Exception as e:
+            log.error("Error polling the P4 counters: %s", e)
+            return
+        core.callLater(self.handle_p4_stats, stats_data)
+
+    def handle_p4_stats(self, stats_data):
+        """
+        Handles the counters of the P4 switch like flow stats
+        """
+        log.info("P4 counters of %i entries received", len(stats_data))
+        self.store_flow_stats(P4_SWITCH, stats_data)
+        self.write_stats_to_output(self.stats[P4_SWITCH], "leaf_stats_" + P4_SWITCH + ".txt", P4_SWITCH, stats_type='Leaf')
+        self.write_top_leaves_to_output(self.get_top_leaves(k=20, sort_by="bytes"), "top_leaves.txt", sort_by="bytes", k=20)
 
     def request_stats(self, connection):
         """
@@ -87,17 +147,8 @@ class StatsCollector(EventMixin):
         log.info("FlowStats received from %s", switch_identifier)
 
         stats_data = flow_stats_to_list(event.stats)
-        if event.connection.dpid in self.stats and 'flow_stats' in self.stats[event.connection.dpid]:
-            # calculate difference between old and new flow stats
-            old_nr_flows = len(self.stats[event.connection.dpid]['flow_stats'])
-            nr_added_flows, nr_removed_flows = self.calculate_diff(new_stats=stats_data, old_stats=self.stats[event.connection.dpid]['flow_stats'])
-            self.stats[event.connection.dpid]['other_stats'] = { 'nr_added_flows': nr_added_flows, 'nr_removed_flows': nr_removed_flows, 'old_nr_flows': old_nr_flows}
+        self.store_flow_stats(event.connection.dpid, stats_data)
 
-        if event.connection.dpid not in self.stats:
-            self.stats[event.connection.dpid] = {}
-        self.calculate_averages(stats_data)
-        self.stats[event.connection.dpid]['flow_stats'] = stats_data
-        
         # Use the updated stats
         filename = "flow_stats_" + dpid_to_str(event.connection.dpid) + ".txt"
         self.write_stats_to_output(self.stats[event.connection.dpid], filename, switch_identifier)
@@ -152,6 +203,37 @@ class StatsCollector(EventMixin):
 
     ### Helper functions ###
 
+    def make_run_dir(self, stats_dir):
+        """
+        Creates the directory of the statistics files of this run, named after its start time
+        """
+        name = "run-" + datetime.now().strftime('%Y%m%d-%H%M%S')
+        run_dir = os.path.join(stats_dir, name)
+        attempt = 1
+        while True:
+            try:
+                os.makedirs(run_dir)
+                return run_dir
+            except FileExistsError:
+                # restarted within the same second
+                attempt += 1
+                run_dir = os.path.join(stats_dir, name + "-" + str(attempt))
+
+    def store_flow_stats(self, switch, stats_data):
+        """
+        Stores the flow stats of a switch, with the difference to the previous ones
+        """
+        if switch in self.stats and 'flow_stats' in self.stats[switch]:
+            # calculate difference between old and new flow stats
+            old_nr_flows = len(self.stats[switch]['flow_stats'])
+            nr_added_flows, nr_removed_flows = self.calculate_diff(new_stats=stats_data, old_stats=self.stats[switch]['flow_stats'])
+            self.stats[switch]['other_stats'] = { 'nr_added_flows': nr_added_flows, 'nr_removed_flows': nr_removed_flows, 'old_nr_flows': old_nr_flows}
+
+        if switch not in self.stats:
+            self.stats[switch] = {}
+        self.calculate_averages(stats_data)
+        self.stats[switch]['flow_stats'] = stats_data
+
     def calculate_averages(self, stats):
         for flow in stats:
             # calculate average packet rate and average byte rate
@@ -171,12 +253,14 @@ class StatsCollector(EventMixin):
                 str_stream = self.build_flow_stats_string(data, switch_identifier)
                 log.info(str_stream)
                 return
-            with open(filename, 'a') as f:
+            with open(os.path.join(self.run_dir, filename), 'a') as f:
                 str_stream = ""
                 if stats_type == 'Flow':
                     str_stream = self.build_flow_stats_string(data, switch_identifier)
                 elif stats_type == 'Port':
                     str_stream = self.build_port_stats_string(data, switch_identifier)
+                elif stats_type == 'Leaf':
+                    str_stream = self.build_leaf_stats_string(data, switch_identifier)
                 else:
                     log.error("Invalid stats type")
                 f.write(str_stream)
@@ -304,6 +388,46 @@ class StatsCollector(EventMixin):
         except Exception as e:
             log.error("Error building port stats string: %s", e)
 
+    def build_leaf_stats_string(self, data, switch_identifier):
+        """
+        Convert the counter statistics of the P4 table entries to a string format
+        """
+        try:
+            eq_len = 150
+            str_stream = eq_len*'=' + "\n"
+            timestamp_now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            Leaf_Level_str = "Table Entry Statistics for P4 Switch " + switch_identifier + " at " + str(timestamp_now)
+            eq_len_leaf_level = eq_len - len(Leaf_Level_str)
+            str_stream += ('=' * (eq_len_leaf_level//2)) + Leaf_Level_str + ('=' * (eq_len_leaf_level//2 + eq_len_leaf_level%2)) + "\n"
+            str_stream += eq_len*'=' + "\n"
+            entries = data['flow_stats']
+            # the entries of ipv4_exact are the leaves of the decision tree
+            leaves = [entry for entry in entries if entry['match']['table'].endswith('ipv4_exact')]
+            str_stream += str(len(entries)) + " entries, " + str(len(leaves)) + " of them leaves\n\n"
+            entries.sort(key=lambda x: x["diff"]['average_byte_rate'] if "diff" in x else x['average_byte_rate'], reverse=True)
+            indentation = "\t"
+            for entry in entries:
+                matching = entry['match']
+                str_stream += indentation + matching['table'] + " entry " + str(matching['handle'])
+                if matching['keys']:
+                    str_stream += " matching " + matching['keys'] + " => " + matching['action']
+                str_stream += "\n"
+                duration = round(entry['duration_sec'] + entry['duration_nsec'] / 1e9, 3)
+                indentation += "\t"
+                str_stream += indentation + "Since loaded: " + str(entry['packet_count']) + " packets, " + str(entry['byte_count']) + " bytes in " + str(duration) + " seconds, averaging " + str(round(entry['average_packet_rate'], 3)) + " packets and " + str(round(entry['average_byte_rate'], 3)) + " bytes per second\n"
+                if "diff" in entry:
+                    diff = entry["diff"]
+                    str_stream += indentation + "Since last request: " + str(diff['packet_count']) + " packets, " + str(diff['byte_count']) + " bytes, averaging " + str(round(diff['average_packet_rate'], 3)) + " packets and " + str(round(diff['average_byte_rate'], 3)) + " bytes per second\n"
+                indentation = indentation[:-1]
+            dead = [entry['match'] for entry in entries if entry['packet_count'] == 0]
+            if dead:
+                str_stream += "\nEntries no packet has hit: " + ", ".join(matching['table'] + " " + str(matching['handle']) for matching in dead) + "\n"
+            str_stream += "\n"
+            return str_stream
+
+        except Exception as e:
+            log.error("Error building leaf stats string: %s", e)
+
     def calculate_diff(self, old_stats, new_stats):
         """
         Calculate the difference between two sets of flow statistics (old and new) and return the difference. Only if the flow is present in the new stats and old stats
@@ -458,12 +582,50 @@ class StatsCollector(EventMixin):
         """
         Write the top talkers to a file.
         """
-        with open(filename, 'w') as f:
+        with open(os.path.join(self.run_dir, filename), 'w') as f:
             f.write("Top %d Talkers (sorted by %s):\n" % (k, sort_by))
             for entry in top_talkers:
                 f.write("Source: %s, Destination: %s, Protocol: %s, Path: %s: Total Bytes: %d, Total Packets: %d\n" %
                         (entry['source'], entry['destination'], entry['protocol'], ' -> '.join(entry['path']), entry['bytes'], entry['packets']))
 
+    def get_top_leaves(self, k=20, sort_by="bytes"):
+        """
+        Returns the k leaves of the decision tree of the P4 switch with the highest rate of the specified metric
+        (either 'bytes' or 'packets') since the last request.
+        """
+        if sort_by not in ["bytes", "packets"]:
+            raise ValueError("sort_by must be either 'bytes' or 'packets'")
+        if P4_SWITCH not in self.stats:
+            return []
+
+        rate = 'average_byte_rate' if sort_by == "bytes" else 'average_packet_rate'
+        leaves = [entry for entry in self.stats[P4_SWITCH]['flow_stats'] if entry['match']['table'].endswith('ipv4_exact')]
+        leaves = sorted(leaves, key=lambda x: x["diff"][rate] if "diff" in x else x[rate], reverse=True)
+
+        result = []
+        for entry in leaves[:k]:
+            current = entry["diff"] if "diff" in entry else entry
+            result.append({
+                "handle": entry['match']['handle'],
+                "keys": entry['match']['keys'],
+                "action": entry['match']['action'],
+                "bytes": entry['byte_count'],
+                "packets": entry['packet_count'],
+                "byte_rate": current['average_byte_rate'],
+                "packet_rate": current['average_packet_rate'],
+            })
+        return result
+
+    def write_top_leaves_to_output(self, top_leaves, filename, sort_by="bytes", k=20):
+        """
+        Write the top leaves to a file.
+        """
+        with open(os.path.join(self.run_dir, filename), 'w') as f:
+            f.write("Top %d Leaves (sorted by %s per second):\n" % (k, sort_by))
+            for entry in top_leaves:
+                f.write("Entry %d: %s => %s: %.3f bytes/s, %.3f packets/s, Total Bytes: %d, Total Packets: %d\n" %
+                        (entry['handle'], entry['keys'], entry['action'], entry['byte_rate'], entry['packet_rate'], entry['bytes'], entry['packets']))
+
     def log_paths(self):
         """
         Logs all paths and their traffic statistics.
@@ -476,6 +638,6 @@ class StatsCollector(EventMixin):
             )
 
 
-def launch():
-    core.registerNew(StatsCollector)
+def launch(timer_interval=5, p4_state=None, p4_cli=None, stats_dir=STATS_ROOT):
+    core.registerNew(StatsCollector, float(timer_interval), p4_state, p4_cli, stats_dir)
 